@@ -0,0 +1,416 @@
+# =================================================================
+#   A.R.I.S.E. Admin API
+#   - Login, and full CRUD for semesters, teachers, students, courses
+#     and enrollments, plus the enrollment roster view.
+#   - Semesters, courses and students are soft-deleted: they disappear at
+#     once but can be restored for UNDO_WINDOW_SECONDS (see tombstones.py).
+# =================================================================
+
+import datetime
+import hashlib
+
+import jwt
+from flask import Blueprint, current_app, g, jsonify, request, url_for
+
+import storage
+import tombstones
+from auth import token_required
+from extensions import get_db_connection, get_read_connection, get_services
+
+bp = Blueprint('admin', __name__)
+
+@bp.after_request
+def _invalidate_replica_after_write(response):
+    # The admin expects to see a change in the very next list it loads.
+    if request.method != 'GET' and request.endpoint != 'admin.admin_login' and response.status_code < 400:
+        get_services().invalidate_replica()
+    return response
+
+@bp.route('/api/admin/login', methods=['POST'])
+def admin_login():
+    """Handles the administrator's login request."""
+    data = request.get_json()
+    if not data or not data.get('username') or not data.get('password'):
+        return jsonify({"message": "Username and password are required"}), 400
+
+    hashed_password = hashlib.sha256(data['password'].encode('utf-8')).hexdigest()
+    conn = get_db_connection()
+    admin = conn.execute("SELECT id FROM admins WHERE username = ? AND password = ?", 
+                           (data['username'], hashed_password)).fetchone()
+    conn.close()
+    
+    if admin:
+        # If login is successful, create a token that expires in 8 hours
+        claims = {
+            'admin_id': admin['id'], 
+            'exp': datetime.datetime.utcnow() + datetime.timedelta(hours=8)
+        }
+        if g.get('tenant'):
+            # Keeps the token from being used against another institution.
+            claims['tenant'] = g.tenant
+        token = jwt.encode(claims, current_app.config['SECRET_KEY'], algorithm="HS256")
+        return jsonify({'token': token})
+    
+    return jsonify({"message": "Invalid credentials"}), 401
+
+def _soft_delete(kind, id):
+    """Soft-deletes a row and tells the client how long it can be undone."""
+    conn = get_db_connection()
+    deleted_at = tombstones.soft_delete(conn, kind, id)
+    conn.commit()
+    conn.close()
+    if deleted_at is None:
+        return jsonify({"message": "Not found."}), 404
+    return jsonify({
+        "message": "Operation successful.",
+        "restore_url": url_for('.restore_deleted', kind=kind, id=id),
+        "restorable_until": storage.epoch_to_iso(deleted_at + current_app.config['UNDO_WINDOW_SECONDS']),
+    })
+
+def _duplicate(conn, kind, unique_values, message):
+    """
+    The 409 for a UNIQUE clash, after rolling back. Deleted rows keep their
+    unique values during the undo window, so if the clash is with one of
+    those the response points to restoring it instead.
+    """
+    conn.rollback()
+    where = ' OR '.join(f"{column} = ?" for column in unique_values)
+    deleted = conn.execute(f"SELECT id FROM {kind} WHERE ({where}) AND deleted_at IS NOT NULL",
+                           tuple(unique_values.values())).fetchone()
+    conn.close()
+    if deleted is None:
+        return jsonify({"status": "error", "message": message}), 409
+    return jsonify({"status": "error", "message": f"{message} It was deleted recently and can be restored instead.",
+                    "restore_url": url_for('.restore_deleted', kind=kind, id=deleted['id'])}), 409
+
+# --- Semester Management API (Full CRUD) ---
+@bp.route('/api/admin/semesters', methods=['GET', 'POST'])
+@token_required
+def manage_semesters(user_data):
+    conn = get_read_connection() if request.method == 'GET' else get_db_connection()
+    if request.method == 'GET':
+        semesters = conn.execute("SELECT * FROM semesters WHERE deleted_at IS NULL ORDER BY id DESC").fetchall()
+        conn.close()
+        return jsonify(semesters)
+    
+    if request.method == 'POST':
+        data = request.get_json()
+        try:
+            conn.execute("INSERT INTO semesters (semester_name) VALUES (?)", (data['semester_name'],))
+            conn.commit()
+        except storage.IntegrityError:
+            return _duplicate(conn, 'semesters', {'semester_name': data['semester_name']},
+                              "A semester with that name already exists.")
+        conn.close()
+        return jsonify({"status": "success", "message": "Semester added."}), 201
+
+@bp.route('/api/admin/semesters/<int:id>', methods=['PUT', 'DELETE'])
+@token_required
+def manage_single_semester(user_data, id):
+    if request.method == 'DELETE':
+        return _soft_delete('semesters', id)
+    conn = get_db_connection()
+    if request.method == 'PUT':
+        data = request.get_json()
+        try:
+            conn.execute("UPDATE semesters SET semester_name = ? WHERE id = ? AND deleted_at IS NULL", (data['semester_name'], id))
+            conn.commit()
+        except storage.IntegrityError:
+            return _duplicate(conn, 'semesters', {'semester_name': data['semester_name']},
+                              "A semester with that name already exists.")
+    conn.close()
+    return jsonify({"message": "Operation successful."})
+
+# --- Teacher Management API (Full CRUD) ---
+@bp.route('/api/admin/teachers', methods=['GET', 'POST'])
+@token_required
+def manage_teachers(user_data):
+    conn = get_read_connection() if request.method == 'GET' else get_db_connection()
+    if request.method == 'GET':
+        teachers = conn.execute("SELECT * FROM teachers ORDER BY teacher_name").fetchall()
+        conn.close()
+        return jsonify(teachers)
+    
+    if request.method == 'POST':
+        data = request.get_json()
+        conn.execute("INSERT INTO teachers (teacher_name, pin) VALUES (?, ?)", (data['teacher_name'], data['pin']))
+        conn.commit()
+        conn.close()
+        return jsonify({"status": "success", "message": "Teacher added."}), 201
+
+@bp.route('/api/admin/teachers/<int:id>', methods=['PUT', 'DELETE'])
+@token_required
+def manage_single_teacher(user_data, id):
+    conn = get_db_connection()
+    if request.method == 'PUT':
+        data = request.get_json()
+        if 'pin' in data and data['pin']: # Only update PIN if provided
+             conn.execute("UPDATE teachers SET teacher_name = ?, pin = ? WHERE id = ?", (data['teacher_name'], data['pin'], id))
+        else:
+             conn.execute("UPDATE teachers SET teacher_name = ? WHERE id = ?", (data['teacher_name'], id))
+        conn.commit()
+    elif request.method == 'DELETE':
+        conn.execute("DELETE FROM teachers WHERE id = ?", (id,))
+        conn.commit()
+    conn.close()
+    return jsonify({"message": "Operation successful."})
+
+# --- Student Management API (Full CRUD) ---
+@bp.route('/api/admin/students', methods=['GET', 'POST'])
+@token_required
+def manage_students(user_data):
+    conn = get_read_connection() if request.method == 'GET' else get_db_connection()
+    if request.method == 'GET':
+        students = conn.execute("SELECT * FROM students WHERE deleted_at IS NULL ORDER BY student_name").fetchall()
+        conn.close()
+        return jsonify(students)
+    
+    if request.method == 'POST':
+        data = request.get_json()
+        hashed_password = hashlib.sha256(data['password'].encode('utf-8')).hexdigest()
+        try:
+            conn.execute("INSERT INTO students (student_name, university_roll_no, enrollment_no, email1, email2, password) VALUES (?, ?, ?, ?, ?, ?)",
+                         (data['student_name'], data['university_roll_no'], data['enrollment_no'], data['email1'], data['email2'], hashed_password))
+            conn.commit()
+        except storage.IntegrityError:
+            return _duplicate(conn, 'students', {'university_roll_no': data['university_roll_no'],
+                                                 'enrollment_no': data['enrollment_no']},
+                              "Student with that University Roll No or Enrollment No already exists.")
+        conn.close()
+        return jsonify({"status": "success", "message": "Student added."}), 201
+
+@bp.route('/api/admin/students/<int:id>', methods=['PUT', 'DELETE'])
+@token_required
+def manage_single_student(user_data, id):
+    if request.method == 'DELETE':
+        return _soft_delete('students', id)
+    conn = get_db_connection()
+    if request.method == 'PUT':
+        data = request.get_json()
+        try:
+            # Check if a new password was provided
+            if 'password' in data and data['password']:
+                hashed_password = hashlib.sha256(data['password'].encode('utf-8')).hexdigest()
+                conn.execute("""UPDATE students SET student_name = ?, university_roll_no = ?, 
+                                enrollment_no = ?, email1 = ?, email2 = ?, password = ? WHERE id = ? AND deleted_at IS NULL""",
+                             (data['student_name'], data['university_roll_no'], data['enrollment_no'], data['email1'], data['email2'], hashed_password, id))
+            else: # Update without changing the password
+                conn.execute("""UPDATE students SET student_name = ?, university_roll_no = ?, 
+                                enrollment_no = ?, email1 = ?, email2 = ? WHERE id = ? AND deleted_at IS NULL""",
+                             (data['student_name'], data['university_roll_no'], data['enrollment_no'], data['email1'], data['email2'], id))
+            conn.commit()
+        except storage.IntegrityError:
+            return _duplicate(conn, 'students', {'university_roll_no': data['university_roll_no'],
+                                                 'enrollment_no': data['enrollment_no']},
+                              "Student with that University Roll No or Enrollment No already exists.")
+    conn.close()
+    return jsonify({"message": "Operation successful."})
+
+
+# --- Course Management API (Full CRUD) ---
+@bp.route('/api/admin/courses', methods=['GET', 'POST'])
+@token_required
+def manage_courses(user_data):
+    conn = get_read_connection() if request.method == 'GET' else get_db_connection()
+    if request.method == 'GET':
+        courses = conn.execute("SELECT * FROM courses WHERE deleted_at IS NULL ORDER BY course_name").fetchall()
+        conn.close()
+        return jsonify(courses)
+    
+    if request.method == 'POST':
+        data = request.get_json()
+        try:
+            conn.execute("""INSERT INTO courses (course_name, batchcode, default_duration_minutes, semester_id, teacher_id) 
+                            VALUES (?, ?, ?, ?, ?)""",
+                         (data['course_name'], data['batchcode'], data['default_duration_minutes'], data['semester_id'], data['teacher_id']))
+            conn.commit()
+        except storage.IntegrityError:
+            return _duplicate(conn, 'courses', {'batchcode': data['batchcode']},
+                              "A course with that batch code already exists.")
+        conn.close()
+        return jsonify({"status": "success", "message": "Course added."}), 201
+
+# This is a special "view" endpoint that joins tables to get human-readable names
+# for the main display table in the UI.
+@bp.route('/api/admin/courses-view', methods=['GET'])
+@token_required
+def get_courses_view(user_data):
+    conn = get_read_connection()
+    query = """
+        SELECT c.id, c.course_name, c.batchcode, s.semester_name, t.teacher_name 
+        FROM courses c
+        LEFT JOIN semesters s ON c.semester_id = s.id
+        LEFT JOIN teachers t ON c.teacher_id = t.id
+        WHERE c.deleted_at IS NULL
+        ORDER BY c.course_name
+    """
+    courses = conn.execute(query).fetchall()
+    conn.close()
+    return jsonify(courses)
+
+@bp.route('/api/admin/courses/<int:id>', methods=['GET', 'PUT', 'DELETE'])
+@token_required
+def manage_single_course(user_data, id):
+    if request.method == 'DELETE':
+        return _soft_delete('courses', id)
+    conn = get_read_connection() if request.method == 'GET' else get_db_connection()
+    if request.method == 'GET':
+        course = conn.execute("SELECT * FROM courses WHERE id = ? AND deleted_at IS NULL", (id,)).fetchone()
+        conn.close()
+        if course is None:
+            return jsonify({"message": "Course not found"}), 404
+        return jsonify(course)
+
+    if request.method == 'PUT':
+        data = request.get_json()
+        try:
+            conn.execute("""UPDATE courses SET course_name = ?, batchcode = ?, default_duration_minutes = ?, 
+                            semester_id = ?, teacher_id = ? WHERE id = ? AND deleted_at IS NULL""",
+                         (data['course_name'], data['batchcode'], data['default_duration_minutes'], data['semester_id'], data['teacher_id'], id))
+            conn.commit()
+        except storage.IntegrityError:
+            return _duplicate(conn, 'courses', {'batchcode': data['batchcode']},
+                              "A course with that batch code already exists.")
+    conn.close()
+    return jsonify({"message": "Operation successful."})
+
+# --- Course Enrollment API ---
+@bp.route('/api/admin/enrollments/<int:course_id>', methods=['GET', 'POST'])
+@token_required
+def manage_enrollments(user_data, course_id):
+    conn = get_read_connection() if request.method == 'GET' else get_db_connection()
+    if request.method == 'GET':
+        enrolled = conn.execute("""
+            SELECT s.id as student_id, s.student_name, s.university_roll_no, e.class_roll_id
+            FROM students s JOIN enrollments e ON s.id = e.student_id
+            WHERE e.course_id = ? AND s.deleted_at IS NULL """, (course_id,)).fetchall()
+        
+        available = conn.execute("""
+            SELECT id, student_name, university_roll_no FROM students
+            WHERE deleted_at IS NULL AND id NOT IN (SELECT student_id FROM enrollments WHERE course_id = ?)
+        """, (course_id,)).fetchall()
+        
+        conn.close()
+        return jsonify({"enrolled": enrolled, "available": available})
+
+    if request.method == 'POST':
+        enrollment_data = request.get_json()
+        conn.execute('BEGIN TRANSACTION')
+        try:
+            # Enrollments of deleted students are not shown, so they are kept for a possible restore.
+            conn.execute("""DELETE FROM enrollments WHERE course_id = ? AND student_id NOT IN
+                            (SELECT id FROM students WHERE deleted_at IS NOT NULL)""", (course_id,))
+            for student in enrollment_data:
+                conn.execute("INSERT INTO enrollments (student_id, course_id, class_roll_id) VALUES (?, ?, ?)",
+                             (student['student_id'], course_id, student['class_roll_id']))
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            conn.close()
+            return jsonify({"status": "error", "message": f"Database error: {e}"}), 500
+        conn.close()
+        return jsonify({"status": "success", "message": "Enrollments updated successfully."})
+
+# --- Enrollment Roster API (The Brilliant Feature) ---
+@bp.route('/api/admin/enrollment-roster/<int:semester_id>', methods=['GET'])
+@token_required
+def get_enrollment_roster(user_data, semester_id):
+    conn = get_read_connection()
+    # This is a complex query that aggregates data for the roster view.
+    # It finds all students enrolled in any course within the selected semester.
+    # GROUP_CONCAT is a powerful SQLite function that joins multiple course codes into a single string.
+    query = """
+        SELECT
+            s.student_name,
+            s.university_roll_no,
+            MIN(e.class_roll_id) as primary_class_roll_id,
+            GROUP_CONCAT(c.batchcode) as enrolled_courses
+        FROM students s
+        JOIN enrollments e ON s.id = e.student_id
+        JOIN courses c ON e.course_id = c.id
+        WHERE c.semester_id = ? AND c.deleted_at IS NULL AND s.deleted_at IS NULL
+        GROUP BY s.id, s.student_name, s.university_roll_no
+        ORDER BY primary_class_roll_id
+    """
+    roster = conn.execute(query, (semester_id,)).fetchall()
+    conn.close()
+    return jsonify(roster)
+
+# --- Deleted Items (Undo) API ---
+@bp.route('/api/admin/deleted', methods=['GET'])
+@token_required
+def list_deleted(user_data):
+    """Semesters, courses and students that were deleted recently enough to be restored."""
+    conn = get_db_connection()
+    items = tombstones.list_deleted(conn, current_app.config['UNDO_WINDOW_SECONDS'])
+    conn.close()
+    return jsonify(items)
+
+@bp.route('/api/admin/<any(semesters, courses, students):kind>/<int:id>/restore', methods=['POST'])
+@token_required
+def restore_deleted(user_data, kind, id):
+    conn = get_db_connection()
+    restored = tombstones.restore(conn, kind, id, current_app.config['UNDO_WINDOW_SECONDS'])
+    conn.commit()
+    conn.close()
+    if not restored:
+        return jsonify({"status": "error", "message": "Nothing to restore: the undo window has passed, "
+                        "or the course's semester is deleted."}), 409
+    return jsonify({"status": "success", "message": "Restored."})
+
+# --- Database Maintenance API ---
+@bp.route('/api/admin/maintenance', methods=['GET'])
+@token_required
+def get_maintenance_status(user_data):
+    """The database's size, free pages and latest backup, plus the recent maintenance runs."""
+    import maintenance
+
+    scheduler = get_services().maintenance
+    conn = get_db_connection()
+    runs = maintenance.recent_runs(conn)
+    conn.close()
+    status = scheduler.status() if scheduler else None
+    return jsonify({"enabled": scheduler is not None, "status": status, "runs": runs})
+
+@bp.route('/api/admin/maintenance/run', methods=['POST'])
+@token_required
+def run_maintenance(user_data):
+    """
+    Runs maintenance at the next quiet moment instead of in tonight's window.
+    Optional JSON body: {"tasks": ["backup", "optimize", "vacuum"]}.
+    """
+    import maintenance
+
+    scheduler = get_services().maintenance
+    if scheduler is None:
+        return jsonify({"status": "error", "message": "Maintenance is off or not available for this database."}), 503
+    tasks = (request.get_json(silent=True) or {}).get('tasks') or list(maintenance.TASKS)
+    if not isinstance(tasks, list) or not set(tasks) <= set(maintenance.TASKS):
+        return jsonify({"status": "error", "message": f"Tasks must be among {', '.join(maintenance.TASKS)}"}), 400
+    scheduler.run_now(tasks)
+    return jsonify({"status": "accepted", "tasks": tasks}), 202
+
+# --- Low-Attendance Notifications API ---
+@bp.route('/api/admin/notifications', methods=['GET'])
+@token_required
+def get_notifications_summary(user_data):
+    """This week's defaulter digests by status, and how many are waiting to be sent."""
+    import notifications
+
+    shard = get_services()
+    conn = get_db_connection()
+    summary = notifications.period_summary(conn)
+    conn.close()
+    summary['enabled'] = shard.notifier is not None
+    summary['threshold'] = current_app.config['DEFAULTER_THRESHOLD']
+    return jsonify(summary)
+
+@bp.route('/api/admin/notifications/run', methods=['POST'])
+@token_required
+def run_notifications(user_data):
+    """Queues this week's outstanding digests now instead of waiting for the next scheduled run."""
+    notifier = get_services().notifier
+    if notifier is None:
+        return jsonify({"status": "error", "message": "Email is not configured (set ARISE_SMTP_HOST)."}), 503
+    queued = notifier.run()
+    return jsonify({"status": "success", "queued": queued})
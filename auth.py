@@ -0,0 +1,36 @@
+# =================================================================
+#   A.R.I.S.E. Authentication Helpers
+#   - Checks the JSON Web Tokens used by the admin panel and the
+#     student portal.
+# =================================================================
+
+from functools import wraps
+
+import jwt
+from flask import current_app, jsonify, request
+
+
+# This is a "decorator" that we can add to our routes to protect them.
+# It checks for a valid JSON Web Token (JWT) in the request's Authorization header.
+def token_required(f):
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        token = None
+        if 'Authorization' in request.headers:
+            # The token is expected to be in the format "Bearer <token>"
+            token = request.headers['Authorization'].split(" ")[1]
+
+        if not token:
+            return jsonify({'message': 'Authorization Token is missing!'}), 401
+
+        try:
+            # Decode the token using our secret key to verify its authenticity
+            data = jwt.decode(token, current_app.config['SECRET_KEY'], algorithms=["HS256"])
+            # The decoded data (e.g., admin_id or student_id) is passed to the route
+        except jwt.ExpiredSignatureError:
+            return jsonify({'message': 'Token has expired!'}), 401
+        except jwt.InvalidTokenError:
+            return jsonify({'message': 'Token is invalid!'}), 401
+
+        return f(data, *args, **kwargs)
+    return decorated
@@ -0,0 +1,425 @@
+# =================================================================
+#   A.R.I.S.E. Benchmark - Class-Start Rush
+#   - Seeds a synthetic attendance database using the real schema from
+#     database_setup.py (students, courses, enrollments, session history).
+#   - Serves the Flask app on a local port and drives it concurrently with:
+#       * ESP32 scanners posting scans and polling for the active session,
+#       * teacher dashboards polling the live session status,
+#       * students logging in and opening their dashboards.
+#   - Reports throughput, p50/p99 latency and "database is locked" errors,
+#     and can compare the run against a saved baseline to catch regressions.
+#   - Measures worker startup time for the full app and a device-only worker.
+#
+#   Usage:
+#     python benchmark.py
+#     python benchmark.py --students 2000 --scanners 16 --duration 30
+#     python benchmark.py --save-baseline bench_baseline.json
+#     python benchmark.py --baseline bench_baseline.json   (exits 1 on regression)
+# =================================================================
+
+import argparse
+import contextlib
+import datetime
+import hashlib
+import io
+import json
+import logging
+import os
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import history
+from database_setup import setup_database
+
+STUDENT_PASSWORD = 'password'
+
+
+# =================================================================
+#   Synthetic Data
+# =================================================================
+
+def seed_database(db_path, args, rng):
+    """
+    Creates a fresh database at db_path and fills it with synthetic data.
+    Returns the details the simulated clients need (live course, roll IDs, logins).
+    """
+    # setup_database() is chatty; its progress output is not useful here.
+    with contextlib.redirect_stdout(io.StringIO()):
+        setup_database(db_path)
+
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA foreign_keys = ON")
+    hashed_password = hashlib.sha256(STUDENT_PASSWORD.encode('utf-8')).hexdigest()
+
+    conn.execute("INSERT INTO semesters (semester_name) VALUES ('Benchmark Semester')")
+    conn.executemany("INSERT INTO teachers (teacher_name, pin) VALUES (?, ?)",
+                     [(f"Teacher {i}", '1234') for i in range(args.courses)])
+    conn.executemany("""INSERT INTO students (university_roll_no, enrollment_no, student_name, password, email1)
+                        VALUES (?, ?, ?, ?, ?)""",
+                     [(f"U{i:06d}", f"E{i:06d}", f"Student {i}", hashed_password, f"student{i}@example.edu")
+                      for i in range(args.students)])
+    conn.executemany("""INSERT INTO courses (semester_id, teacher_id, course_name, batchcode, default_duration_minutes)
+                        VALUES (1, ?, ?, ?, 60)""",
+                     [(i + 1, f"Course {i}", f"BENCH{i:03d}") for i in range(args.courses)])
+
+    # Enroll every student in a few random courses; class roll IDs are sequential per course.
+    per_course = {course_id: [] for course_id in range(1, args.courses + 1)}
+    for student_id in range(1, args.students + 1):
+        for course_id in rng.sample(sorted(per_course), min(args.courses_per_student, args.courses)):
+            per_course[course_id].append(student_id)
+    enrollments = []
+    for course_id, student_ids in per_course.items():
+        for class_roll_id, student_id in enumerate(student_ids, start=1):
+            enrollments.append((student_id, course_id, class_roll_id))
+    conn.executemany("INSERT INTO enrollments (student_id, course_id, class_roll_id) VALUES (?, ?, ?)", enrollments)
+
+    # Historic (finished) sessions, one per day going back, with attendance at the given rate.
+    # Times are epoch seconds, as the server stores them.
+    now = int(time.time())
+    records = []
+    for course_id, student_ids in per_course.items():
+        for days_ago in range(args.history, 0, -1):
+            start_time = now - days_ago * 86400
+            cursor = conn.execute("""INSERT INTO sessions (course_id, start_time, end_time, is_active, session_type)
+                                     VALUES (?, ?, ?, 0, 'offline')""",
+                                  (course_id, start_time, start_time + 3600))
+            for student_id in student_ids:
+                if rng.random() < args.presence:
+                    records.append((cursor.lastrowid, student_id, start_time + 300))
+    conn.executemany("""INSERT INTO attendance_records (session_id, student_id, timestamp, override_method)
+                        VALUES (?, ?, ?, 'biometric')""", records)
+    # The rows above bypass the API, so number the sessions and index the history in one go.
+    history.rebuild(conn)
+    conn.commit()
+    conn.close()
+
+    # The live class is the largest course, which makes for the busiest rush.
+    live_course_id = max(per_course, key=lambda course_id: len(per_course[course_id]))
+    return {
+        "live_course_id": live_course_id,
+        "class_roll_ids": list(range(1, len(per_course[live_course_id]) + 1)),
+        "university_roll_nos": [f"U{i:06d}" for i in range(args.students)],
+        "attendance_rows": len(records),
+    }
+
+
+# =================================================================
+#   HTTP Client & Measurement
+# =================================================================
+
+class Recorder:
+    """Collects latencies and error counts for one workload."""
+
+    def __init__(self, name):
+        self.name = name
+        self.latencies = []
+        self.errors = 0
+        self.lock_errors = 0
+        self._lock = threading.Lock()
+
+    def record(self, elapsed, ok, locked=False):
+        with self._lock:
+            self.latencies.append(elapsed)
+            if not ok:
+                self.errors += 1
+            if locked:
+                self.lock_errors += 1
+
+    def summary(self, duration):
+        latencies = sorted(self.latencies)
+
+        def percentile(p):
+            if not latencies:
+                return 0.0
+            return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+
+        return {
+            "requests": len(latencies),
+            "throughput": len(latencies) / duration if duration else 0.0,
+            "p50_ms": percentile(0.50),
+            "p99_ms": percentile(0.99),
+            "errors": self.errors,
+            "lock_errors": self.lock_errors,
+        }
+
+
+class Client:
+    """A tiny JSON-over-HTTP client that reports every call to a Recorder."""
+
+    def __init__(self, base_url, recorder):
+        self.base_url = base_url
+        self.recorder = recorder
+
+    def call(self, method, path, body=None, token=None, expected=(200,)):
+        headers = {}
+        data = None
+        if body is not None:
+            data = json.dumps(body).encode('utf-8')
+            headers['Content-Type'] = 'application/json'
+        if token:
+            headers['Authorization'] = f'Bearer {token}'
+        req = urllib.request.Request(self.base_url + path, data=data, method=method, headers=headers)
+
+        started = time.perf_counter()
+        try:
+            with urllib.request.urlopen(req, timeout=30) as response:
+                status, payload = response.status, response.read()
+        except urllib.error.HTTPError as e:
+            status, payload = e.code, e.read()
+        except OSError:
+            self.recorder.record(time.perf_counter() - started, ok=False)
+            return None
+        elapsed = time.perf_counter() - started
+
+        locked = b'database is locked' in payload
+        self.recorder.record(elapsed, ok=status in expected, locked=locked)
+        try:
+            return json.loads(payload)
+        except ValueError:
+            return None
+
+
+# =================================================================
+#   Simulated Clients
+# =================================================================
+
+def run_scanner(client, status_client, seed, roll_ids, args, stop):
+    """An ESP32 scanner: mostly first scans, some repeats and strangers, plus status polls."""
+    rng = random.Random(seed)
+    queue = roll_ids[:]
+    rng.shuffle(queue)
+    scans = 0
+    while not stop.is_set():
+        roll = rng.random()
+        if queue and roll < 0.85:
+            class_roll_id = queue.pop()
+        elif roll < 0.95:
+            class_roll_id = rng.choice(roll_ids)         # duplicate scan
+        else:
+            class_roll_id = 100000 + rng.randrange(1000)  # not enrolled in this course
+        client.call('POST', '/api/mark-attendance-by-roll-id', {"class_roll_id": class_roll_id})
+        scans += 1
+        if scans % 10 == 0:
+            status_client.call('GET', '/api/session-status')
+        stop.wait(args.scan_interval)
+
+
+def run_dashboard(client, session_id, args, stop):
+    """A teacher's live dashboard polling session and device status."""
+    while not stop.is_set():
+        client.call('GET', f'/api/teacher/session/{session_id}/status')
+        client.call('GET', '/api/teacher/device-status')
+        stop.wait(args.poll_interval)
+
+
+def run_student(client, seed, roll_nos, args, stop):
+    """A student logging in, opening the dashboard and one course's details."""
+    rng = random.Random(seed)
+    while not stop.is_set():
+        login = client.call('POST', '/api/student/login',
+                            {"university_roll_no": rng.choice(roll_nos), "password": STUDENT_PASSWORD})
+        if login and login.get('token'):
+            dashboard = client.call('GET', '/api/student/dashboard', token=login['token'])
+            if dashboard and dashboard.get('courses'):
+                course = rng.choice(dashboard['courses'])
+                client.call('GET', f"/api/student/course/{course['course_id']}", token=login['token'])
+        stop.wait(args.student_interval)
+
+
+# =================================================================
+#   Benchmark Driver
+# =================================================================
+
+def start_server(db_path, work_dir, read_replica=False, scan_journal=False):
+    """Builds the app against the benchmark database and serves it on a free local port."""
+    from werkzeug.serving import make_server
+    import server
+
+    app = server.create_app({'DATABASE': db_path, 'EXPORT_DIR': os.path.join(work_dir, 'exports'),
+                             'READ_REPLICA': read_replica, 'REPLICA_DIR': os.path.join(work_dir, 'replica'),
+                             'SCAN_JOURNAL': scan_journal, 'JOURNAL_DIR': os.path.join(work_dir, 'journal')})
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+
+    # Surface lock errors in the response body so clients can count them.
+    @app.errorhandler(sqlite3.OperationalError)
+    def _database_error(e):
+        return {"status": "error", "message": str(e)}, 500
+
+    httpd = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return httpd, f'http://127.0.0.1:{httpd.server_port}'
+
+
+def run_benchmark(args):
+    rng = random.Random(args.seed)
+    work_dir = tempfile.mkdtemp(prefix='arise-bench-')
+    db_path = os.path.join(work_dir, 'attendance.db')
+    try:
+        started = time.perf_counter()
+        data = seed_database(db_path, args, rng)
+        print(f"Seeded {args.students} students, {args.courses} courses, {args.history} sessions/course, "
+              f"{data['attendance_rows']} attendance rows in {time.perf_counter() - started:.1f}s")
+
+        httpd, base_url = start_server(db_path, work_dir, read_replica=args.read_replica,
+                                       scan_journal=args.scan_journal)
+        recorders = {name: Recorder(name) for name in ('scan', 'device_poll', 'dashboard', 'student')}
+
+        # The teacher starts the live session, then the rush begins.
+        setup = Client(base_url, Recorder('setup'))
+        session = setup.call('POST', '/api/teacher/start-session', {
+            "course_id": data['live_course_id'],
+            "start_datetime": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "duration_minutes": 120,
+            "session_type": 'offline',
+        })
+
+        stop = threading.Event()
+        threads = []
+        for i in range(args.scanners):
+            threads.append(threading.Thread(target=run_scanner, args=(
+                Client(base_url, recorders['scan']), Client(base_url, recorders['device_poll']),
+                args.seed + i, data['class_roll_ids'], args, stop)))
+        for i in range(args.dashboards):
+            threads.append(threading.Thread(target=run_dashboard, args=(
+                Client(base_url, recorders['dashboard']), session['session_id'], args, stop)))
+        for i in range(args.student_clients):
+            threads.append(threading.Thread(target=run_student, args=(
+                Client(base_url, recorders['student']), args.seed + 1000 + i,
+                data['university_roll_nos'], args, stop)))
+
+        for thread in threads:
+            thread.start()
+        time.sleep(args.duration)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        httpd.shutdown()
+
+        return {name: recorder.summary(args.duration) for name, recorder in recorders.items()}
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+STARTUP_SCRIPT = """
+import sys, time
+started = time.perf_counter()
+import server
+server.create_app(roles=sys.argv[1])
+print(time.perf_counter() - started)
+"""
+
+
+def measure_startup(roles, runs):
+    """
+    Times importing the server and building an app in a fresh interpreter,
+    the way a new worker process starts. Returns the best of `runs`, in ms.
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    timings = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, '-c', STARTUP_SCRIPT, roles], cwd=here,
+                                capture_output=True, text=True, check=True).stdout
+        timings.append(float(output.strip()) * 1000)
+    return min(timings)
+
+
+def print_report(results):
+    print(f"\n{'workload':<12} {'requests':>9} {'req/s':>9} {'p50 ms':>9} {'p99 ms':>9} {'errors':>7} {'locked':>7}")
+    for name, r in results.items():
+        if name == 'startup':
+            continue
+        print(f"{name:<12} {r['requests']:>9} {r['throughput']:>9.1f} {r['p50_ms']:>9.2f} "
+              f"{r['p99_ms']:>9.2f} {r['errors']:>7} {r['lock_errors']:>7}")
+    if 'startup' in results:
+        print("\nworker startup (import + create_app, best of runs):")
+        for roles, ms in results['startup'].items():
+            print(f"  {roles:<10} {ms:>8.1f} ms")
+
+
+def check_against_baseline(results, baseline, tolerance):
+    """Returns a list of human-readable regressions in the scan path."""
+    regressions = []
+    scan, base = results['scan'], baseline.get('scan')
+    if not base:
+        return regressions
+    if scan['p99_ms'] > base['p99_ms'] * (1 + tolerance):
+        regressions.append(f"scan p99 {scan['p99_ms']:.2f} ms vs baseline {base['p99_ms']:.2f} ms")
+    if scan['throughput'] < base['throughput'] * (1 - tolerance):
+        regressions.append(f"scan throughput {scan['throughput']:.1f}/s vs baseline {base['throughput']:.1f}/s")
+    if scan['lock_errors'] > base['lock_errors']:
+        regressions.append(f"scan lock errors {scan['lock_errors']} vs baseline {base['lock_errors']}")
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="A.R.I.S.E. class-start rush benchmark")
+    data = parser.add_argument_group('synthetic data')
+    data.add_argument('--students', type=int, default=300)
+    data.add_argument('--courses', type=int, default=10)
+    data.add_argument('--courses-per-student', type=int, default=4)
+    data.add_argument('--history', type=int, default=40, help="past sessions per course")
+    data.add_argument('--presence', type=float, default=0.8, help="attendance rate in past sessions")
+    load = parser.add_argument_group('load')
+    load.add_argument('--scanners', type=int, default=8)
+    load.add_argument('--dashboards', type=int, default=4)
+    load.add_argument('--student-clients', type=int, default=8)
+    load.add_argument('--scan-interval', type=float, default=0.05, help="seconds between scans per scanner")
+    load.add_argument('--poll-interval', type=float, default=1.0, help="seconds between dashboard polls")
+    load.add_argument('--student-interval', type=float, default=0.5, help="seconds between student visits")
+    load.add_argument('--duration', type=float, default=15.0, help="seconds to run the rush")
+    load.add_argument('--seed', type=int, default=42)
+    load.add_argument('--read-replica', action='store_true',
+                      help="serve dashboards and reports from the snapshot read replica")
+    load.add_argument('--scan-journal', action='store_true',
+                      help="acknowledge scans from the fsync-batched scan journal")
+    output = parser.add_argument_group('output')
+    output.add_argument('--metrics', action='store_true', help="run the server with ARISE_METRICS=1")
+    output.add_argument('--startup-runs', type=int, default=3, help="worker startup samples per role set (0 to skip)")
+    output.add_argument('--json', help="write the results to this JSON file")
+    output.add_argument('--save-baseline', help="save the results as a baseline file")
+    output.add_argument('--baseline', help="compare the scan path against this baseline file")
+    output.add_argument('--tolerance', type=float, default=0.25, help="allowed regression vs baseline (0.25 = 25%%)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.metrics:
+        # Must be set before the server module is imported.
+        os.environ['ARISE_METRICS'] = '1'
+
+    results = run_benchmark(args)
+    if args.startup_runs:
+        results['startup'] = {
+            'all': measure_startup(','.join(('pages', 'admin', 'teacher', 'student', 'device')), args.startup_runs),
+            'device': measure_startup('device', args.startup_runs),
+        }
+    print_report(results)
+
+    for path in (args.json, args.save_baseline):
+        if path:
+            with open(path, 'w') as f:
+                json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = check_against_baseline(results, json.load(f), args.tolerance)
+        if regressions:
+            print("\nREGRESSION in the scan path:")
+            for regression in regressions:
+                print(f"  - {regression}")
+            return 1
+        print("\nScan path is within tolerance of the baseline.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,136 @@
+# =================================================================
+#   A.R.I.S.E. Device API
+#   - Endpoints used by the ESP32 Smart Scanner: session polling,
+#     attendance scans and heartbeats.
+#   - This is the latency-critical path; a device-only worker loads nothing else.
+# =================================================================
+
+from flask import Blueprint, g, jsonify, request
+
+import history
+import storage
+from extensions import get_db_connection, get_services
+from journal import JournalError
+
+bp = Blueprint('device', __name__)
+
+# This endpoint is polled by the ESP32 device to know if it should
+# be in 'ATTENDANCE_MODE' or 'AWAITING_SESSION' mode.
+@bp.route('/api/session-status', methods=['GET'])
+def get_session_status():
+    """Checks for an active session and returns its status and name."""
+    conn = get_db_connection()
+    # Find the most recent active session
+    session_data = conn.execute("""
+        SELECT s.id, c.batchcode 
+        FROM sessions s
+        JOIN courses c ON s.course_id = c.id
+        WHERE s.is_active = 1 AND c.deleted_at IS NULL
+        ORDER BY s.start_time DESC 
+        LIMIT 1
+    """).fetchone()
+    conn.close()
+
+    if session_data:
+        # If a session is active, send back its status and the batchcode for display
+        return jsonify({
+            "isSessionActive": True,
+            "sessionName": session_data['batchcode']
+        })
+    else:
+        # If no session is active, tell the device to remain idle
+        return jsonify({
+            "isSessionActive": False,
+            "sessionName": ""
+        })
+
+# This is the main endpoint for the Smart Scanner to record attendance.
+@bp.route('/api/mark-attendance-by-roll-id', methods=['POST'])
+def mark_attendance_by_roll_id():
+    """
+    Receives a confirmed Class Roll ID from the device and performs
+    the final, critical server-side validation before marking attendance.
+    """
+    data = request.get_json()
+    class_roll_id = data.get('class_roll_id')
+    
+    conn = get_db_connection()
+    # 1. Find the currently active session.
+    active_session = conn.execute("""
+        SELECT s.id, s.course_id FROM sessions s JOIN courses c ON s.course_id = c.id
+        WHERE s.is_active = 1 AND c.deleted_at IS NULL
+    """).fetchone()
+    
+    if not active_session:
+        conn.close()
+        return jsonify({"status": "error", "message": "No Active Session"}), 400
+
+    # 2. CRITICAL CHECK: Verify that the student with this Class Roll ID is
+    #    actually enrolled in the currently active course.
+    enrollment = conn.execute("""
+        SELECT e.student_id 
+        FROM enrollments e JOIN students s ON e.student_id = s.id
+        WHERE e.course_id = ? AND e.class_roll_id = ? AND s.deleted_at IS NULL
+    """, (active_session['course_id'], class_roll_id)).fetchone()
+    
+    if not enrollment:
+        conn.close()
+        # This is the specific error message for the "right student, wrong class" problem.
+        return jsonify({"status": "not_enrolled", "message": "Not Enrolled\nin Course"})
+
+    student_id = enrollment['student_id']
+
+    # 3. CRITICAL CHECK: Verify this is not a duplicate scan.
+    existing_record = conn.execute("""
+        SELECT id FROM attendance_records 
+        WHERE session_id = ? AND student_id = ?
+    """, (active_session['id'], student_id)).fetchone()
+
+    if existing_record:
+        conn.close()
+        return jsonify({"status": "duplicate", "message": "Already Marked"})
+    
+    # 4. If all checks pass, record the scan. With the scan journal on, the
+    #    scan is acknowledged once it is on disk and reaches the database shortly after.
+    journal = get_services().scan_journal
+    if journal is not None:
+        conn.close()
+        try:
+            if not journal.append(active_session['id'], student_id, storage.now_epoch()):
+                return jsonify({"status": "duplicate", "message": "Already Marked"})
+            return jsonify({"status": "success", "message": "Marked"})
+        except JournalError:
+            conn = get_db_connection()
+    conn.execute("INSERT INTO attendance_records (session_id, student_id, timestamp, override_method) VALUES (?, ?, ?, ?)",
+                 (active_session['id'], student_id, storage.now_epoch(), 'biometric'))
+    history.record_presence(conn, active_session['id'], student_id)
+    conn.commit()
+    conn.close()
+    
+    return jsonify({"status": "success", "message": "Marked"})
+
+
+# =================================================================
+#   DEVICE API ENDPOINTS (For Live Status)
+# =================================================================
+# The heartbeat lives in this worker's memory, so /api/teacher/device-status
+# is served from here too. When device and teacher workers are split, route
+# that URL to the device workers.
+
+# The last heartbeat of each tenant's scanner (the key is None in
+# single-tenant mode), so one college never sees another's device status.
+last_device_heartbeat = {}
+
+@bp.route('/api/device/heartbeat', methods=['POST'])
+def device_heartbeat():
+    """Receives a status update from the Smart Scanner device."""
+    data = request.get_json()
+    # In a multi-device system, you would use data['macAddress'] as a key
+    last_device_heartbeat[g.get('tenant')] = data 
+    # print("Received heartbeat:", data) # Uncomment for debugging
+    return jsonify({"status": "ok"})
+
+@bp.route('/api/teacher/device-status', methods=['GET'])
+def get_device_status():
+    """Provides the last known device status to the Teacher Dashboard."""
+    return jsonify(last_device_heartbeat.get(g.get('tenant'), {}))
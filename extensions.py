@@ -0,0 +1,362 @@
+# =================================================================
+#   A.R.I.S.E. Shared Services
+#   - The database pool and the background services (scan journal, job
+#     queue, session expiry scheduler, tombstone purger, notification
+#     mailer, database maintenance, read replica) that belong to one app
+#     instance.
+#   - With TENANTS_DIR set, every tenant gets its own Shard: its own
+#     database file, pool and background services. Otherwise there is one
+#     shard for DATABASE / DATABASE_URL.
+#   - Blueprints reach the current request's shard through
+#     get_db_connection() / get_services(), so nothing here depends on a
+#     global `app`. Read-only endpoints use get_read_connection(), which
+#     may hand out a replica connection.
+# =================================================================
+
+import os
+import sqlite3
+import threading
+import time
+
+from flask import current_app, g
+
+import signals
+import storage
+from database_setup import apply_migrations
+
+
+class Shard:
+    """
+    One database and the services working on it. `name` is the tenant, or
+    None in single-tenant mode.
+    """
+
+    def __init__(self, app, roles, name, database, database_url, pool_size, is_idle):
+        self.app = app
+        self.roles = roles
+        self.name = name
+        self.job_queue = None
+        self.expiry_scheduler = None
+        self.purger = None
+        self.replica = None
+        self.mail_queue = None
+        self.notifier = None
+        self.maintenance = None
+        self.scan_journal = None
+        self._database = database
+        self._database_url = database_url
+        self._pool_size = pool_size
+        self._is_idle = is_idle
+        self._backend = None
+        self._lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._started = False
+
+    @property
+    def backend(self):
+        """The storage backend, created on first use."""
+        if self._backend is None:
+            with self._lock:
+                if self._backend is None:
+                    self._backend = storage.create_backend(self._database, self._database_url,
+                                                           pool_size=self._pool_size,
+                                                           sqlite_factory=self._sqlite_factory(),
+                                                           instrument_postgres_cursor=self._postgres_instrumentation())
+        return self._backend
+
+    def _sqlite_factory(self):
+        if self.app.config['METRICS_ENABLED']:
+            # The instrumented connection class times every SQLite query.
+            import metrics
+            return metrics.InstrumentedConnection
+        return sqlite3.Connection
+
+    def _postgres_instrumentation(self):
+        if self.app.config['METRICS_ENABLED']:
+            import metrics
+            return metrics.instrumented_postgres_cursor
+        return None
+
+    def _subdir(self, directory):
+        # Tenants keep their exports and snapshots apart.
+        return directory if self.name is None else os.path.join(directory, self.name)
+
+    def connect(self):
+        """Takes a connection from the database pool. conn.close() gives it back."""
+        return self.backend.connect()
+
+    def connect_read(self):
+        """
+        A connection for read-only work: from the read replica if it is on and
+        its snapshot is fresh enough, otherwise from the primary pool.
+        """
+        if self.replica is not None:
+            conn = self.replica.connect()
+            if conn is not None:
+                return conn
+        return self.connect()
+
+    def invalidate_replica(self, *args, **kwargs):
+        """Makes readers use the primary until the replica has caught up with a write."""
+        if self.replica is not None:
+            self.replica.invalidate()
+
+    def _on_session_change(self, sender, tenant=None, **kwargs):
+        if tenant == self.name:
+            self.invalidate_replica()
+
+    def start(self):
+        """
+        Applies pending schema migrations and starts the background workers
+        this instance's roles need. Safe to call more than once: concurrent
+        callers wait until startup has finished, and if it fails the next
+        call picks up with the services not yet running.
+        """
+        if self._started:
+            return
+        with self._start_lock:
+            if self._started:
+                return
+            conn = self.connect()
+            try:
+                apply_migrations(conn)
+            finally:
+                conn.close()
+
+            # Scans journaled before a crash or restart are in the database before any new request.
+            if 'device' in self.roles and self.app.config['SCAN_JOURNAL'] and self.scan_journal is None:
+                self._start_scan_journal()
+            # Exports and session scheduling belong to the teacher API; a
+            # device-only worker starts neither.
+            if 'teacher' in self.roles:
+                if self.job_queue is None:
+                    self._start_job_queue()
+                if self.expiry_scheduler is None:
+                    self._start_expiry_scheduler()
+            # Deletes come from the admin API, so its instance cleans up after them.
+            if 'admin' in self.roles:
+                if self.purger is None:
+                    self._start_purger()
+                if self.app.config['SMTP_HOST'] and self.notifier is None:
+                    self._start_notifications()
+                if self.app.config['MAINTENANCE_ENABLED'] and self.maintenance is None:
+                    self._start_maintenance()
+            if (self.app.config['READ_REPLICA'] and {'admin', 'teacher', 'student'} & set(self.roles)
+                    and self.replica is None):
+                self._start_replica()
+            self._started = True
+
+    def _start_scan_journal(self):
+        from journal import ScanJournal
+
+        scan_journal = ScanJournal(self._subdir(self.app.config['JOURNAL_DIR']), self.connect)
+        # Until start() has succeeded, scans go straight to the database.
+        scan_journal.start()
+        self.scan_journal = scan_journal
+
+    def _start_job_queue(self):
+        import reports
+        from jobs import JobQueue
+
+        config = self.app.config
+        job_queue = JobQueue(self.connect, self._subdir(config['EXPORT_DIR']),
+                             max_workers=config['JOB_WORKERS'],
+                             max_pending=config['JOB_MAX_PENDING'])
+        job_queue.register('session_report_xlsx', reports.export_session_report_job,
+                           cache_key=reports.session_report_cache_key)
+        job_queue.start()
+        self.job_queue = job_queue
+
+    def _start_expiry_scheduler(self):
+        from scheduler import SessionExpiryScheduler
+
+        # Closes sessions at their end_time; anything already overdue is closed right away.
+        expiry_scheduler = SessionExpiryScheduler(
+            self.connect,
+            on_expire=lambda session_id: signals.session_ended.send(
+                self.app, session_id=session_id, reason='expired', tenant=self.name))
+        expiry_scheduler.start()
+        self.expiry_scheduler = expiry_scheduler
+
+    def _start_purger(self):
+        from tombstones import TombstonePurger
+
+        config = self.app.config
+        purger = TombstonePurger(self.connect, config['UNDO_WINDOW_SECONDS'],
+                                 batch_size=config['PURGE_BATCH_SIZE'],
+                                 interval=config['PURGE_INTERVAL_SECONDS'],
+                                 is_idle=self._is_idle)
+        purger.start()
+        self.purger = purger
+
+    def _start_notifications(self):
+        from mailer import MailQueue, SMTPSettings
+        from notifications import DefaulterNotifier
+
+        config = self.app.config
+        settings = SMTPSettings(config['SMTP_HOST'], config['SMTP_PORT'],
+                                username=config['SMTP_USERNAME'], password=config['SMTP_PASSWORD'],
+                                use_tls=config['SMTP_USE_TLS'], sender=config['MAIL_FROM'])
+        if self.mail_queue is None:
+            mail_queue = MailQueue(self.connect, settings,
+                                   rate_per_minute=config['MAIL_RATE_PER_MINUTE'],
+                                   max_attempts=config['MAIL_MAX_ATTEMPTS'],
+                                   claim_lease=config['MAIL_CLAIM_LEASE_SECONDS'])
+            mail_queue.start()
+            self.mail_queue = mail_queue
+        notifier = DefaulterNotifier(self.connect, self.mail_queue,
+                                     threshold=config['DEFAULTER_THRESHOLD'],
+                                     interval=config['NOTIFY_INTERVAL_SECONDS'])
+        notifier.start()
+        self.notifier = notifier
+
+    def _start_maintenance(self):
+        from maintenance import Maintenance, MaintenanceScheduler
+
+        if not isinstance(self.backend, storage.SQLiteBackend):
+            # PostgreSQL has autovacuum and its own backup tooling (pg_dump, base backups).
+            return
+        config = self.app.config
+        tasks = Maintenance(self.backend.path, self._subdir(config['BACKUP_DIR']),
+                            keep_backups=config['BACKUP_KEEP'],
+                            step_pages=config['MAINTENANCE_STEP_PAGES'],
+                            time_budget=config['VACUUM_TIME_BUDGET_SECONDS'],
+                            backup_time_budget=config['BACKUP_TIME_BUDGET_SECONDS'],
+                            is_idle=self._is_idle)
+        maintenance = MaintenanceScheduler(tasks, self.connect,
+                                           window_start=config['MAINTENANCE_HOUR'],
+                                           window_hours=config['MAINTENANCE_WINDOW_HOURS'],
+                                           is_idle=self._is_idle)
+        maintenance.start()
+        self.maintenance = maintenance
+
+    def _start_replica(self):
+        from replica import SnapshotReplica
+
+        if not isinstance(self.backend, storage.SQLiteBackend):
+            print("READ_REPLICA only applies to the SQLite backend; use a PostgreSQL replica instead.")
+            return
+        config = self.app.config
+        replica = SnapshotReplica(self.backend.path, self._subdir(config['REPLICA_DIR']),
+                                  max_staleness=config['REPLICA_MAX_STALENESS'],
+                                  pool_size=self._pool_size,
+                                  factory=self._sqlite_factory())
+        replica.start()
+        self.replica = replica
+        # A report opened right after a session starts or ends must include it.
+        for signal in (signals.session_started, signals.session_extended, signals.session_ended):
+            signal.connect(self._on_session_change, sender=self.app, weak=False)
+
+
+class AriseServices:
+    """
+    Everything an app instance shares between requests: its shards and the
+    tenant routing. Created by the app factory and stored in
+    app.extensions['arise'].
+    """
+
+    def __init__(self, app, roles):
+        self.app = app
+        self.roles = roles
+        self.registry = None
+        if app.config['TENANTS_DIR']:
+            from tenants import TenantRegistry
+            self.registry = TenantRegistry(app.config['TENANTS_DIR'])
+        self._shards = {}
+        self._device_tenants = {}
+        self._devices_loaded_at = float('-inf')
+        self._last_request_at = 0.0
+        self._lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._started = False
+
+    @property
+    def multi_tenant(self):
+        return self.registry is not None
+
+    def shard(self, name=None):
+        """The (started) shard of tenant `name`; None in single-tenant mode."""
+        shard = self._shards.get(name)
+        if shard is None:
+            with self._lock:
+                shard = self._shards.get(name)
+                if shard is None:
+                    shard = self._shards[name] = self._create_shard(name)
+        shard.start()
+        return shard
+
+    def _create_shard(self, name):
+        config = self.app.config
+        if name is None:
+            return Shard(self.app, self.roles, None, config['DATABASE'], config['DATABASE_URL'],
+                         config['DB_POOL_SIZE'], self.is_idle)
+        # Tenants are always SQLite files; each pool only serves its own tenant.
+        return Shard(self.app, self.roles, name, self.registry.path_for(name), None,
+                     config['SHARD_POOL_SIZE'], self.is_idle)
+
+    def resolve_tenant(self, request):
+        """
+        The tenant a request belongs to (None in single-tenant mode).
+        Raises tenants.TenantError if it cannot be routed.
+        """
+        if not self.multi_tenant:
+            return None
+        from tenants import resolve_tenant
+        return resolve_tenant(request, self.app.config, self.registry, self._tenant_for_device)
+
+    def _tenant_for_device(self, device_id):
+        tenant = self._device_tenants.get(device_id)
+        # A scanner may have been assigned since the registry was last read.
+        if tenant is None and time.monotonic() - self._devices_loaded_at >= 5:
+            self._load_device_tenants()
+            tenant = self._device_tenants.get(device_id)
+        return tenant
+
+    def _load_device_tenants(self):
+        self._device_tenants = self.registry.devices()
+        self._devices_loaded_at = time.monotonic()
+
+    def note_request(self):
+        self._last_request_at = time.monotonic()
+
+    def is_idle(self, quiet_seconds=1.0):
+        """True if this instance has not started a request for `quiet_seconds`."""
+        return time.monotonic() - self._last_request_at >= quiet_seconds
+
+    def start(self):
+        """
+        Starts the shards known at startup, so expiring sessions and purges
+        run for every tenant, not just those that have had a request. Tenants
+        created later start with their first request. Safe to call more than once.
+        """
+        if self._started:
+            return
+        with self._start_lock:
+            if self._started:
+                return
+            if self.multi_tenant:
+                self._load_device_tenants()
+                for name in self.registry.names():
+                    self.shard(name)
+            else:
+                self.shard()
+            self._started = True
+
+
+def get_services():
+    """Returns the shard serving the current request."""
+    return current_app.extensions['arise'].shard(g.get('tenant'))
+
+
+def get_db_connection():
+    """Takes a connection from the current request's database pool."""
+    return get_services().connect()
+
+
+def get_read_connection():
+    """
+    Takes a connection for a read-only endpoint. With READ_REPLICA on this
+    may be a snapshot up to REPLICA_MAX_STALENESS seconds old; never use it
+    for anything that writes.
+    """
+    return get_services().connect_read()
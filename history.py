@@ -0,0 +1,79 @@
+# =================================================================
+#   A.R.I.S.E. Attendance History Index
+#   - A compact per-student record of attendance: for every course, one
+#     bit per session, in the order the sessions were held. Bit n is set
+#     when the student was present at the course's session number n
+#     (sessions.course_seq).
+#   - Stored in 'attendance_history' as 63-bit chunks, one row per
+#     (student, course, chunk), so a long course never outgrows a BIGINT.
+#     Setting a bit is a single OR upsert, safe under concurrent writers.
+#   - Kept up to date wherever an attendance record is written; rebuild()
+#     recreates it from attendance_records (migration, benchmark seeding).
+#   - A student's whole history is one primary-key range lookup.
+# =================================================================
+
+CHUNK_BITS = 63
+
+# Session number n of a course lives in chunk n // CHUNK_BITS, bit n % CHUNK_BITS.
+_CHUNK_SQL = f"se.course_seq / {CHUNK_BITS}"
+_BIT_SQL = f"CAST(1 AS BIGINT) << (se.course_seq % {CHUNK_BITS})"
+
+
+def record_presence(conn, session_id, student_id):
+    """Marks the student present at the session in the index. The caller commits."""
+    # The WHERE clause is required by SQLite for an upsert fed by a SELECT.
+    conn.execute(f"""
+        INSERT INTO attendance_history (student_id, course_id, chunk, bits)
+        SELECT ?, se.course_id, {_CHUNK_SQL}, {_BIT_SQL}
+        FROM sessions se WHERE se.id = ? AND se.course_seq IS NOT NULL
+        ON CONFLICT (student_id, course_id, chunk) DO UPDATE SET bits = attendance_history.bits | excluded.bits
+    """, (student_id, session_id))
+
+
+def rebuild(conn):
+    """
+    Numbers every course's sessions in the order they were created and
+    recreates the whole index from attendance_records. The caller commits.
+    """
+    conn.execute("""
+        UPDATE sessions SET course_seq = (
+            SELECT COUNT(*) FROM sessions earlier
+            WHERE earlier.course_id = sessions.course_id AND earlier.id < sessions.id)
+    """)
+    conn.execute("DELETE FROM attendance_history")
+    # Each session contributes a distinct power of two, so the SUM of the
+    # distinct bits is their OR, even with duplicate attendance records.
+    conn.execute(f"""
+        INSERT INTO attendance_history (student_id, course_id, chunk, bits)
+        SELECT ar.student_id, se.course_id, {_CHUNK_SQL}, SUM(DISTINCT {_BIT_SQL})
+        FROM attendance_records ar
+        JOIN sessions se ON se.id = ar.session_id
+        WHERE se.course_id IS NOT NULL
+        GROUP BY ar.student_id, se.course_id, {_CHUNK_SQL}
+    """)
+
+
+def load(conn, student_id):
+    """Returns {course_id: bitmap} for the student, each bitmap a Python int over all chunks."""
+    bitmaps = {}
+    for row in conn.execute("SELECT course_id, chunk, bits FROM attendance_history WHERE student_id = ?",
+                            (student_id,)).fetchall():
+        bitmaps[row['course_id']] = bitmaps.get(row['course_id'], 0) | (row['bits'] << (row['chunk'] * CHUNK_BITS))
+    return bitmaps
+
+
+def load_course(conn, student_id, course_id):
+    """The student's bitmap for one course."""
+    bitmap = 0
+    for row in conn.execute("SELECT chunk, bits FROM attendance_history WHERE student_id = ? AND course_id = ?",
+                            (student_id, course_id)).fetchall():
+        bitmap |= row['bits'] << (row['chunk'] * CHUNK_BITS)
+    return bitmap
+
+
+def is_present(bitmap, course_seq):
+    return course_seq is not None and bool(bitmap >> course_seq & 1)
+
+
+def present_count(bitmap):
+    return bitmap.bit_count()
@@ -0,0 +1,271 @@
+# =================================================================
+#   A.R.I.S.E. Background Jobs
+#   - Runs heavy exports and reports off the request thread.
+#   - Every job is persisted in the 'jobs' table, so clients can poll it
+#     and interrupted work is picked up again after a restart.
+#   - A running job records its owner (host and process) and a lease. Only
+#     jobs whose owner has died, or whose lease has run out, are taken over
+#     by another worker; jobs running in live workers are left alone.
+#   - A small, fixed worker pool and a cap on queued jobs keep report
+#     generation from competing with the attendance scan endpoints.
+# =================================================================
+
+import datetime
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import storage
+
+# Job states, in the order a job moves through them.
+QUEUED, RUNNING, DONE, FAILED = 'queued', 'running', 'done', 'failed'
+
+
+class QueueFullError(Exception):
+    """Raised when too many jobs are already waiting to run."""
+
+
+class JobQueue:
+    """
+    A persisted job queue backed by a small thread pool.
+
+    `connect` is a callable returning a new database connection. Handlers are
+    registered per job kind and are called as handler(conn, params); they must
+    return a (download_name, mimetype, data) tuple, which is stored on disk as
+    the job's artifact.
+    """
+
+    def __init__(self, connect, artifact_dir, max_workers=2, max_pending=20,
+                 artifact_ttl=datetime.timedelta(hours=24), lease=datetime.timedelta(minutes=30)):
+        self._connect = connect
+        self._artifact_dir = artifact_dir
+        self._max_workers = max_workers
+        self._max_pending = max_pending
+        self._artifact_ttl = artifact_ttl
+        self._lease = int(lease.total_seconds())
+        self._owner = f'{socket.gethostname()}:{os.getpid()}'
+        self._handlers = {}
+        self._cache_keys = {}
+        self._executor = None
+        self._lock = threading.Lock()
+        self._finished = threading.Condition(self._lock)
+        self._pending = 0
+
+    def register(self, kind, handler, cache_key=None):
+        """
+        Registers the handler for a job kind. The optional `cache_key(conn, params)`
+        fingerprints the job's input data; a finished job with the same kind,
+        params and fingerprint is reused instead of generating a new artifact.
+        """
+        self._handlers[kind] = handler
+        if cache_key:
+            self._cache_keys[kind] = cache_key
+
+    def start(self):
+        """Starts the worker pool and re-queues jobs interrupted by a restart or crash."""
+        os.makedirs(self._artifact_dir, exist_ok=True)
+        self._executor = ThreadPoolExecutor(max_workers=self._max_workers,
+                                            thread_name_prefix='arise-job')
+        conn = self._connect()
+        try:
+            now = storage.now_epoch()
+            running = conn.execute("SELECT id, owner, lease_expires_at FROM jobs WHERE status = ?", (RUNNING,)).fetchall()
+            for job in running:
+                if self._abandoned(job, now):
+                    # Only if nobody else has taken it over meanwhile.
+                    conn.execute("""UPDATE jobs SET status = ?, started_at = NULL, owner = NULL, lease_expires_at = NULL
+                                    WHERE id = ? AND status = ? AND owner IS ?""",
+                                 (QUEUED, job['id'], RUNNING, job['owner']))
+            conn.commit()
+            interrupted = [row['id'] for row in conn.execute(
+                "SELECT id FROM jobs WHERE status = ? ORDER BY created_at", (QUEUED,)).fetchall()]
+        finally:
+            conn.close()
+        for job_id in interrupted:
+            self._dispatch(job_id)
+        self.prune()
+
+    def shutdown(self, wait=True):
+        if self._executor:
+            self._executor.shutdown(wait=wait)
+
+    # --- Submitting and inspecting jobs ---
+
+    def submit(self, kind, params):
+        """
+        Queues a job and returns its record. If an identical job is already
+        queued, running, or finished against unchanged data, that job is
+        returned instead. Raises QueueFullError when the backlog is full.
+        """
+        if kind not in self._handlers:
+            raise KeyError(f"Unknown job kind: {kind}")
+        params_json = json.dumps(params, sort_keys=True)
+
+        conn = self._connect()
+        try:
+            cache_key = None
+            if kind in self._cache_keys:
+                cache_key = self._cache_keys[kind](conn, params)
+
+            existing = conn.execute("""
+                SELECT * FROM jobs
+                WHERE kind = ? AND params = ? AND status IN (?, ?, ?)
+                  AND (cache_key IS ? OR status != ?)
+                ORDER BY created_at DESC LIMIT 1
+            """, (kind, params_json, QUEUED, RUNNING, DONE, cache_key, DONE)).fetchone()
+            if existing and (existing['status'] != DONE or os.path.exists(existing['artifact_path'] or '')):
+                return self._describe(existing)
+
+            with self._lock:
+                if self._pending >= self._max_pending:
+                    raise QueueFullError("Too many jobs are waiting; try again shortly.")
+                self._pending += 1
+
+            job_id = uuid.uuid4().hex
+            try:
+                conn.execute("""
+                    INSERT INTO jobs (id, kind, params, cache_key, status, created_at)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                """, (job_id, kind, params_json, cache_key, QUEUED, storage.now_epoch()))
+                conn.commit()
+            except Exception:
+                with self._lock:
+                    self._pending -= 1
+                raise
+            job = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        finally:
+            conn.close()
+
+        self._executor.submit(self._run, job_id)
+        return self._describe(job)
+
+    def get(self, job_id):
+        """Returns the job's public description, or None if it does not exist."""
+        conn = self._connect()
+        try:
+            job = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        finally:
+            conn.close()
+        return self._describe(job) if job else None
+
+    def wait(self, job_id, timeout):
+        """
+        Blocks until the job is finished or `timeout` seconds have passed, then
+        returns its description. This lets clients long-poll instead of
+        hammering the status endpoint.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            job = self.get(job_id)
+            if job is None or job['status'] in (DONE, FAILED):
+                return job
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return job
+            with self._finished:
+                self._finished.wait(min(remaining, 1.0))
+
+    def artifact(self, job_id):
+        """Returns (path, download_name, mimetype) for a finished job, or None."""
+        conn = self._connect()
+        try:
+            job = conn.execute("SELECT * FROM jobs WHERE id = ? AND status = ?", (job_id, DONE)).fetchone()
+        finally:
+            conn.close()
+        if not job or not os.path.exists(job['artifact_path']):
+            return None
+        return job['artifact_path'], job['artifact_name'], job['artifact_mimetype']
+
+    def prune(self):
+        """Deletes finished jobs (and their files) older than the artifact TTL."""
+        cutoff = storage.now_epoch() - int(self._artifact_ttl.total_seconds())
+        conn = self._connect()
+        try:
+            expired = conn.execute("SELECT id, artifact_path FROM jobs WHERE status IN (?, ?) AND finished_at < ?",
+                                   (DONE, FAILED, cutoff)).fetchall()
+            for job in expired:
+                if job['artifact_path'] and os.path.exists(job['artifact_path']):
+                    os.remove(job['artifact_path'])
+                conn.execute("DELETE FROM jobs WHERE id = ?", (job['id'],))
+            conn.commit()
+        finally:
+            conn.close()
+
+    # --- Internals ---
+
+    def _abandoned(self, job, now):
+        """True if a running job's worker is gone or its lease has run out."""
+        if job['owner'] is None or job['lease_expires_at'] is None:
+            return True  # claimed before jobs had owners
+        if job['lease_expires_at'] < now:
+            return True
+        host, _, pid = job['owner'].rpartition(':')
+        if host != socket.gethostname():
+            return False  # can't tell; wait for the lease
+        # This process has not run anything yet, so a job it "owns" is left
+        # over from an earlier process that happened to have the same pid.
+        return job['owner'] == self._owner or not _pid_alive(int(pid))
+
+    def _dispatch(self, job_id):
+        with self._lock:
+            self._pending += 1
+        self._executor.submit(self._run, job_id)
+
+    def _run(self, job_id):
+        conn = self._connect()
+        try:
+            # Claim the job atomically so a job re-queued by another worker
+            # process is never generated twice.
+            now = storage.now_epoch()
+            claimed = conn.execute("""UPDATE jobs SET status = ?, started_at = ?, owner = ?, lease_expires_at = ?
+                                      WHERE id = ? AND status = ?""",
+                                   (RUNNING, now, self._owner, now + self._lease, job_id, QUEUED))
+            conn.commit()
+            if claimed.rowcount == 0:
+                return
+            job = conn.execute("SELECT kind, params FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            try:
+                download_name, mimetype, data = self._handlers[job['kind']](conn, json.loads(job['params']))
+                artifact_path = os.path.join(self._artifact_dir, job_id)
+                with open(artifact_path, 'wb') as f:
+                    f.write(data)
+                conn.execute("""
+                    UPDATE jobs SET status = ?, finished_at = ?, artifact_path = ?,
+                                    artifact_name = ?, artifact_mimetype = ?
+                    WHERE id = ?
+                """, (DONE, storage.now_epoch(), artifact_path, download_name, mimetype, job_id))
+            except Exception as e:
+                conn.execute("UPDATE jobs SET status = ?, finished_at = ?, error = ? WHERE id = ?",
+                             (FAILED, storage.now_epoch(), str(e), job_id))
+            conn.commit()
+        finally:
+            conn.close()
+            with self._finished:
+                self._pending -= 1
+                self._finished.notify_all()
+
+    @staticmethod
+    def _describe(job):
+        """The JSON-friendly view of a job row that is returned to clients."""
+        return {
+            "job_id": job['id'],
+            "kind": job['kind'],
+            "status": job['status'],
+            "error": job['error'],
+            "created_at": storage.epoch_to_iso(job['created_at']),
+            "finished_at": storage.epoch_to_iso(job['finished_at']),
+        }
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True  # exists, owned by another user
+    return True
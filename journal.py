@@ -0,0 +1,294 @@
+# =================================================================
+#   A.R.I.S.E. Scan Journal
+#   - With SCAN_JOURNAL on, a validated scan is acknowledged as soon as it
+#     is in an append-only log file on disk, instead of after a full
+#     SQLite commit. A background thread then applies the logged scans
+#     to the database in batches.
+#   - Appends are group-committed: every scan that arrives while the log
+#     is being fsynced goes out with the next fsync, so a burst of scans
+#     costs a handful of fsyncs, not one commit each.
+#   - Each process writes its own scans-<pid>.log and holds a lock on it.
+#     At startup, logs without a live owner (left by a crash or restart)
+#     are replayed into the database and removed, and so is anything left
+#     in this process's own log by an earlier process with the same pid
+#     (routine for PID 1 in a container). Replaying is idempotent: a scan
+#     already in the database is skipped.
+# =================================================================
+
+import glob
+import json
+import os
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows: run a single worker process per journal directory
+    fcntl = None
+
+import history
+import storage
+
+
+class JournalError(Exception):
+    """A scan could not be made durable in the journal; the caller should write it directly."""
+
+
+def apply_scans(conn, scans):
+    """Inserts the journaled scans that are not in the database yet. The caller commits."""
+    for scan in scans:
+        conn.execute("""
+            INSERT INTO attendance_records (session_id, student_id, timestamp, override_method)
+            SELECT ?, ?, ?, ?
+            WHERE NOT EXISTS (SELECT 1 FROM attendance_records WHERE session_id = ? AND student_id = ?)
+        """, (scan['session_id'], scan['student_id'], scan['timestamp'], scan['method'],
+              scan['session_id'], scan['student_id']))
+        # Setting a bit twice is harmless, so replays need no check here.
+        history.record_presence(conn, scan['session_id'], scan['student_id'])
+
+
+def read_journal(path):
+    """The scans in a journal file. A torn last line (a crash mid-write) is ignored."""
+    scans = []
+    with open(path, 'rb') as f:
+        for line in f:
+            try:
+                scans.append(json.loads(line))
+            except ValueError:
+                break
+    return scans
+
+
+class ScanJournal:
+    """
+    An fsync-batched, append-only log of scans in `directory`.
+
+    `connect` is a callable returning a new database connection. Scans are
+    applied up to `batch_size` per transaction. The log is emptied whenever
+    everything in it has been applied and it has grown past `truncate_size`
+    bytes.
+    """
+
+    def __init__(self, directory, connect, batch_size=500, truncate_size=1 << 20):
+        self._directory = directory
+        self._connect = connect
+        self._batch_size = batch_size
+        self._truncate_size = truncate_size
+        self._path = os.path.join(directory, f'scans-{os.getpid()}.log')
+        self._file = None
+
+        self._cond = threading.Condition()
+        self._file_lock = threading.Lock()
+        self._pending = set()     # (session_id, student_id) journaled but not yet applied
+        self._buffer = []         # scans appended but not yet written
+        self._unapplied = []      # scans durable on disk, waiting for the database
+        self._seq = 0             # number of scans appended
+        self._durable_seq = 0     # ...of which fsynced
+        self._applied_seq = 0     # ...of which in the database
+        self._error = None
+        self._stopping = False
+        self._threads = []
+
+    def start(self):
+        """Opens and locks this process's log, then replays the logs left by earlier processes."""
+        os.makedirs(self._directory, exist_ok=True)
+        self._file = self._open_own_log()
+        try:
+            self._replay_own_log()
+            self.replay()
+        except Exception:
+            self._file.close()
+            self._file = None
+            raise
+        for target, name in ((self._flush_loop, 'arise-journal-flush'), (self._apply_loop, 'arise-journal-apply')):
+            thread = threading.Thread(target=target, name=name, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _open_own_log(self):
+        while True:
+            f = open(self._path, 'ab')
+            if fcntl is None:
+                return f
+            # Blocking: another worker's replay() may hold the lock for a moment
+            # on this freshly created, empty file.
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            if _same_file(f, self._path):
+                return f
+            # That replay removed the file; the lock is on an unlinked inode.
+            f.close()
+
+    def _replay_own_log(self):
+        # Left by a crashed process that had our pid; it must be applied before we append.
+        scans = read_journal(self._path)
+        for start in range(0, len(scans), self._batch_size):
+            self._apply(scans[start:start + self._batch_size])
+        if scans or self._file.tell():
+            self._file.truncate(0)
+            self._file.seek(0)
+            os.fsync(self._file.fileno())
+        if scans:
+            print(f"Replayed {len(scans)} journaled scan(s) left in {self._path}.")
+
+    def stop(self):
+        """Waits for everything appended so far to be written and applied."""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join()
+        if self._file:
+            self._file.close()
+            if self._applied_seq == self._seq:
+                os.remove(self._path)
+
+    def is_pending(self, session_id, student_id):
+        """True if this scan is journaled but not yet in the database."""
+        with self._cond:
+            return (session_id, student_id) in self._pending
+
+    def append(self, session_id, student_id, timestamp, method='biometric'):
+        """
+        Journals a scan and returns once it is on disk. Returns False if the
+        same student's scan for this session is already waiting to be applied.
+        Raises JournalError if the log could not be written.
+        """
+        key = (session_id, student_id)
+        with self._cond:
+            if key in self._pending:
+                return False
+            if self._error is not None:
+                raise JournalError(str(self._error))
+            self._pending.add(key)
+            self._seq += 1
+            seq = self._seq
+            self._buffer.append({"seq": seq, "session_id": session_id, "student_id": student_id,
+                                 "timestamp": timestamp, "method": method})
+            self._cond.notify_all()
+            while self._durable_seq < seq and self._error is None:
+                self._cond.wait()
+            if self._durable_seq < seq:
+                self._pending.discard(key)
+                raise JournalError(str(self._error))
+        return True
+
+    # -- Writing ---------------------------------------------------
+
+    def _flush_loop(self):
+        while True:
+            with self._cond:
+                while not self._buffer and not self._stopping:
+                    self._cond.wait()
+                if not self._buffer:
+                    return
+                # Everything appended while the previous fsync ran goes out together.
+                batch, self._buffer = self._buffer, []
+            data = b''.join(json.dumps(scan, separators=(',', ':')).encode() + b'\n' for scan in batch)
+            try:
+                with self._file_lock:
+                    self._file.write(data)
+                    self._file.flush()
+                    os.fsync(self._file.fileno())
+            except OSError as e:
+                # The log can no longer be trusted; scans go straight to the database from now on.
+                print(f"Scan journal write failed, falling back to direct writes: {e}")
+                with self._cond:
+                    self._error = e
+                    self._cond.notify_all()
+                return
+            with self._cond:
+                self._durable_seq = batch[-1]['seq']
+                self._unapplied.extend(batch)
+                self._cond.notify_all()
+
+    # -- Applying --------------------------------------------------
+
+    def _apply_loop(self):
+        while True:
+            with self._cond:
+                while not self._unapplied and not (self._stopping and self._durable_seq == self._seq):
+                    if self._error is not None and not self._unapplied:
+                        return
+                    self._cond.wait(1)
+                if not self._unapplied:
+                    return
+                batch = self._unapplied[:self._batch_size]
+            try:
+                self._apply(batch)
+            except Exception as e:
+                # Most likely the database was busy; the scans stay journaled and are retried.
+                print(f"Could not apply {len(batch)} journaled scan(s), retrying: {e}")
+                with self._cond:
+                    self._cond.wait(0.5)
+                continue
+            with self._cond:
+                del self._unapplied[:len(batch)]
+                for scan in batch:
+                    self._pending.discard((scan['session_id'], scan['student_id']))
+                self._applied_seq = batch[-1]['seq']
+                if self._applied_seq == self._seq:
+                    self._truncate_if_large()
+
+    def _apply(self, scans):
+        conn = self._connect()
+        try:
+            try:
+                apply_scans(conn, scans)
+                conn.commit()
+            except storage.IntegrityError:
+                # A scan that can never be applied (its student or session was purged
+                # in the meantime) must not hold up the others.
+                conn.rollback()
+                for scan in scans:
+                    try:
+                        apply_scans(conn, [scan])
+                        conn.commit()
+                    except storage.IntegrityError as e:
+                        conn.rollback()
+                        print(f"Dropping journaled scan {scan}: {e}")
+        finally:
+            conn.close()
+
+    def _truncate_if_large(self):
+        # Called with self._cond held and nothing buffered or unapplied, so no write is in flight.
+        with self._file_lock:
+            if self._file.tell() >= self._truncate_size:
+                self._file.truncate(0)
+                self._file.seek(0)
+                os.fsync(self._file.fileno())
+
+    # -- Recovery --------------------------------------------------
+
+    def replay(self):
+        """Applies and removes the logs of processes that are no longer running. Returns the number of scans replayed."""
+        replayed = 0
+        for path in sorted(glob.glob(os.path.join(self._directory, 'scans-*.log'))):
+            if path == self._path:
+                continue
+            try:
+                f = open(path, 'rb+')
+            except FileNotFoundError:
+                continue  # replayed by another worker meanwhile
+            with f:
+                if fcntl is not None:
+                    try:
+                        fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    except OSError:
+                        continue  # another worker is still writing it
+                    if not _same_file(f, path):
+                        continue  # another worker replayed and removed it first
+                scans = read_journal(path)
+                for start in range(0, len(scans), self._batch_size):
+                    self._apply(scans[start:start + self._batch_size])
+                os.remove(path)
+            replayed += len(scans)
+        if replayed:
+            print(f"Replayed {replayed} journaled scan(s) into the database.")
+        return replayed
+
+
+def _same_file(f, path):
+    """True if the open file `f` is still the file at `path` (not removed or replaced)."""
+    try:
+        return os.path.samestat(os.fstat(f.fileno()), os.stat(path))
+    except FileNotFoundError:
+        return False
@@ -0,0 +1,247 @@
+# =================================================================
+#   A.R.I.S.E. Mail Queue
+#   - Sends the emails recorded in the 'notifications' table (the outbox
+#     and sent-log in one) from a single background thread.
+#   - Keeps one SMTP connection open while there is mail to send, paces
+#     sends to MAIL_RATE_PER_MINUTE so the mail provider does not throttle
+#     us, and retries temporary failures with a growing delay. Mail the
+#     server refuses for good (a 5xx, refused recipients) is marked
+#     'rejected' and never retried.
+#   - Every worker runs a queue over the same table, so a message is
+#     claimed (status 'sending') before it is sent and only the worker
+#     whose claim succeeded sends it. A claim left behind by a worker
+#     that died mid-send is released after the claim lease.
+#   - Queued mail survives a restart: start() picks it up again.
+# =================================================================
+
+import heapq
+import itertools
+import smtplib
+import threading
+import time
+from email.message import EmailMessage
+
+import storage
+
+QUEUED = 'queued'
+SENDING = 'sending'    # claimed by a worker that is sending it now
+SENT = 'sent'
+FAILED = 'failed'      # gave up after temporary errors; worth another try later
+REJECTED = 'rejected'  # refused for good; retrying will not help
+
+
+class PermanentMailError(Exception):
+    """The server refused the message for good (e.g. an unknown address); retrying will not help."""
+
+
+class SMTPSettings:
+    """Where and how to connect. With no username, no login is attempted."""
+
+    def __init__(self, host, port=25, username=None, password=None, use_tls=False,
+                 sender='arise@localhost', timeout=30):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.use_tls = use_tls
+        self.sender = sender
+        self.timeout = timeout
+
+    def open(self):
+        smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            if self.use_tls:
+                smtp.starttls()
+            if self.username:
+                smtp.login(self.username, self.password)
+        except Exception:
+            smtp.close()
+            raise
+        return smtp
+
+
+class MailQueue:
+    """
+    Sends queued notifications, one SMTP connection at a time.
+
+    `connect` is a callable returning a new database connection. A message
+    is tried up to `max_attempts` times, waiting retry_delay, 2*retry_delay,
+    4*retry_delay, ... seconds between attempts. The connection is closed
+    after `idle_close` seconds without mail. Claims older than `claim_lease`
+    seconds are taken to be abandoned, and the mail is queued again; the
+    lease must be longer than a send can take.
+    """
+
+    def __init__(self, connect, settings, rate_per_minute=30, max_attempts=5,
+                 retry_delay=30, idle_close=10, claim_lease=600):
+        self._connect = connect
+        self._settings = settings
+        self._min_gap = 60.0 / rate_per_minute if rate_per_minute else 0
+        self._max_attempts = max_attempts
+        self._retry_delay = retry_delay
+        self._idle_close = idle_close
+        self._claim_lease = claim_lease
+
+        self._heap = []  # (due time, tiebreaker, notification id, or None for the stale-claim check)
+        self._counter = itertools.count()
+        self._wakeup = threading.Condition()
+        self._stopping = False
+        self._thread = None
+        self._smtp = None
+        self._last_sent_at = float('-inf')
+
+    def start(self):
+        """Re-queues mail left unsent by a restart, then starts the sender thread."""
+        self._release_stale_claims()
+        conn = self._connect()
+        try:
+            pending = [row['id'] for row in conn.execute(
+                "SELECT id FROM notifications WHERE status = ? ORDER BY id", (QUEUED,)).fetchall()]
+        finally:
+            conn.close()
+        for notification_id in pending:
+            self.put(notification_id)
+        self.put(None, delay=self._claim_lease)
+        self._thread = threading.Thread(target=self._run, name='arise-mail-queue', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._wakeup:
+            self._stopping = True
+            self._wakeup.notify()
+        if self._thread:
+            self._thread.join()
+
+    def put(self, notification_id, delay=0):
+        """Queues a notification row (status 'queued') to be sent after `delay` seconds."""
+        with self._wakeup:
+            heapq.heappush(self._heap, (time.monotonic() + delay, next(self._counter), notification_id))
+            self._wakeup.notify()
+
+    def pending(self):
+        with self._wakeup:
+            return sum(1 for entry in self._heap if entry[2] is not None)
+
+    def _run(self):
+        while True:
+            with self._wakeup:
+                while not self._stopping:
+                    wait = self._heap[0][0] - time.monotonic() if self._heap else None
+                    if wait is not None and wait <= 0:
+                        break
+                    if self._smtp is not None and (wait is None or wait > self._idle_close):
+                        # Nothing to send soon: don't keep the server's connection slot.
+                        if not self._wakeup.wait(self._idle_close):
+                            self._disconnect()
+                        continue
+                    self._wakeup.wait(wait)
+                if self._stopping:
+                    self._disconnect()
+                    return
+                _, _, notification_id = heapq.heappop(self._heap)
+            if notification_id is None:
+                try:
+                    self._release_stale_claims()
+                except Exception as e:
+                    print(f"Could not release stale mail claims: {e}")
+                self.put(None, delay=self._claim_lease)
+                continue
+            # Send outside the lock so put() never waits on the network.
+            try:
+                self._send(notification_id)
+            except Exception as e:
+                # Most likely the database was busy while recording the result.
+                print(f"Could not process notification {notification_id}, retrying: {e}")
+                self.put(notification_id, delay=self._retry_delay)
+
+    def _send(self, notification_id):
+        conn = self._connect()
+        try:
+            # Another worker may hold the same id; whoever claims the row sends it.
+            claimed = conn.execute("UPDATE notifications SET status = ?, claimed_at = ? WHERE id = ? AND status = ?",
+                                   (SENDING, storage.now_epoch(), notification_id, QUEUED))
+            conn.commit()
+            if claimed.rowcount != 1:
+                return
+            row = conn.execute("SELECT * FROM notifications WHERE id = ?", (notification_id,)).fetchone()
+        finally:
+            conn.close()
+
+        # Pace the sends; the connection stays open between them.
+        gap = self._last_sent_at + self._min_gap - time.monotonic()
+        if gap > 0:
+            time.sleep(gap)
+        attempts = row['attempts'] + 1
+        try:
+            self._deliver(self._message(row))
+        except PermanentMailError as e:
+            self._record(notification_id, REJECTED, attempts, str(e))
+        except Exception as e:
+            # Connection trouble or a temporary (4xx) refusal: start afresh next time.
+            self._disconnect()
+            if attempts >= self._max_attempts:
+                self._record(notification_id, FAILED, attempts, str(e))
+            else:
+                self._record(notification_id, QUEUED, attempts, str(e))
+                self.put(notification_id, delay=self._retry_delay * 2 ** (attempts - 1))
+        else:
+            self._record(notification_id, SENT, attempts, None)
+        finally:
+            self._last_sent_at = time.monotonic()
+
+    def _message(self, row):
+        message = EmailMessage()
+        message['From'] = self._settings.sender
+        message['To'] = row['recipients']
+        message['Subject'] = row['subject']
+        message.set_content(row['body'])
+        return message
+
+    def _deliver(self, message):
+        if self._smtp is None:
+            self._smtp = self._settings.open()
+        try:
+            self._smtp.send_message(message)
+        except smtplib.SMTPRecipientsRefused as e:
+            raise PermanentMailError(f"All recipients refused: {', '.join(e.recipients)}") from e
+        except smtplib.SMTPResponseException as e:
+            if e.smtp_code >= 500:
+                # The connection itself is still fine after a refused message.
+                raise PermanentMailError(f"{e.smtp_code} {e.smtp_error!r}") from e
+            raise
+
+    def _disconnect(self):
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except Exception:
+                self._smtp.close()
+            self._smtp = None
+
+    def _record(self, notification_id, status, attempts, error):
+        conn = self._connect()
+        try:
+            conn.execute("UPDATE notifications SET status = ?, attempts = ?, last_error = ?, sent_at = ?, claimed_at = NULL "
+                         "WHERE id = ?",
+                         (status, attempts, error, storage.now_epoch() if status == SENT else None, notification_id))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _release_stale_claims(self):
+        """Queues again the mail claimed by a worker that stopped before recording the result."""
+        cutoff = storage.now_epoch() - self._claim_lease
+        conn = self._connect()
+        try:
+            stale = [row['id'] for row in conn.execute(
+                "SELECT id FROM notifications WHERE status = ? AND claimed_at < ? ORDER BY id",
+                (SENDING, cutoff)).fetchall()]
+            for notification_id in stale:
+                conn.execute("UPDATE notifications SET status = ?, claimed_at = NULL "
+                             "WHERE id = ? AND status = ? AND claimed_at < ?",
+                             (QUEUED, notification_id, SENDING, cutoff))
+            conn.commit()
+        finally:
+            conn.close()
+        for notification_id in stale:
+            self.put(notification_id)
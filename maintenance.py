@@ -0,0 +1,420 @@
+# =================================================================
+#   A.R.I.S.E. Database Maintenance
+#   - Keeps a SQLite database healthy without taking the server down:
+#       backup    an online backup (SQLite backup API) into BACKUP_DIR,
+#                 copied a few pages at a time so writers are only held
+#                 up for one short step. A write restarts the copy, so on
+#                 a busy database it gets BACKUP_TIME_BUDGET_SECONDS, then
+#                 one quick single-step copy if the server is quiet, and
+#                 otherwise fails until the next run;
+#       optimize  PRAGMA optimize, or a full ANALYZE the first time, so
+#                 the query planner has statistics;
+#       vacuum    PRAGMA incremental_vacuum in small steps, returning the
+#                 pages freed by deletes and purges to the file system.
+#   - The scheduler runs them once a day inside the maintenance window,
+#     and only while the server is quiet. Every run is recorded in the
+#     'maintenance_runs' table with its duration and pages reclaimed.
+#     The 'maintenance_state' row is the lock that keeps several admin
+#     workers from running at once, and remembers the last daily run.
+#   - Run as a script for one-off work:
+#         python maintenance.py [--database attendance.db] status
+#         python maintenance.py backup | optimize | vacuum
+#         python maintenance.py enable-incremental-vacuum   (server stopped)
+# =================================================================
+
+import argparse
+import datetime
+import glob
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+import storage
+
+TASKS = ('backup', 'optimize', 'vacuum')
+
+# PRAGMA auto_vacuum values.
+AUTO_VACUUM_INCREMENTAL = 2
+
+
+class BackupTimeout(Exception):
+    """The stepwise backup kept being restarted by writes and ran out of time."""
+
+
+class Maintenance:
+    """
+    The maintenance tasks for the SQLite database at `path`. They use their
+    own connections, never the request pool. `is_idle(quiet_seconds)`
+    (optional) is checked between steps so scans always go first.
+    `time_budget` bounds a vacuum, `backup_time_budget` a stepwise backup.
+    """
+
+    def __init__(self, path, backup_dir, keep_backups=7, step_pages=256, step_pause=0.05,
+                 time_budget=60, backup_time_budget=300, is_idle=None):
+        self.path = path
+        self._backup_dir = backup_dir
+        self._keep_backups = keep_backups
+        self._step_pages = step_pages
+        self._step_pause = step_pause
+        self._time_budget = time_budget
+        self._backup_time_budget = backup_time_budget
+        self._is_idle = is_idle
+
+    def _connect(self):
+        # A short busy timeout: a step that cannot get the lock soon is retried later.
+        conn = sqlite3.connect(self.path, timeout=2, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _pause(self):
+        """Sleeps between steps, longer while requests are coming in."""
+        deadline = time.monotonic() + 5
+        while self._is_idle is not None and not self._is_idle(0.5) and time.monotonic() < deadline:
+            time.sleep(0.1)
+        time.sleep(self._step_pause)
+
+    # -- Tasks -----------------------------------------------------
+    # Each returns a report: a dict with at least 'duration_ms'.
+
+    def backup(self):
+        """Writes a consistent copy of the database to the backup directory."""
+        started = time.monotonic()
+        os.makedirs(self._backup_dir, exist_ok=True)
+        name = datetime.datetime.now().strftime('%Y%m%d-%H%M%S')
+        path = os.path.join(self._backup_dir, f'backup-{name}.db')
+        partial = f'{path}.{os.getpid()}.part'
+
+        deadline = started + self._backup_time_budget
+        restarts = 0
+        last_remaining = None
+
+        def progress(status, remaining, total):
+            nonlocal restarts, last_remaining
+            if last_remaining is not None and remaining > last_remaining:
+                restarts += 1
+            last_remaining = remaining
+            if remaining and time.monotonic() > deadline:
+                raise BackupTimeout(f"backup restarted {restarts} time(s) by writes and ran out of time")
+
+        source = self._connect()
+        target = sqlite3.connect(partial)
+        single_step = False
+        try:
+            try:
+                # Each step read-locks the source for `step_pages` pages only. A write
+                # in between makes SQLite restart the copy, so the result is still a
+                # consistent snapshot.
+                source.backup(target, pages=self._step_pages, progress=progress, sleep=self._step_pause)
+            except BackupTimeout:
+                if self._is_idle is not None and not self._is_idle(5):
+                    raise
+                # Quiet now: copy everything in one step, holding writers up only for that.
+                source.backup(target)
+                single_step = True
+            pages = target.execute("PRAGMA page_count").fetchone()[0]
+        except Exception:
+            target.close()
+            os.remove(partial)
+            raise
+        finally:
+            target.close()
+            source.close()
+        # Only complete backups ever carry the .db name.
+        os.replace(partial, path)
+        removed = self._prune_backups()
+        return {"path": path, "pages": pages, "size_bytes": os.path.getsize(path),
+                "restarts": restarts, "single_step": single_step,
+                "removed_backups": removed, "duration_ms": _elapsed_ms(started)}
+
+    def _prune_backups(self):
+        backups = sorted(glob.glob(os.path.join(self._backup_dir, 'backup-*.db')))
+        stale = backups[:-self._keep_backups] if self._keep_backups else []
+        for path in stale:
+            os.remove(path)
+        return len(stale)
+
+    def optimize(self):
+        """Refreshes the query planner's statistics."""
+        started = time.monotonic()
+        conn = self._connect()
+        try:
+            analyzed = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'").fetchone() is not None
+            if analyzed:
+                # Re-analyzes only the tables whose statistics are out of date.
+                conn.execute("PRAGMA optimize")
+            else:
+                # First time: sample each index rather than reading all of it, which
+                # keeps ANALYZE to a fraction of a second on a large database.
+                conn.execute("PRAGMA analysis_limit = 1000")
+                conn.execute("ANALYZE")
+        finally:
+            conn.close()
+        return {"full_analyze": not analyzed, "duration_ms": _elapsed_ms(started)}
+
+    def vacuum(self):
+        """
+        Returns free pages to the file system, `step_pages` per transaction,
+        until none are left or `time_budget` seconds have passed.
+        """
+        started = time.monotonic()
+        conn = self._connect()
+        try:
+            mode = conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+            free_before = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            if mode != AUTO_VACUUM_INCREMENTAL:
+                return {"skipped": "incremental vacuum is not enabled for this database; "
+                                   "run `python maintenance.py enable-incremental-vacuum` once",
+                        "free_pages": free_before, "pages_reclaimed": 0, "duration_ms": _elapsed_ms(started)}
+            free = free_before
+            steps = 0
+            while free and time.monotonic() - started < self._time_budget:
+                try:
+                    # Each call is its own short write transaction. executescript()
+                    # runs the pragma to completion; execute() would free one page.
+                    conn.executescript(f"PRAGMA incremental_vacuum({int(self._step_pages)});")
+                except sqlite3.OperationalError:
+                    # Busy: let the writers through and try again.
+                    pass
+                steps += 1
+                free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+                if free:
+                    self._pause()
+        finally:
+            conn.close()
+        return {"steps": steps, "pages_reclaimed": free_before - free, "free_pages": free,
+                "duration_ms": _elapsed_ms(started)}
+
+    def status(self):
+        conn = self._connect()
+        try:
+            page_size, page_count, free, mode = (conn.execute(f"PRAGMA {name}").fetchone()[0]
+                                                 for name in ('page_size', 'page_count', 'freelist_count', 'auto_vacuum'))
+        finally:
+            conn.close()
+        backups = sorted(glob.glob(os.path.join(self._backup_dir, 'backup-*.db')))
+        return {"size_bytes": page_size * page_count, "free_pages": free,
+                "incremental_vacuum": mode == AUTO_VACUUM_INCREMENTAL,
+                "latest_backup": backups[-1] if backups else None}
+
+    def run(self, tasks=TASKS):
+        """Runs the given tasks in order and returns {task: report}. A failed task does not stop the others."""
+        reports = {}
+        for task in tasks:
+            started_at = storage.now_epoch()
+            try:
+                report = getattr(self, task)()
+                status = 'done'
+            except Exception as e:
+                report = {"error": str(e)}
+                status = 'failed'
+            report.update(task=task, status=status, started_at=started_at)
+            reports[task] = report
+        return reports
+
+
+def enable_incremental_vacuum(path):
+    """
+    Switches an existing database to incremental auto-vacuum. This needs one
+    full VACUUM, which rewrites the whole file and blocks every other
+    connection meanwhile: run it while the server is stopped.
+    """
+    conn = sqlite3.connect(path, isolation_level=None)
+    try:
+        conn.execute(f"PRAGMA auto_vacuum = {AUTO_VACUUM_INCREMENTAL}")
+        conn.execute("VACUUM")
+        return conn.execute("PRAGMA auto_vacuum").fetchone()[0] == AUTO_VACUUM_INCREMENTAL
+    finally:
+        conn.close()
+
+
+def record_runs(conn, reports):
+    """Stores the reports of Maintenance.run() in 'maintenance_runs'."""
+    for report in reports.values():
+        detail = {key: value for key, value in report.items()
+                  if key not in ('task', 'status', 'started_at', 'duration_ms', 'pages_reclaimed')}
+        conn.execute("""
+            INSERT INTO maintenance_runs (task, status, started_at, duration_ms, pages_reclaimed, detail)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, (report['task'], report['status'], report['started_at'], report.get('duration_ms'),
+              report.get('pages_reclaimed'), json.dumps(detail)))
+
+
+def recent_runs(conn, limit=20):
+    runs = []
+    for row in conn.execute("SELECT * FROM maintenance_runs ORDER BY id DESC LIMIT ?", (limit,)).fetchall():
+        run = dict(row)
+        run['started_at'] = storage.epoch_to_iso(run['started_at'])
+        run['detail'] = json.loads(run['detail']) if run['detail'] else {}
+        runs.append(run)
+    return runs
+
+
+class MaintenanceScheduler:
+    """
+    Runs Maintenance once a day, starting in the hour `window_start` (local
+    time) and only while the server has been quiet for a while. run_now()
+    runs the given tasks at the next quiet moment, whatever the time.
+
+    `connect` is a callable returning a new database connection, used to
+    record the runs. A worker holds the maintenance lock for at most `lease`
+    seconds; after that another one may take over.
+    """
+
+    def __init__(self, maintenance, connect, window_start=2, window_hours=4, is_idle=None,
+                 check_interval=60, lease=3600):
+        self._maintenance = maintenance
+        self._connect = connect
+        self._window_start = window_start
+        self._window_hours = window_hours
+        self._is_idle = is_idle
+        self._check_interval = check_interval
+        self._lease = lease
+        self._owner = f'{socket.gethostname()}:{os.getpid()}'
+        self._done_window = None  # start of the last window known to have had its run
+        self._requested = None
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='arise-maintenance', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopping = True
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join()
+
+    def status(self):
+        return self._maintenance.status()
+
+    def run_now(self, tasks=TASKS):
+        self._requested = tuple(tasks)
+        self._wakeup.set()
+
+    def _in_window(self, now):
+        return (now.hour - self._window_start) % 24 < self._window_hours
+
+    def _window_opened(self, now):
+        """When the window `now` falls in opened, in epoch seconds."""
+        opened = now.replace(hour=self._window_start, minute=0, second=0, microsecond=0)
+        if opened > now:
+            opened -= datetime.timedelta(days=1)
+        return int(opened.timestamp())
+
+    def _run(self):
+        while not self._stopping:
+            self._wakeup.wait(self._check_interval)
+            self._wakeup.clear()
+            if self._stopping:
+                return
+            now = datetime.datetime.now()
+            tasks, window = self._requested, None
+            if tasks is None:
+                if not self._in_window(now) or self._done_window == self._window_opened(now):
+                    continue
+                tasks, window = TASKS, self._window_opened(now)
+            if self._is_idle is not None and not self._is_idle(30):
+                continue
+            try:
+                claimed = self._claim(window)
+            except Exception as e:
+                print(f"Could not take the maintenance lock: {e}")
+                continue
+            if not claimed:
+                # Another worker is running maintenance, or has done this window's run.
+                continue
+            if window is None:
+                self._requested = None
+            try:
+                self.run(tasks)
+            except Exception as e:
+                print(f"Database maintenance failed: {e}")
+            finally:
+                self._release()
+
+    def _claim(self, window):
+        """
+        Takes the maintenance lock, and for a daily run (`window` is when the
+        window opened) records it as that window's run. False if another
+        worker holds the lock or the window has already had its run.
+        """
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            state = conn.execute(
+                "SELECT owner, lease_expires_at, last_scheduled_run FROM maintenance_state WHERE id = 1").fetchone()
+            now = storage.now_epoch()
+            if state['owner'] is not None and state['lease_expires_at'] >= now:
+                return False
+            last_scheduled_run = state['last_scheduled_run']
+            if window is not None:
+                if last_scheduled_run is not None and last_scheduled_run >= window:
+                    self._done_window = window
+                    return False
+                last_scheduled_run = now
+            conn.execute("UPDATE maintenance_state SET owner = ?, lease_expires_at = ?, last_scheduled_run = ? "
+                         "WHERE id = 1", (self._owner, now + self._lease, last_scheduled_run))
+            conn.commit()
+            if window is not None:
+                self._done_window = window
+            return True
+        finally:
+            conn.close()
+
+    def _release(self):
+        try:
+            conn = self._connect()
+            try:
+                conn.execute("UPDATE maintenance_state SET owner = NULL, lease_expires_at = NULL "
+                             "WHERE id = 1 AND owner = ?", (self._owner,))
+                conn.commit()
+            finally:
+                conn.close()
+        except Exception as e:
+            # The lease runs out on its own.
+            print(f"Could not release the maintenance lock: {e}")
+
+    def run(self, tasks=TASKS):
+        reports = self._maintenance.run(tasks)
+        conn = self._connect()
+        try:
+            record_runs(conn, reports)
+            conn.commit()
+        finally:
+            conn.close()
+        for report in reports.values():
+            print(f"Maintenance {report['task']}: {report['status']} in {report.get('duration_ms')} ms"
+                  + (f", {report['pages_reclaimed']} pages reclaimed" if report.get('pages_reclaimed') else ''))
+        return reports
+
+
+def _elapsed_ms(started):
+    return round((time.monotonic() - started) * 1000)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="A.R.I.S.E. database maintenance")
+    parser.add_argument('--database', default=os.environ.get('ARISE_DATABASE', 'attendance.db'))
+    parser.add_argument('--backup-dir', default=os.environ.get('ARISE_BACKUP_DIR', 'backups'))
+    parser.add_argument('command', choices=TASKS + ('status', 'enable-incremental-vacuum'))
+    args = parser.parse_args(argv)
+
+    if args.command == 'enable-incremental-vacuum':
+        print("Incremental vacuum enabled." if enable_incremental_vacuum(args.database)
+              else "Could not enable incremental vacuum.")
+        return
+    maintenance = Maintenance(args.database, args.backup_dir)
+    if args.command == 'status':
+        print(json.dumps(maintenance.status(), indent=2))
+        return
+    print(json.dumps(maintenance.run((args.command,))[args.command], indent=2))
+
+
+if __name__ == '__main__':
+    main()
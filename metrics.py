@@ -0,0 +1,284 @@
+# =================================================================
+#   A.R.I.S.E. Metrics & Profiling
+#   - Per-endpoint request latency histograms.
+#   - SQL query counts and durations per request, collected through an
+#     instrumented sqlite3 connection/cursor, or psycopg2 cursor.
+#   - Slow-query log entries that include the query plan.
+#   - A Prometheus-style /metrics endpoint.
+#   Nothing here is installed unless metrics are enabled, so a server
+#   running without them pays no per-request or per-query cost.
+# =================================================================
+
+import functools
+import logging
+import sqlite3
+import threading
+import time
+
+from flask import Response, g, request
+
+slow_query_log = logging.getLogger('arise.slow_query')
+
+# Bucket upper bounds, in seconds, shared by every latency histogram.
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+# Bucket upper bounds for "queries per request".
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+class Histogram:
+    """A labelled, cumulative histogram in the Prometheus sense."""
+
+    def __init__(self, name, help_text, buckets, label_names=()):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.label_names = label_names
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                # [count per bucket..., +Inf count, sum]
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for labels, series in sorted(self._series.items()):
+                base = ','.join(f'{name}="{value}"' for name, value in zip(self.label_names, labels))
+                sep = ',' if base else ''
+                for bound, count in zip(self.buckets, series):
+                    lines.append(f'{self.name}_bucket{{{base}{sep}le="{bound}"}} {count}')
+                lines.append(f'{self.name}_bucket{{{base}{sep}le="+Inf"}} {series[-2]}')
+                suffix = f'{{{base}}}' if base else ''
+                lines.append(f'{self.name}_count{suffix} {series[-2]}')
+                lines.append(f'{self.name}_sum{suffix} {series[-1]:.6f}')
+        return lines
+
+
+class Counter:
+    """A labelled, monotonically increasing counter."""
+
+    def __init__(self, name, help_text, label_names=()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                base = ','.join(f'{name}="{value}"' for name, value in zip(self.label_names, labels))
+                lines.append(f'{self.name}{{{base}}} {value}' if base else f'{self.name} {value}')
+        return lines
+
+
+REQUEST_LATENCY = Histogram('arise_request_duration_seconds', 'Time spent handling a request.',
+                            LATENCY_BUCKETS, ('endpoint', 'method'))
+REQUEST_COUNT = Counter('arise_requests_total', 'Requests handled, by response status.',
+                        ('endpoint', 'method', 'status'))
+REQUEST_QUERIES = Histogram('arise_request_sql_queries', 'SQL queries executed per request.',
+                            QUERY_COUNT_BUCKETS, ('endpoint',))
+REQUEST_SQL_TIME = Histogram('arise_request_sql_duration_seconds', 'Time spent in SQL per request.',
+                             LATENCY_BUCKETS, ('endpoint',))
+QUERY_LATENCY = Histogram('arise_sql_query_duration_seconds', 'Time spent executing and fetching one SQL statement.',
+                          LATENCY_BUCKETS)
+SLOW_QUERIES = Counter('arise_sql_slow_queries_total', 'SQL statements slower than the slow-query threshold.')
+
+ALL_METRICS = (REQUEST_LATENCY, REQUEST_COUNT, REQUEST_QUERIES, REQUEST_SQL_TIME, QUERY_LATENCY, SLOW_QUERIES)
+
+# SQL statistics for the request being handled on this thread, if any.
+_request_stats = threading.local()
+
+# Statements slower than this (in seconds) are logged with their query plan.
+slow_query_threshold = 0.1
+
+
+def _record_query(sql, params, elapsed, explain):
+    QUERY_LATENCY.observe(elapsed)
+    stats = getattr(_request_stats, 'current', None)
+    if stats is not None:
+        stats[0] += 1
+        stats[1] += elapsed
+    if elapsed >= slow_query_threshold and not sql.lstrip().upper().startswith('EXPLAIN'):
+        SLOW_QUERIES.inc()
+        _log_slow_query(sql, params, elapsed, explain)
+
+
+def _log_slow_query(sql, params, elapsed, explain):
+    try:
+        plan = '\n'.join(f"    {line}" for line in explain(sql, params))
+    except Exception:
+        plan = '    (plan not available)'
+    endpoint = request.endpoint if getattr(_request_stats, 'current', None) is not None else '-'
+    slow_query_log.warning("Slow query (%.1f ms) in %s:\n  %s\n  plan:\n%s",
+                           elapsed * 1000, endpoint, ' '.join(sql.split()), plan)
+
+
+class _TimedCursor:
+    """
+    Times execution plus fetching of every statement. Mixed into a driver's
+    cursor class, which also provides _explain(sql, params): the lines of
+    the statement's query plan.
+    """
+
+    _sql = None
+    _params = ()
+    _elapsed = 0.0
+
+    def execute(self, sql, params=()):
+        self._finish()
+        self._sql, self._params = sql, params
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, params)
+        finally:
+            self._elapsed = time.perf_counter() - started
+
+    def executemany(self, sql, seq_of_params):
+        self._finish()
+        self._sql, self._params = sql, ()
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_params)
+        finally:
+            self._elapsed = time.perf_counter() - started
+            self._finish()
+
+    def fetchone(self):
+        return self._timed(super().fetchone)
+
+    def fetchmany(self, size=None):
+        return self._timed(super().fetchmany, size if size is not None else self.arraysize)
+
+    def fetchall(self):
+        try:
+            return self._timed(super().fetchall)
+        finally:
+            self._finish()
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def _timed(self, fetch, *args):
+        started = time.perf_counter()
+        try:
+            return fetch(*args)
+        finally:
+            self._elapsed += time.perf_counter() - started
+
+    def _finish(self):
+        # A statement is recorded once it is complete: when it has been
+        # fetched in full, or when the cursor moves on to another statement.
+        if self._sql is not None:
+            sql, params, elapsed = self._sql, self._params, self._elapsed
+            self._sql = None
+            _record_query(sql, params, elapsed, self._explain)
+
+    def __del__(self):
+        self._finish()
+
+
+class InstrumentedCursor(_TimedCursor, sqlite3.Cursor):
+    """A sqlite3 cursor that times every statement."""
+
+    def _explain(self, sql, params):
+        # Use the plain sqlite3 execute so the plan lookup is not itself measured.
+        rows = sqlite3.Connection.execute(self.connection, f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+        return [row[-1] for row in rows]
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """
+    A sqlite3 connection whose cursors are instrumented. Pass it as the
+    `factory` argument to sqlite3.connect().
+    """
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, seq_of_params):
+        return self.cursor().executemany(sql, seq_of_params)
+
+
+@functools.lru_cache(maxsize=None)
+def instrumented_postgres_cursor(base):
+    """
+    An instrumented subclass of a psycopg2 cursor class (the PostgreSQL
+    backend uses DictCursor). Pass it as the connection's cursor_factory.
+    """
+
+    class InstrumentedPostgresCursor(_TimedCursor, base):
+
+        def _explain(self, sql, params):
+            # A plain cursor, so the plan lookup is not itself measured; the
+            # savepoint keeps a failed EXPLAIN from aborting the caller's transaction.
+            with self.connection.cursor(cursor_factory=base) as cursor:
+                cursor.execute("SAVEPOINT arise_explain")
+                try:
+                    cursor.execute(f"EXPLAIN {sql}", params)
+                    rows = cursor.fetchall()
+                except Exception:
+                    cursor.execute("ROLLBACK TO SAVEPOINT arise_explain")
+                    raise
+                finally:
+                    cursor.execute("RELEASE SAVEPOINT arise_explain")
+            return [row[0] for row in rows]
+
+    return InstrumentedPostgresCursor
+
+
+def init_app(app):
+    """Installs the request hooks and the /metrics endpoint on the app."""
+    global slow_query_threshold
+    slow_query_threshold = app.config.get('SLOW_QUERY_MS', 100) / 1000
+
+    @app.before_request
+    def _start_request_timer():
+        g.metrics_started = time.perf_counter()
+        _request_stats.current = [0, 0.0]
+
+    @app.after_request
+    def _record_request(response):
+        stats = getattr(_request_stats, 'current', None)
+        started = g.pop('metrics_started', None)
+        if stats is None or started is None:
+            return response
+        elapsed = time.perf_counter() - started
+        endpoint = request.endpoint or 'unmatched'
+        REQUEST_LATENCY.observe(elapsed, endpoint, request.method)
+        REQUEST_COUNT.inc(endpoint, request.method, str(response.status_code))
+        REQUEST_QUERIES.observe(stats[0], endpoint)
+        REQUEST_SQL_TIME.observe(stats[1], endpoint)
+        # Lets the browser's dev tools show where a request's time went.
+        response.headers['Server-Timing'] = (
+            f'db;dur={stats[1] * 1000:.2f};desc="{stats[0]} queries", total;dur={elapsed * 1000:.2f}')
+        return response
+
+    @app.teardown_request
+    def _clear_request_stats(exc):
+        _request_stats.current = None
+
+    @app.route('/metrics')
+    def metrics_endpoint():
+        lines = []
+        for metric in ALL_METRICS:
+            lines.extend(metric.render())
+        return Response('\n'.join(lines) + '\n', mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,157 @@
+# =================================================================
+#   A.R.I.S.E. Low-Attendance Notifications
+#   - Finds students below DEFAULTER_THRESHOLD percent in any course and
+#     emails each of them one digest listing those courses.
+#   - Every digest is logged in the 'notifications' table under its
+#     period (the ISO week), so later runs in the same week only pick up
+#     students who have newly fallen below the threshold, and nobody is
+#     mailed twice. The MailQueue (mailer.py) does the sending.
+# =================================================================
+
+import datetime
+import threading
+
+import storage
+from mailer import FAILED, QUEUED, REJECTED, SENDING, SENT
+
+KIND = 'defaulter_digest'
+
+
+def current_period(today=None):
+    """The digest period a run belongs to: the ISO week, e.g. '2026-W43'."""
+    year, week, _ = (today or datetime.date.today()).isocalendar()
+    return f'{year}-W{week:02d}'
+
+
+def find_defaulters(conn, threshold, period):
+    """
+    Returns {student_id: (student_row, [course_row, ...])} for every student
+    below `threshold` percent in at least one course who has not yet been
+    sent (or queued) this period's digest. One pass over enrollments,
+    sessions and attendance.
+    """
+    rows = conn.execute("""
+        SELECT st.id AS student_id, st.student_name, st.email1, st.email2,
+               c.course_name, COUNT(DISTINCT se.id) AS total_sessions, COUNT(DISTINCT ar.session_id) AS present_count
+        FROM enrollments e
+        JOIN students st ON st.id = e.student_id AND st.deleted_at IS NULL
+        JOIN courses c ON c.id = e.course_id AND c.deleted_at IS NULL
+        JOIN sessions se ON se.course_id = e.course_id
+        LEFT JOIN attendance_records ar ON ar.session_id = se.id AND ar.student_id = e.student_id
+        WHERE NOT EXISTS (SELECT 1 FROM notifications n
+                          WHERE n.kind = ? AND n.period = ? AND n.student_id = e.student_id)
+        GROUP BY st.id, st.student_name, st.email1, st.email2, c.id, c.course_name
+        HAVING COUNT(DISTINCT ar.session_id) * 100 < ? * COUNT(DISTINCT se.id)
+        ORDER BY st.id, c.course_name
+    """, (KIND, period, threshold)).fetchall()
+
+    defaulters = {}
+    for row in rows:
+        defaulters.setdefault(row['student_id'], (row, []))[1].append(row)
+    return defaulters
+
+
+def render_digest(student, courses, threshold):
+    """The subject and plain-text body of one student's digest."""
+    lines = [f"Dear {student['student_name']},", "",
+             f"Your attendance is below the required {threshold}% in the following course(s):", ""]
+    for course in courses:
+        percentage = course['present_count'] * 100 // course['total_sessions']
+        lines.append(f"  - {course['course_name']}: {course['present_count']} of "
+                     f"{course['total_sessions']} sessions attended ({percentage}%)")
+    lines += ["", "Please attend the upcoming sessions regularly. If you believe this is a",
+              "mistake, contact your course teacher.", "", "A.R.I.S.E. Attendance System"]
+    subject = f"Low attendance in {len(courses)} course(s)"
+    return subject, "\n".join(lines)
+
+
+def queue_digests(conn, threshold, period=None):
+    """
+    Logs a digest for every new defaulter with an email address and returns
+    the ids of the rows to send, including any that failed with temporary
+    errors earlier this period (rejected ones are not retried). The caller
+    commits and hands the ids to a MailQueue.
+    """
+    period = period or current_period()
+    # The write lock up front keeps two admin workers from queueing the same digest.
+    conn.execute("BEGIN IMMEDIATE")
+    retry_ids = [row['id'] for row in conn.execute(
+        "SELECT id FROM notifications WHERE kind = ? AND period = ? AND status = ?",
+        (KIND, period, FAILED)).fetchall()]
+    if retry_ids:
+        conn.execute(f"UPDATE notifications SET status = ?, attempts = 0 WHERE id IN ({','.join(['?'] * len(retry_ids))})",
+                     [QUEUED] + retry_ids)
+
+    queued_ids = []
+    now = storage.now_epoch()
+    for student_id, (student, courses) in find_defaulters(conn, threshold, period).items():
+        recipients = [email.strip() for email in (student['email1'], student['email2']) if email and email.strip()]
+        if not recipients:
+            continue
+        subject, body = render_digest(student, courses, threshold)
+        queued_ids.append(conn.insert("""
+            INSERT INTO notifications (kind, student_id, period, recipients, subject, body, status, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, (KIND, student_id, period, ', '.join(dict.fromkeys(recipients)), subject, body, QUEUED, now)))
+    return retry_ids + queued_ids
+
+
+def period_summary(conn, period=None):
+    """How many digests of a period are queued, being sent, sent, failed and rejected."""
+    period = period or current_period()
+    counts = {QUEUED: 0, SENDING: 0, SENT: 0, FAILED: 0, REJECTED: 0}
+    for row in conn.execute("SELECT status, COUNT(*) AS count FROM notifications WHERE kind = ? AND period = ? GROUP BY status",
+                            (KIND, period)).fetchall():
+        counts[row['status']] = row['count']
+    return {"period": period, **counts}
+
+
+class DefaulterNotifier:
+    """
+    Queues defaulter digests every `interval` seconds.
+
+    `connect` is a callable returning a new database connection;
+    `mail_queue` is the MailQueue that sends them.
+    """
+
+    def __init__(self, connect, mail_queue, threshold=75, interval=6 * 3600):
+        self._connect = connect
+        self._mail_queue = mail_queue
+        self._threshold = threshold
+        self._interval = interval
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='arise-defaulter-notifier', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        if self._thread:
+            self._thread.join()
+
+    def _run(self):
+        while not self._stopping.wait(self._interval):
+            try:
+                self.run()
+            except Exception as e:
+                # Most likely the database was busy; nothing was queued, the next run tries again.
+                print(f"Queueing low-attendance notifications failed: {e}")
+
+    def run(self):
+        """Queues this period's outstanding digests. Returns how many were queued."""
+        with self._lock:
+            conn = self._connect()
+            try:
+                ids = queue_digests(conn, self._threshold)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                conn.close()
+        for notification_id in ids:
+            self._mail_queue.put(notification_id)
+        return len(ids)
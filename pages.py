@@ -0,0 +1,39 @@
+# =================================================================
+#   A.R.I.S.E. Page Routes
+#   - Serves the HTML files for the admin, teacher and student interfaces.
+# =================================================================
+
+from flask import Blueprint, make_response, render_template, request
+
+bp = Blueprint('pages', __name__)
+
+
+def render_page(template):
+    """
+    Renders a page with an ETag. The page links its scripts and styles by
+    fingerprinted URL, so browsers revalidate the (small) HTML each time and
+    get a 304 until it or one of its assets changes.
+    """
+    response = make_response(render_template(template))
+    response.add_etag()
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+# These functions simply return the HTML files for our interfaces.
+
+@bp.route('/')
+def teacher_page_redirect():
+    # The main page will be the Teacher Login
+    return render_page('teacher.html') # Points to the prototype for now
+
+@bp.route('/admin-login')
+def admin_login_page():
+    return render_page('admin-login.html')
+
+@bp.route('/admin')
+def admin_page():
+    return render_page('admin.html') # The JS on this page will handle token security
+
+@bp.route('/student')
+def student_page():
+    return render_page('student.html') # Points to the prototype for now
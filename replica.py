@@ -0,0 +1,198 @@
+# =================================================================
+#   A.R.I.S.E. Snapshot Read Replica
+#   - Student dashboards, admin lists and reports are read-only and can
+#     be heavy. With READ_REPLICA on, they read from a recent copy of
+#     attendance.db instead of the file the scan endpoints write to.
+#   - Copies are made with SQLite's online backup API, so each one is a
+#     consistent snapshot, taken without stopping the server. The primary
+#     is switched to WAL mode, so the copy's read transaction runs
+#     alongside the scan writers instead of holding them up.
+#   - A snapshot is only used while it is younger than the staleness
+#     bound and no write that readers must see (an admin change, a session
+#     starting or ending) has happened since. Otherwise reads go to the
+#     primary database until the next snapshot is ready.
+#   - Every worker process keeps its own snapshots in the shared
+#     directory, named snapshot-<pid>-<token>-<n>.db, and only ever
+#     removes its own files and those left behind by dead processes.
+# =================================================================
+
+import glob
+import os
+import re
+import sqlite3
+import threading
+import time
+import uuid
+
+import storage
+
+_SNAPSHOT_NAME = re.compile(r'snapshot-(\d+)-([0-9a-f]+)-\d+\.db$')
+
+# Tokens of the replicas running in this process. A file with our pid and
+# any other token was left by an earlier process that had the same pid.
+_live_tokens = set()
+
+
+class SnapshotReplica:
+    """
+    Keeps a fresh snapshot of the SQLite database at `source_path`.
+
+    Snapshots are written to `snapshot_dir` as new files, so readers of the
+    previous one are never disturbed; the file before that is removed.
+    A new snapshot is taken every `max_staleness / 2` seconds, and soon
+    after invalidate(), but never more often than every `min_interval`
+    seconds.
+    """
+
+    def __init__(self, source_path, snapshot_dir, max_staleness=30, pool_size=8,
+                 factory=sqlite3.Connection, min_interval=2):
+        self._source_path = source_path
+        self._snapshot_dir = snapshot_dir
+        self._max_staleness = max_staleness
+        self._pool_size = pool_size
+        self._factory = factory
+        self._min_interval = min_interval
+
+        self._lock = threading.Lock()
+        self._backend = None
+        self._taken_at = None  # time.monotonic() when the current snapshot was started
+        self._invalidated_at = float('-inf')
+        self._generation = 0
+        self._token = uuid.uuid4().hex
+        self._files = []  # snapshot files, oldest first
+
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._thread = None
+
+    def start(self):
+        """Starts the refresh thread. Reads use the primary until the first snapshot exists."""
+        os.makedirs(self._snapshot_dir, exist_ok=True)
+        self._enable_wal()
+        _live_tokens.add(self._token)
+        # Leftovers from an earlier run are never reused. Other workers'
+        # snapshots are in use, so only those of dead processes go.
+        for path in glob.glob(os.path.join(self._snapshot_dir, 'snapshot-*.db')):
+            if _is_orphan(path):
+                self._remove(path)
+        self._thread = threading.Thread(target=self._run, name='arise-read-replica', daemon=True)
+        self._thread.start()
+
+    def _enable_wal(self):
+        # WAL mode is stored in the database file, so this is a no-op after the first start.
+        source = sqlite3.connect(self._source_path, timeout=30)
+        try:
+            mode = source.execute("PRAGMA journal_mode = WAL").fetchone()[0]
+        finally:
+            source.close()
+        if mode != 'wal':
+            print(f"Could not switch {self._source_path} to WAL mode ({mode}); "
+                  "snapshots will hold up writers while they are taken.")
+
+    def stop(self):
+        self._stopping = True
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join()
+        with self._lock:
+            if self._backend:
+                self._backend.close()
+            stale_files, self._files = self._files, []
+        for stale in stale_files:
+            self._remove(stale)
+        _live_tokens.discard(self._token)
+
+    def is_fresh(self):
+        taken_at = self._taken_at
+        return (taken_at is not None and taken_at > self._invalidated_at
+                and time.monotonic() - taken_at <= self._max_staleness)
+
+    def connect(self):
+        """A connection to the current snapshot, or None if there is no fresh one."""
+        if not self.is_fresh():
+            return None
+        backend = self._backend
+        try:
+            return backend.connect()
+        except storage.PoolClosedError:
+            # A newer snapshot replaced this one just now; the caller uses the primary.
+            return None
+
+    def invalidate(self):
+        """Stops using the current snapshot, e.g. because readers must see a write that was just made."""
+        self._invalidated_at = time.monotonic()
+        self._wakeup.set()
+
+    # -- Refreshing ------------------------------------------------
+
+    def _run(self):
+        while not self._stopping:
+            try:
+                self.refresh()
+            except Exception as e:
+                # Reads fall back to the primary until a snapshot succeeds.
+                print(f"Could not snapshot the database for the read replica: {e}")
+            # Sleep until half the staleness bound has passed, or until invalidated...
+            self._wakeup.wait(self._max_staleness / 2)
+            self._wakeup.clear()
+            # ...but give the primary a breather between snapshots.
+            time.sleep(self._min_interval)
+
+    def refresh(self):
+        """Takes a new snapshot and switches readers over to it."""
+        self._generation += 1
+        path = os.path.join(self._snapshot_dir, f'snapshot-{os.getpid()}-{self._token}-{self._generation}.db')
+        taken_at = time.monotonic()
+
+        source = sqlite3.connect(self._source_path)
+        target = sqlite3.connect(path)
+        try:
+            # One step, so the snapshot is consistent (a paged copy restarts on
+            # every write). In WAL mode it is a plain read transaction: writers
+            # carry on while it runs.
+            source.backup(target)
+            # The copy inherits WAL mode; readers of a snapshot need no -wal/-shm files.
+            target.execute("PRAGMA journal_mode = DELETE")
+        finally:
+            target.close()
+            source.close()
+
+        backend = storage.SQLiteBackend(path, pool_size=self._pool_size, factory=self._factory)
+        with self._lock:
+            previous, self._backend = self._backend, backend
+            self._taken_at = taken_at
+            self._files.append(path)
+            stale_files, self._files = self._files[:-2], self._files[-2:]
+        if previous:
+            # Connections still reading the previous snapshot finish normally.
+            previous.close()
+        for stale in stale_files:
+            self._remove(stale)
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def _is_orphan(path):
+    """True for a snapshot file no running replica can be using."""
+    match = _SNAPSHOT_NAME.search(os.path.basename(path))
+    if match is None:
+        return True  # the single-process naming of older versions
+    pid, token = int(match.group(1)), match.group(2)
+    if pid == os.getpid():
+        return token not in _live_tokens
+    return not _pid_alive(pid)
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True  # exists, owned by another user
+    return True
@@ -0,0 +1,182 @@
+# =================================================================
+#   A.R.I.S.E. Reports
+#   - Loads the attendance matrix for a session's course.
+#   - Renders it as an Excel workbook for download.
+#   Shared by the live report endpoint and the background export jobs.
+# =================================================================
+
+import datetime
+import hashlib
+import io
+
+import storage
+
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+
+def parse_time_range(args):
+    """
+    Reads the optional `from` / `to` filters of a report request and returns
+    them as (start, end) epoch seconds, either of which may be None. Values
+    can be dates (2025-09-01), date-times (2025-09-01T09:00:00+05:30) or
+    epoch seconds. A plain `to` date includes that whole day.
+    Raises ValueError for values that cannot be parsed.
+    """
+    def parse(name, whole_day_end):
+        value = args.get(name)
+        if value in (None, ''):
+            return None
+        value = str(value).strip()
+        if value.lstrip('-').isdigit():
+            return int(value)
+        try:
+            parsed = datetime.datetime.fromisoformat(value)
+        except ValueError:
+            raise ValueError(f"'{name}' must be a date, an ISO date-time or epoch seconds") from None
+        if whole_day_end and len(value) == 10:
+            parsed += datetime.timedelta(days=1)
+        return storage.to_epoch(parsed)
+
+    start = parse('from', False)
+    end = parse('to', True)
+    if start is not None and end is not None and start >= end:
+        raise ValueError("'from' must be before 'to'")
+    return start, end
+
+
+def time_range_condition(column, start, end):
+    """SQL condition and parameters limiting `column` to the half-open range [start, end)."""
+    conditions, params = [], []
+    if start is not None:
+        conditions.append(f"{column} >= ?")
+        params.append(start)
+    if end is not None:
+        conditions.append(f"{column} < ?")
+        params.append(end)
+    return ''.join(f" AND {condition}" for condition in conditions), params
+
+
+def load_session_report(conn, session_id, start=None, end=None):
+    """
+    Returns the report data for the course of the given session, or None if
+    the session does not exist. Only sessions up to and including the given
+    one are part of the report, optionally narrowed to those starting in
+    [start, end) (epoch seconds).
+    """
+    course = conn.execute("""
+        SELECT c.id, c.course_name, s.start_time FROM sessions s JOIN courses c ON s.course_id = c.id
+        WHERE s.id = ? AND c.deleted_at IS NULL
+    """, (session_id,)).fetchone()
+    if not course:
+        return None
+
+    # Get all students enrolled in this course
+    students = conn.execute("""
+        SELECT s.id, s.student_name, s.university_roll_no, s.enrollment_no, e.class_roll_id
+        FROM students s
+        JOIN enrollments e ON s.id = e.student_id
+        WHERE e.course_id = ? AND s.deleted_at IS NULL ORDER BY e.class_roll_id
+    """, (course['id'],)).fetchall()
+
+    # Sessions for this course, up to and including the current one. Start times
+    # are epoch integers, so this is a range scan on idx_sessions_course_start.
+    range_sql, range_params = time_range_condition('start_time', start, end)
+    sessions = conn.execute(f"""
+        SELECT id, start_time FROM sessions
+        WHERE course_id = ? AND start_time <= ?{range_sql}
+        ORDER BY start_time
+    """, [course['id'], course['start_time']] + range_params).fetchall()
+
+    # Attendance records for the same sessions, found through the same index
+    range_sql, range_params = time_range_condition('s.start_time', start, end)
+    records_cursor = conn.execute(f"""
+        SELECT ar.session_id, ar.student_id FROM attendance_records ar
+        JOIN sessions s ON ar.session_id = s.id
+        WHERE s.course_id = ? AND s.start_time <= ?{range_sql}
+    """, [course['id'], course['start_time']] + range_params).fetchall()
+    # Create a fast lookup set for presence check: (session_id, student_id)
+    present_set = set((rec['session_id'], rec['student_id']) for rec in records_cursor)
+
+    return {
+        "course_id": course['id'],
+        "course_name": course['course_name'],
+        "students": students,
+        "sessions": sessions,
+        "present_set": present_set,
+    }
+
+
+def session_report_cache_key(conn, params):
+    """
+    A cheap fingerprint of everything the report depends on. If it has not
+    changed, a previously generated export can be served again as-is.
+
+    The course and roster columns shown in the report are hashed as they
+    are, since renames, soft-deletes and re-enrollments keep the counts the
+    same. Sessions and records only ever get new ids (AUTOINCREMENT), so a
+    count and the highest id stand in for them.
+    """
+    row = conn.execute("""
+        SELECT
+            s.course_id, c.course_name, c.deleted_at,
+            (SELECT COUNT(*) || ':' || COALESCE(MAX(id), 0) || ':' || COALESCE(SUM(start_time), 0)
+                FROM sessions WHERE course_id = s.course_id) AS sessions,
+            (SELECT COUNT(*) || ':' || COALESCE(MAX(ar.id), 0) FROM attendance_records ar
+                JOIN sessions s2 ON ar.session_id = s2.id WHERE s2.course_id = s.course_id) AS records
+        FROM sessions s JOIN courses c ON c.id = s.course_id WHERE s.id = ?
+    """, (params['session_id'],)).fetchone()
+    if not row:
+        return None
+    roster = conn.execute("""
+        SELECT st.id, e.class_roll_id, st.student_name, st.university_roll_no, st.enrollment_no, st.deleted_at
+        FROM enrollments e JOIN students st ON st.id = e.student_id
+        WHERE e.course_id = ? ORDER BY st.id
+    """, (row['course_id'],)).fetchall()
+    digest = hashlib.sha1(repr((row['course_name'], row['deleted_at'],
+                                [tuple(student) for student in roster])).encode()).hexdigest()
+    return f"{digest}|{row['sessions']}|{row['records']}"
+
+
+def render_session_report_xlsx(report):
+    """Builds the .xlsx file for a report and returns its raw bytes."""
+    # openpyxl is slow to import and only needed here, so it is loaded on the
+    # first export instead of by every worker at startup.
+    from openpyxl import Workbook
+    from openpyxl.styles import Font, Alignment
+
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "Attendance Report"
+
+    # Header Row: session dates in server-local time, like the rest of the app.
+    headers = ["Class Roll ID", "Student Name", "University Roll No."] + [datetime.datetime.fromtimestamp(s['start_time']).strftime('%d-%b-%Y') for s in report['sessions']]
+    ws.append(headers)
+    for cell in ws[1]:
+        cell.font = Font(bold=True)
+        cell.alignment = Alignment(horizontal='center')
+
+    # Data Rows
+    present_set = report['present_set']
+    for student in report['students']:
+        row_data = [student['class_roll_id'], student['student_name'], student['university_roll_no']]
+        for session in report['sessions']:
+            if (session['id'], student['id']) in present_set:
+                row_data.append("P")
+            else:
+                row_data.append("A")
+        ws.append(row_data)
+
+    # Save to an in-memory stream
+    in_memory_file = io.BytesIO()
+    wb.save(in_memory_file)
+    return in_memory_file.getvalue()
+
+
+def export_session_report_job(conn, params):
+    """Background job handler: returns (download_name, mimetype, data)."""
+    report = load_session_report(conn, params['session_id'], params.get('from'), params.get('to'))
+    if report is None:
+        raise LookupError("Session not found")
+    data = render_session_report_xlsx(report)
+    download_name = f"Attendance_Report_{report['course_name']}_{datetime.date.today()}.xlsx"
+    return download_name, XLSX_MIMETYPE, data
@@ -0,0 +1,247 @@
+# =================================================================
+#   A.R.I.S.E. Response Layer
+#   - Fast JSON: handlers return database rows as they are, and they are
+#     encoded with orjson when it is installed. By default each row is an
+#     object, as before. Lists of rows (the whole response, or the values of
+#     a response object) are sent columnar when the client asks for
+#     ?rows=columns: the column names once, then each row as a plain array,
+#     with no per-row dict built along the way. The browser UIs always ask.
+#   - Compression: large JSON/HTML/JS/CSS responses are sent gzip or
+#     brotli compressed, whichever the client accepts.
+#   - Static assets: asset_url() adds a content-hash fingerprint to the
+#     URL, and fingerprinted URLs are cached by browsers for a year.
+# =================================================================
+
+import datetime
+import decimal
+import gzip
+import hashlib
+import os
+import threading
+import uuid
+
+from flask import has_request_context, request, url_for
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.http import http_date
+from werkzeug.security import safe_join
+
+try:
+    import orjson
+except ImportError:  # The standard library encoder is used instead.
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # Only gzip is offered then.
+    brotli = None
+
+COMPRESSIBLE_MIMETYPES = {
+    'application/json', 'text/html', 'text/css', 'text/plain',
+    'text/javascript', 'application/javascript',
+}
+
+
+# =================================================================
+#   JSON
+# =================================================================
+
+def _is_row(o):
+    # sqlite3.Row and psycopg2's DictRow.
+    return hasattr(o, 'keys') and not isinstance(o, dict)
+
+
+def columnar(rows):
+    """A list of rows as {"columns": [...], "rows": [[...], ...]}."""
+    return {"columns": list(rows[0].keys()) if rows else [], "rows": [tuple(row) for row in rows]}
+
+
+def _is_row_list(o):
+    return isinstance(o, list) and o and _is_row(o[0])
+
+
+def _columnar_lists(obj):
+    """Makes the lists of rows in a response columnar, at the top level or one object down."""
+    if _is_row_list(obj):
+        return columnar(obj)
+    if isinstance(obj, dict):
+        return {key: columnar(value) if _is_row_list(value) else value for key, value in obj.items()}
+    return obj
+
+
+def _default(o):
+    """Encodes the values neither orjson nor the json module know about."""
+    if _is_row(o):
+        # Encoded as an object, like dict(row).
+        return dict(zip(o.keys(), o))
+    if isinstance(o, datetime.date):
+        # Same format Flask's own encoder has always produced.
+        return http_date(o)
+    if isinstance(o, (set, frozenset)):
+        return list(o)
+    if isinstance(o, (decimal.Decimal, uuid.UUID)):
+        return str(o)
+    if hasattr(o, '__html__'):
+        return str(o.__html__())
+    # Subclasses of the basic types (orjson passes them through to here).
+    for base in (str, int, float, list, tuple, dict):
+        if isinstance(o, base):
+            return base(o)
+    raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
+
+
+class AriseJSONProvider(DefaultJSONProvider):
+    """
+    Flask's JSON provider, but encoding with orjson when available and
+    accepting database rows and sets as they come from the queries.
+    """
+
+    default = staticmethod(_default)
+
+    _ORJSON_OPTIONS = 0
+    if orjson is not None:
+        # Dates and row subclasses go through _default, so the output matches
+        # what the standard encoder gives.
+        _ORJSON_OPTIONS = (orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS
+                           | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_SUBCLASS)
+
+    def _encode(self, obj, indent=False):
+        if orjson is None:
+            kwargs = {'indent': 2} if indent else {'separators': (',', ':')}
+            return super().dumps(obj, **kwargs).encode('utf-8')
+        options = self._ORJSON_OPTIONS | (orjson.OPT_INDENT_2 if indent else 0)
+        return orjson.dumps(obj, default=_default, option=options)
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None or kwargs:
+            return super().dumps(obj, **kwargs)
+        return self._encode(obj).decode('utf-8')
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        if has_request_context() and request.args.get('rows') == 'columns':
+            obj = _columnar_lists(obj)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        # The body goes out as bytes, skipping the str round trip of the default provider.
+        return self._app.response_class(self._encode(obj, indent) + b"\n", mimetype=self.mimetype)
+
+
+# =================================================================
+#   Compression
+# =================================================================
+
+# Compressed static files, keyed by (path, etag, encoding). Static files only
+# change on deploy, so each one is compressed once per encoding.
+_static_cache = {}
+_static_cache_lock = threading.Lock()
+
+
+def _choose_encoding():
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br']:
+        return 'br'
+    if accepted['gzip']:
+        return 'gzip'
+    return None
+
+
+def _compress(data, encoding, config):
+    if encoding == 'br':
+        return brotli.compress(data, quality=config['BROTLI_QUALITY'])
+    return gzip.compress(data, compresslevel=config['GZIP_LEVEL'])
+
+
+def compress_response(response, config):
+    """Compresses a finished response in place if it is worth it."""
+    if (response.status_code != 200 or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+        return response
+    # Files (send_file / static) are compressible once read; generators are left alone.
+    if response.is_streamed and not response.direct_passthrough:
+        return response
+    size = response.content_length
+    if size is None:
+        size = len(response.get_data())
+    if size < config['COMPRESS_MIN_SIZE']:
+        return response
+
+    response.vary.add('Accept-Encoding')
+    encoding = _choose_encoding()
+    if encoding is None:
+        return response
+
+    etag, _ = response.get_etag()
+    cache_key = (request.path, etag, encoding) if response.direct_passthrough and etag else None
+    compressed = _static_cache.get(cache_key) if cache_key else None
+
+    body = response.response
+    if compressed is None:
+        response.direct_passthrough = False
+        data = response.get_data()
+        compressed = _compress(data, encoding, config)
+        if len(compressed) >= len(data):
+            return response
+        if cache_key:
+            with _static_cache_lock:
+                _static_cache[cache_key] = compressed
+    if hasattr(body, 'close'):
+        body.close()
+
+    response.direct_passthrough = False
+    response.set_data(compressed)
+    response.headers['Content-Encoding'] = encoding
+    if etag:
+        # Still the same resource, just not byte-for-byte: If-None-Match keeps working.
+        response.set_etag(etag, weak=True)
+    return response
+
+
+# =================================================================
+#   Fingerprinted static assets
+# =================================================================
+
+_fingerprints = {}
+
+
+def asset_fingerprint(static_folder, filename):
+    """A short content hash of a static file, recomputed only when the file changes."""
+    path = safe_join(static_folder, filename)
+    if path is None:
+        return None
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    key = (path, stat.st_mtime_ns, stat.st_size)
+    fingerprint = _fingerprints.get(key)
+    if fingerprint is None:
+        with open(path, 'rb') as f:
+            fingerprint = hashlib.sha256(f.read()).hexdigest()[:12]
+        _fingerprints[key] = fingerprint
+    return fingerprint
+
+
+def init_app(app):
+    """Installs the JSON provider, compression and the asset_url() template helper."""
+    app.json = AriseJSONProvider(app)
+
+    @app.template_global()
+    def asset_url(filename):
+        """URL of a static file, e.g. asset_url('js/admin.js') -> /static/js/admin.js?v=3f2a..."""
+        fingerprint = asset_fingerprint(app.static_folder, filename)
+        if fingerprint is None:
+            return url_for('static', filename=filename)
+        return url_for('static', filename=filename, v=fingerprint)
+
+    @app.after_request
+    def finish_response(response):
+        if request.endpoint == 'static' and response.status_code in (200, 304):
+            version = request.args.get('v')
+            if version and version == asset_fingerprint(app.static_folder, request.view_args['filename']):
+                # The URL changes whenever the file does, so this copy never goes stale.
+                response.cache_control.no_cache = None
+                response.cache_control.public = True
+                response.cache_control.max_age = app.config['STATIC_MAX_AGE']
+                response.cache_control.immutable = True
+        if app.config['COMPRESS_MIN_SIZE'] is not None:
+            compress_response(response, app.config)
+        return response
@@ -0,0 +1,132 @@
+# =================================================================
+#   A.R.I.S.E. Session Expiry Scheduler
+#   - Closes sessions exactly at their end_time, so a forgotten session
+#     does not keep accepting scans.
+#   - Keeps a heap of (end time, session) entries and a single thread that
+#     sleeps until the earliest one is due. Request handlers never have to
+#     check the clock themselves.
+# =================================================================
+
+import datetime
+import heapq
+import itertools
+import threading
+
+import storage
+
+
+def to_timestamp(value):
+    """
+    Converts a session time to a POSIX timestamp. Stored times already are
+    epoch seconds; datetime objects and ISO strings are accepted too, with
+    naive values treated as server-local time.
+    """
+    return storage.to_epoch(value)
+
+
+class SessionExpiryScheduler:
+    """
+    Deactivates sessions when their end time is reached.
+
+    `connect` is a callable returning a new database connection.
+    `on_expire(session_id)` is called after a session has been closed by the
+    scheduler, e.g. to send the session_ended signal.
+    """
+
+    def __init__(self, connect, on_expire=None):
+        self._connect = connect
+        self._on_expire = on_expire
+        self._heap = []
+        # The currently scheduled end time for each session. Heap entries that
+        # no longer match (because the session was extended or cancelled) are
+        # stale and are skipped when they reach the top.
+        self._deadlines = {}
+        self._counter = itertools.count()
+        self._wakeup = threading.Condition()
+        self._thread = None
+        self._stopping = False
+
+    def start(self):
+        """Schedules every session that is currently active, then starts the timer thread."""
+        conn = self._connect()
+        try:
+            active = conn.execute("SELECT id, end_time FROM sessions WHERE is_active = 1 AND end_time IS NOT NULL").fetchall()
+        finally:
+            conn.close()
+        for session in active:
+            self.schedule(session['id'], session['end_time'])
+
+        self._thread = threading.Thread(target=self._run, name='arise-session-expiry', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._wakeup:
+            self._stopping = True
+            self._wakeup.notify()
+        if self._thread:
+            self._thread.join()
+
+    def schedule(self, session_id, end_time):
+        """Schedules (or reschedules) a session to be closed at end_time."""
+        deadline = to_timestamp(end_time)
+        with self._wakeup:
+            self._deadlines[session_id] = deadline
+            heapq.heappush(self._heap, (deadline, next(self._counter), session_id))
+            # Only wake the timer thread if this is now the earliest deadline.
+            if self._heap[0][2] == session_id:
+                self._wakeup.notify()
+
+    def cancel(self, session_id):
+        """Forgets a session, e.g. because the teacher ended it by hand."""
+        with self._wakeup:
+            self._deadlines.pop(session_id, None)
+
+    def _run(self):
+        while True:
+            with self._wakeup:
+                while not self._stopping:
+                    self._discard_stale()
+                    if not self._heap:
+                        self._wakeup.wait()
+                        continue
+                    delay = self._heap[0][0] - datetime.datetime.now().timestamp()
+                    if delay <= 0:
+                        break
+                    self._wakeup.wait(delay)
+                if self._stopping:
+                    return
+                deadline, _, session_id = heapq.heappop(self._heap)
+                del self._deadlines[session_id]
+            # Do the database work outside the lock so schedule() never waits on it.
+            self._expire(session_id)
+
+    def _discard_stale(self):
+        while self._heap:
+            deadline, _, session_id = self._heap[0]
+            if self._deadlines.get(session_id) == deadline:
+                return
+            heapq.heappop(self._heap)
+
+    def _expire(self, session_id):
+        conn = self._connect()
+        try:
+            # The end_time check keeps us from closing a session another worker has
+            # extended since we scheduled it; only that worker's heap knows.
+            closed = conn.execute("UPDATE sessions SET is_active = 0 WHERE id = ? AND is_active = 1 AND end_time <= ?",
+                                  (session_id, storage.now_epoch()))
+            conn.commit()
+            extended = None
+            if not closed.rowcount:
+                extended = conn.execute("SELECT end_time FROM sessions WHERE id = ? AND is_active = 1",
+                                        (session_id,)).fetchone()
+        except Exception as e:
+            # Most likely the database was locked by a burst of scans; try again shortly.
+            print(f"Could not expire session {session_id}, retrying: {e}")
+            self.schedule(session_id, datetime.datetime.now() + datetime.timedelta(seconds=5))
+            return
+        finally:
+            conn.close()
+        if extended is not None and extended['end_time'] is not None:
+            self.schedule(session_id, extended['end_time'])
+        elif closed.rowcount and self._on_expire:
+            self._on_expire(session_id)
@@ -0,0 +1,23 @@
+# =================================================================
+#   A.R.I.S.E. Signals
+#   - Named events that other parts of the server can subscribe to,
+#     e.g. to invalidate cached data when a session starts or ends.
+#   - Built on blinker, the same signal library Flask itself uses.
+# =================================================================
+
+from blinker import Namespace
+
+_signals = Namespace()
+
+# Every signal is sent by the app with tenant=<tenant name>, or tenant=None in
+# single-tenant mode; receivers that hold per-tenant state should check it.
+
+# Sent with session_id=..., end_time=<epoch seconds> when a teacher starts a session.
+session_started = _signals.signal('session-started')
+
+# Sent with session_id=..., end_time=<epoch seconds> when a session's end time moves.
+session_extended = _signals.signal('session-extended')
+
+# Sent with session_id=..., reason='ended' | 'expired' | 'replaced' when a
+# session stops accepting attendance.
+session_ended = _signals.signal('session-ended')
@@ -66,13 +66,27 @@ document.addEventListener('DOMContentLoaded', () => {
   // --- 4. API HELPER ---
   // This is a powerful, centralized object for all communication with the server.
   // It automatically includes the security token in every request.
+  // Lists are fetched in the compact columnar form (?rows=columns) and turned
+  // back into objects here, so the rest of the page works with plain rows.
+  const fromColumns = (value) =>
+    value && Array.isArray(value.columns) && Array.isArray(value.rows)
+      ? value.rows.map((row) =>
+          Object.fromEntries(value.columns.map((column, i) => [column, row[i]]))
+        )
+      : value;
   const api = {
     get: async (endpoint) => {
-      const response = await fetch(`/api/admin/${endpoint}`, {
-        headers: { Authorization: `Bearer ${token}` },
-      });
+      const separator = endpoint.includes('?') ? '&' : '?';
+      const response = await fetch(
+        `/api/admin/${endpoint}${separator}rows=columns`,
+        { headers: { Authorization: `Bearer ${token}` } }
+      );
       if (response.status === 401) window.location.href = '/admin-login';
-      return response.json();
+      const data = fromColumns(await response.json());
+      if (data && !Array.isArray(data) && typeof data === 'object') {
+        Object.keys(data).forEach((key) => (data[key] = fromColumns(data[key])));
+      }
+      return data;
     },
     post: (endpoint, body) => api.request('POST', endpoint, body),
     put: (endpoint, id, body) => api.request('PUT', `${endpoint}/${id}`, body),
@@ -286,8 +300,20 @@ document.addEventListener('DOMContentLoaded', () => {
       showConfirmationModal(
         `Are you sure you want to delete this ${entity.slice(0, -1)} (#${id})?`,
         async () => {
-          await api.delete(entity, id);
+          const response = await api.delete(entity, id);
           loadDataForCurrentTab();
+          // Semesters, courses and students can be restored for a while after deletion.
+          const result = await response.json().catch(() => ({}));
+          if (response.ok && result.restore_url) {
+            const until = new Date(result.restorable_until).toLocaleTimeString();
+            showConfirmationModal(
+              `Deleted ${entity.slice(0, -1)} #${id}. Undo? (possible until ${until})`,
+              async () => {
+                await api.post(`${entity}/${id}/restore`);
+                loadDataForCurrentTab();
+              }
+            );
+          }
         }
       );
     }
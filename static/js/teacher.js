@@ -18,6 +18,7 @@ document.addEventListener('DOMContentLoaded', () => {
     courseId: null,
     sessionId: null,
     allStudents: [], // The full list of students for the course
+    selectedRolls: new Set(), // Univ. roll numbers ticked for manual marking
     liveUpdateInterval: null, // A handle to the timer for live updates
   };
 
@@ -40,6 +41,8 @@ document.addEventListener('DOMContentLoaded', () => {
   const totalStudentsSpan = document.getElementById('total-students');
   const deviceStatusText = document.getElementById('device-status-text');
   const searchInput = document.getElementById('search-input');
+  const markSelectedButton = document.getElementById('mark-selected-button');
+  const selectAllCheckbox = document.getElementById('select-all-checkbox');
   const unmarkedStudentsTbody = document.querySelector(
     '#unmarked-students-table tbody'
   );
@@ -198,6 +201,7 @@ document.addEventListener('DOMContentLoaded', () => {
         // Session started successfully on the server!
         sessionState.sessionId = data.session_id;
         sessionState.allStudents = data.students;
+        sessionState.selectedRolls.clear();
 
         // Now, prepare and show the live dashboard
         liveCourseName.textContent = setupCourseName.textContent;
@@ -256,6 +260,8 @@ document.addEventListener('DOMContentLoaded', () => {
         const unmarkedStudents = sessionState.allStudents.filter(
           (s) => !markedUnivRollNos.has(s.university_roll_no)
         );
+        // Students marked in the meantime (e.g. by the scanner) drop out of the selection.
+        markedUnivRollNos.forEach((roll) => sessionState.selectedRolls.delete(roll));
 
         renderUnmarkedStudents(unmarkedStudents);
         attendanceCountSpan.textContent = markedUnivRollNos.size;
@@ -287,22 +293,34 @@ document.addEventListener('DOMContentLoaded', () => {
     unmarkedStudentsTbody.innerHTML = '';
     const searchTerm = searchInput.value.toLowerCase();
 
-    students
-      .filter(
-        (s) =>
-          s.student_name.toLowerCase().includes(searchTerm) ||
-          s.class_roll_id.toString().includes(searchTerm)
-      )
-      .forEach((student) => {
-        const row = document.createElement('tr');
-        row.innerHTML = `
+    const shown = students.filter(
+      (s) =>
+        s.student_name.toLowerCase().includes(searchTerm) ||
+        s.class_roll_id.toString().includes(searchTerm)
+    );
+    shown.forEach((student) => {
+      const checked = sessionState.selectedRolls.has(student.university_roll_no) ? 'checked' : '';
+      const row = document.createElement('tr');
+      row.innerHTML = `
+                        <td><input type="checkbox" class="select-student-checkbox" data-univ-roll="${student.university_roll_no}" ${checked} /></td>
                         <td>${student.class_roll_id}</td>
                         <td>${student.student_name}</td>
                         <td>${student.university_roll_no}</td>
                         <td><button class="manual-mark-btn" data-univ-roll="${student.university_roll_no}">Mark Manually</button></td>
                     `;
-        unmarkedStudentsTbody.appendChild(row);
-      });
+      unmarkedStudentsTbody.appendChild(row);
+    });
+    selectAllCheckbox.checked =
+      shown.length > 0 && shown.every((s) => sessionState.selectedRolls.has(s.university_roll_no));
+    updateMarkSelectedButton();
+  }
+
+  function updateMarkSelectedButton() {
+    const count = sessionState.selectedRolls.size;
+    markSelectedButton.disabled = count === 0;
+    markSelectedButton.textContent = count
+      ? `Mark ${count} Selected Manually`
+      : 'Mark Selected Manually';
   }
 
   searchInput.addEventListener('input', () => {
@@ -314,40 +332,80 @@ document.addEventListener('DOMContentLoaded', () => {
 
   // START OF PART 3
 
-  // Event Delegation for the "Mark Manually" buttons within the table
-  unmarkedStudentsTbody.addEventListener('click', async (event) => {
-    if (event.target.classList.contains('manual-mark-btn')) {
-      const univ_roll_no = event.target.dataset.univRoll;
-      const reason = prompt(
-        'Please provide a brief reason for this manual entry:'
-      );
+  // Marks the given students present in one request, with one shared reason.
+  async function markManually(univRollNos) {
+    const reason = prompt(
+      univRollNos.length > 1
+        ? `Please provide a brief reason for marking these ${univRollNos.length} students manually:`
+        : 'Please provide a brief reason for this manual entry:'
+    );
+    if (!reason || reason.trim() === '') return;
 
-      if (reason && reason.trim() !== '') {
-        try {
-          const response = await fetch('/api/teacher/manual-override', {
-            method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({
-              session_id: sessionState.sessionId,
-              univ_roll_no,
-              reason,
-            }),
-          });
-          if (response.ok) {
-            // Immediately update the UI for a responsive feel
-            updateLiveStatus();
-          } else {
-            const errorData = await response.json();
-            alert(`Failed to mark attendance: ${errorData.message}`);
-          }
-        } catch (error) {
-          console.error('Manual override error:', error);
-          alert('A network error occurred.');
+    try {
+      const response = await fetch('/api/teacher/manual-override/bulk', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({
+          session_id: sessionState.sessionId,
+          univ_roll_nos: univRollNos,
+          reason,
+        }),
+      });
+      const data = await response.json();
+      if (response.ok) {
+        univRollNos.forEach((roll) => sessionState.selectedRolls.delete(roll));
+        const failed = data.results.filter(
+          (r) => r.status !== 'marked' && r.status !== 'duplicate'
+        );
+        if (failed.length) {
+          alert(
+            `Could not mark:\n${failed.map((r) => `${r.roll} (${r.status.replace('_', ' ')})`).join('\n')}`
+          );
         }
+        // Immediately update the UI for a responsive feel
+        updateLiveStatus();
+      } else {
+        alert(`Failed to mark attendance: ${data.message}`);
       }
+    } catch (error) {
+      console.error('Manual override error:', error);
+      alert('A network error occurred.');
+    }
+  }
+
+  // Event Delegation for the "Mark Manually" buttons and selection checkboxes within the table
+  unmarkedStudentsTbody.addEventListener('click', async (event) => {
+    if (event.target.classList.contains('manual-mark-btn')) {
+      await markManually([event.target.dataset.univRoll]);
+    }
+  });
+
+  unmarkedStudentsTbody.addEventListener('change', (event) => {
+    if (event.target.classList.contains('select-student-checkbox')) {
+      const roll = event.target.dataset.univRoll;
+      if (event.target.checked) sessionState.selectedRolls.add(roll);
+      else sessionState.selectedRolls.delete(roll);
+      updateMarkSelectedButton();
     }
   });
 
+  // Selects (or clears) every student currently shown by the search filter.
+  selectAllCheckbox.addEventListener('change', () => {
+    unmarkedStudentsTbody
+      .querySelectorAll('.select-student-checkbox')
+      .forEach((checkbox) => {
+        checkbox.checked = selectAllCheckbox.checked;
+        if (checkbox.checked) sessionState.selectedRolls.add(checkbox.dataset.univRoll);
+        else sessionState.selectedRolls.delete(checkbox.dataset.univRoll);
+      });
+    updateMarkSelectedButton();
+  });
+
+  markSelectedButton.addEventListener('click', async () => {
+    if (sessionState.selectedRolls.size === 0) return;
+    await markManually([...sessionState.selectedRolls]);
+  });
+
   // --- 6. SESSION CONTROL & REPORTING ---
   endSessionButton.addEventListener('click', async () => {
     if (!confirm('Are you sure you want to end this session?')) return;
@@ -373,10 +431,22 @@ document.addEventListener('DOMContentLoaded', () => {
     }
   });
 
+  // Rows of a columnar list ({columns, rows}, see ?rows=columns) as objects.
+  function fromColumns(value) {
+    if (!value || !Array.isArray(value.columns)) return value;
+    return value.rows.map((row) =>
+      Object.fromEntries(value.columns.map((column, i) => [column, row[i]]))
+    );
+  }
+
   async function loadReport(sessionId) {
     try {
-      const response = await fetch(`/api/teacher/report/${sessionId}`);
+      // The student list is the big part of a report; it comes columnar.
+      const response = await fetch(
+        `/api/teacher/report/${sessionId}?rows=columns`
+      );
       const data = await response.json();
+      data.students = fromColumns(data.students);
 
       if (response.ok) {
         renderReportTable(data);
@@ -454,9 +524,37 @@ document.addEventListener('DOMContentLoaded', () => {
     }
   }
 
-  exportExcelButton.addEventListener('click', () => {
-    // This simply opens the download link. The browser handles the download.
-    window.open(`/api/teacher/report/export/${sessionState.sessionId}`);
+  exportExcelButton.addEventListener('click', async () => {
+    // The Excel file is generated by a background job on the server.
+    // We submit the job, wait for it to finish, then download the file.
+    exportExcelButton.disabled = true;
+    try {
+      const response = await fetch(
+        `/api/teacher/report/export/${sessionState.sessionId}/jobs`,
+        { method: 'POST' }
+      );
+      let job = await response.json();
+      if (!response.ok) {
+        alert(`Export failed: ${job.message}`);
+        return;
+      }
+      // Poll the job status once a second until it is done.
+      while (job.status === 'queued' || job.status === 'running') {
+        await new Promise((resolve) => setTimeout(resolve, 1000));
+        const statusResponse = await fetch(job.status_url);
+        job = await statusResponse.json();
+      }
+      if (job.status === 'done') {
+        window.location.href = job.download_url;
+      } else {
+        alert(`Export failed: ${job.error || 'Unknown error'}`);
+      }
+    } catch (error) {
+      console.error('Export error:', error);
+      alert('A network error occurred while exporting the report.');
+    } finally {
+      exportExcelButton.disabled = false;
+    }
   });
 
   newSessionButton.addEventListener('click', () => {
@@ -0,0 +1,355 @@
+# =================================================================
+#   A.R.I.S.E. Storage Backends
+#   - One place that knows how to talk to the database, so the rest of
+#     the server is not hardwired to sqlite3.
+#   - SQLite (the default, one attendance.db file) and PostgreSQL (for
+#     several writers / several app nodes) are supported.
+#   - Both backends keep a pool of open connections, so requests do not
+#     pay the connect/PRAGMA cost every time.
+#   - Queries are written once, in the SQLite dialect the server has always
+#     used; the PostgreSQL connection rewrites the few constructs that
+#     differ (placeholders, GROUP_CONCAT, "IS ?", DDL types).
+# =================================================================
+
+import datetime
+import functools
+import queue
+import re
+import sqlite3
+import threading
+import time
+
+
+class IntegrityError(Exception):
+    """A UNIQUE / FOREIGN KEY / NOT NULL constraint failed, whichever backend raised it."""
+
+
+class PoolTimeoutError(Exception):
+    """No database connection became free in time."""
+
+
+class PoolClosedError(Exception):
+    """The pool was closed; its database should no longer be used."""
+
+
+def to_datetime(value):
+    """
+    Normalises a stored date/time value. Session and attendance times are
+    stored as epoch seconds (see to_epoch); other columns come back as ISO
+    strings from SQLite or datetime objects from PostgreSQL. Callers get a
+    datetime either way.
+    """
+    if value is None or isinstance(value, datetime.datetime):
+        return value
+    if isinstance(value, (int, float)):
+        return from_epoch(value)
+    return datetime.datetime.fromisoformat(value)
+
+
+# =================================================================
+#   Timestamps
+#   - sessions.start_time / end_time and attendance_records.timestamp
+#     are whole seconds since the Unix epoch. Integers compare and index
+#     the same way in both databases and need no parsing on the way out.
+# =================================================================
+
+def to_epoch(value, naive_tz=None):
+    """
+    Converts a datetime, an ISO string or a number to epoch seconds.
+    Naive values are taken as server-local time (what datetime.now()
+    returns) unless `naive_tz` says otherwise.
+    """
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return int(value)
+    value = to_datetime(value)
+    if value.tzinfo is None and naive_tz is not None:
+        value = value.replace(tzinfo=naive_tz)
+    return int(value.timestamp())
+
+
+def from_epoch(value):
+    """Converts epoch seconds to a timezone-aware UTC datetime."""
+    if value is None:
+        return None
+    return datetime.datetime.fromtimestamp(value, datetime.timezone.utc)
+
+
+def epoch_to_iso(value):
+    """Formats epoch seconds for API responses, e.g. '2025-09-29T10:28:57+00:00'."""
+    if value is None:
+        return None
+    return from_epoch(value).isoformat()
+
+
+def now_epoch():
+    """The current time in epoch seconds."""
+    return int(time.time())
+
+
+# =================================================================
+#   Connections
+# =================================================================
+
+class Connection:
+    """
+    A pooled database connection. It behaves like a sqlite3 connection
+    (execute / commit / rollback / close), except that close() hands the
+    connection back to its pool instead of closing it.
+    """
+
+    dialect = 'sqlite'
+
+    def __init__(self, pool, raw):
+        self._pool = pool
+        self._raw = raw
+
+    @property
+    def raw(self):
+        """The underlying driver connection, for backend-specific features."""
+        return self._raw
+
+    def execute(self, sql, params=()):
+        try:
+            return self._raw.execute(sql, params)
+        except sqlite3.IntegrityError as e:
+            raise IntegrityError(str(e)) from e
+
+    def insert(self, sql, params=()):
+        """Runs an INSERT and returns the id of the new row."""
+        return self.execute(sql, params).lastrowid
+
+    def commit(self):
+        self._raw.commit()
+
+    def rollback(self):
+        self._raw.rollback()
+
+    def close(self):
+        if self._raw is not None:
+            self._pool.release(self._raw)
+            self._raw = None
+
+    def __del__(self):
+        # A handler that forgot to close (or raised first) must not leak its pool slot.
+        self.close()
+
+
+class PostgresConnection(Connection):
+    """A pooled psycopg2 connection that accepts the server's SQLite-dialect SQL."""
+
+    dialect = 'postgresql'
+
+    def __init__(self, pool, raw, driver):
+        super().__init__(pool, raw)
+        self._driver = driver
+
+    def execute(self, sql, params=()):
+        translated = translate_to_postgres(sql)
+        if translated is None:
+            # Statements with no PostgreSQL equivalent (PRAGMAs, explicit BEGINs
+            # while psycopg2 already has a transaction open) are simply skipped.
+            return SkippedCursor()
+        cursor = self._raw.cursor()
+        try:
+            cursor.execute(translated, tuple(params))
+        except self._driver.IntegrityError as e:
+            self._raw.rollback()
+            raise IntegrityError(str(e)) from e
+        return cursor
+
+    def insert(self, sql, params=()):
+        cursor = self.execute(sql.rstrip().rstrip(';') + " RETURNING id", params)
+        return cursor.fetchone()[0]
+
+
+class SkippedCursor:
+    """What execute() returns for a skipped statement: a cursor with no rows."""
+
+    rowcount = -1
+    lastrowid = None
+    description = None
+
+    def fetchone(self):
+        return None
+
+    def fetchall(self):
+        return []
+
+    def fetchmany(self, size=None):
+        return []
+
+    def __iter__(self):
+        return iter(())
+
+    def close(self):
+        pass
+
+
+_SKIPPED_ON_POSTGRES = re.compile(r'^\s*(PRAGMA\b|BEGIN\b)', re.IGNORECASE)
+_POSTGRES_REWRITES = [
+    (re.compile(r'GROUP_CONCAT\(([^)]*)\)', re.IGNORECASE), r"STRING_AGG(CAST(\1 AS TEXT), ',')"),
+    (re.compile(r'\bIFNULL\(', re.IGNORECASE), 'COALESCE('),
+    (re.compile(r'\bIS \?', re.IGNORECASE), 'IS NOT DISTINCT FROM ?'),
+    # DDL: column types that differ between the two databases.
+    (re.compile(r'\bINTEGER PRIMARY KEY AUTOINCREMENT\b', re.IGNORECASE), 'SERIAL PRIMARY KEY'),
+    (re.compile(r'\bDATETIME\b', re.IGNORECASE), 'TIMESTAMPTZ'),
+    (re.compile(r'\bBOOLEAN\b', re.IGNORECASE), 'SMALLINT'),
+    (re.compile(r'\bBLOB\b', re.IGNORECASE), 'BYTEA'),
+]
+# String literals and quoted identifiers, with their doubled-quote escapes.
+_QUOTED = re.compile(r"""('(?:[^']|'')*'|"(?:[^"]|"")*")""")
+
+
+@functools.lru_cache(maxsize=1024)
+def translate_to_postgres(sql):
+    """
+    Rewrites a SQLite-dialect statement for PostgreSQL, or returns None if it
+    should be skipped. Quoted strings and identifiers are left as they are.
+    Results are cached, since the server runs the same statements over and
+    over.
+    """
+    if _SKIPPED_ON_POSTGRES.match(sql):
+        return None
+    # re.split with a group puts the quoted parts at the odd indices.
+    parts = _QUOTED.split(sql)
+    for i, part in enumerate(parts):
+        # psycopg2 uses %s placeholders and reads every %, quoted or not, so
+        # percent signs are doubled everywhere, before placeholders go in.
+        part = part.replace('%', '%%')
+        if i % 2 == 0:
+            for pattern, replacement in _POSTGRES_REWRITES:
+                part = pattern.sub(replacement, part)
+            part = part.replace('?', '%s')
+        parts[i] = part
+    return ''.join(parts)
+
+
+# =================================================================
+#   Pools & Backends
+# =================================================================
+
+class ConnectionPool:
+    """
+    Keeps up to `size` driver connections open. When all of them are in use,
+    callers wait up to `timeout` seconds for one to be released.
+    """
+
+    def __init__(self, connect, size, timeout=30):
+        self._connect = connect
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._timeout = timeout
+        self._closed = False
+
+    def acquire(self):
+        if self._closed:
+            raise PoolClosedError("The connection pool has been closed")
+        if not self._slots.acquire(timeout=self._timeout):
+            raise PoolTimeoutError("Timed out waiting for a database connection")
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        try:
+            return self._connect()
+        except Exception:
+            self._slots.release()
+            raise
+
+    def release(self, raw):
+        try:
+            if self._closed:
+                raw.close()
+                return
+            # Never hand a half-finished transaction to the next caller.
+            raw.rollback()
+            self._idle.put(raw)
+        except Exception:
+            # The connection is broken; drop it and let the pool open a new one later.
+            try:
+                raw.close()
+            except Exception:
+                pass
+        finally:
+            self._slots.release()
+
+    def close_all(self):
+        """Closes the idle connections; ones still in use are closed when released."""
+        self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+class SQLiteBackend:
+    """Stores everything in a single SQLite file."""
+
+    dialect = 'sqlite'
+
+    def __init__(self, path, pool_size=32, factory=sqlite3.Connection):
+        self.path = path
+        self._factory = factory
+        self.pool = ConnectionPool(self._open, pool_size)
+
+    def _open(self):
+        # check_same_thread=False is needed because pooled connections move between request threads.
+        conn = sqlite3.connect(self.path, check_same_thread=False, factory=self._factory)
+        # This makes the database return rows that can be accessed by column name.
+        conn.row_factory = sqlite3.Row
+        # Enable foreign key support
+        conn.execute("PRAGMA foreign_keys = ON")
+        return conn
+
+    def connect(self):
+        return Connection(self.pool, self.pool.acquire())
+
+    def close(self):
+        self.pool.close_all()
+
+
+class PostgresBackend:
+    """Stores everything in a PostgreSQL database, given a libpq URL or DSN."""
+
+    dialect = 'postgresql'
+
+    def __init__(self, dsn, pool_size=32, instrument_cursor=None):
+        try:
+            import psycopg2
+            import psycopg2.extras
+        except ImportError as e:
+            raise RuntimeError("The PostgreSQL backend needs the 'psycopg2' package "
+                               "(pip install psycopg2-binary).") from e
+        self.dsn = dsn
+        self.driver = psycopg2
+        self._cursor_factory = psycopg2.extras.DictCursor
+        if instrument_cursor is not None:
+            # e.g. metrics.instrumented_postgres_cursor, which subclasses the cursor class.
+            self._cursor_factory = instrument_cursor(self._cursor_factory)
+        self.pool = ConnectionPool(self._open, pool_size)
+
+    def _open(self):
+        # DictCursor rows support both row['name'] and row[0], like sqlite3.Row.
+        return self.driver.connect(self.dsn, cursor_factory=self._cursor_factory)
+
+    def connect(self):
+        return PostgresConnection(self.pool, self.pool.acquire(), self.driver)
+
+    def close(self):
+        self.pool.close_all()
+
+
+def create_backend(database='attendance.db', database_url=None, pool_size=32, sqlite_factory=sqlite3.Connection,
+                   instrument_postgres_cursor=None):
+    """
+    Returns the backend for the given settings: PostgreSQL when a
+    postgres:// or postgresql:// URL is given, otherwise the SQLite file.
+    """
+    if database_url and database_url.split('://', 1)[0] in ('postgres', 'postgresql'):
+        return PostgresBackend(database_url, pool_size=pool_size, instrument_cursor=instrument_postgres_cursor)
+    if database_url and database_url.startswith('sqlite:///'):
+        database = database_url[len('sqlite:///'):]
+    return SQLiteBackend(database, pool_size=pool_size, factory=sqlite_factory)
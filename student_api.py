@@ -0,0 +1,215 @@
+# =================================================================
+#   A.R.I.S.E. Student API
+#   - Login, the attendance dashboard, per-course details and the
+#     history timeline / calendar across all courses.
+# =================================================================
+
+import datetime
+import hashlib
+
+import jwt
+from flask import Blueprint, current_app, g, jsonify, request
+
+import history
+import reports
+import storage
+from auth import token_required
+from extensions import get_db_connection, get_read_connection
+
+bp = Blueprint('student', __name__)
+
+@bp.route('/api/student/login', methods=['POST'])
+def student_login():
+    data = request.get_json()
+    univ_roll_no = data.get('university_roll_no'); password = data.get('password')
+    hashed_password = hashlib.sha256(password.encode('utf-8')).hexdigest()
+    conn = get_db_connection()
+    student = conn.execute("SELECT id, student_name FROM students WHERE university_roll_no = ? AND password = ? AND deleted_at IS NULL", (univ_roll_no, hashed_password)).fetchone()
+    conn.close()
+    if student:
+        claims = {'student_id': student['id'], 'exp': datetime.datetime.utcnow() + datetime.timedelta(hours=1)}
+        if g.get('tenant'):
+            claims['tenant'] = g.tenant
+        token = jwt.encode(claims, current_app.config['SECRET_KEY'], algorithm="HS256")
+        return jsonify({'token': token, 'student_name': student['student_name']})
+    return jsonify({"message": "Invalid credentials"}), 401
+
+@bp.route('/api/student/dashboard', methods=['GET'])
+@token_required
+def get_student_dashboard(user_data):
+    student_id = user_data['student_id']
+    conn = get_read_connection()
+    courses_cursor = conn.execute("""
+        SELECT c.id AS course_id, c.course_name, COUNT(s.id) AS total_sessions
+        FROM courses c
+        JOIN enrollments e ON c.id = e.course_id
+        LEFT JOIN sessions s ON s.course_id = c.id
+        WHERE e.student_id = ? AND c.deleted_at IS NULL
+        GROUP BY c.id, c.course_name
+    """, (student_id,)).fetchall()
+    # Present counts come from the history index: one lookup for every course.
+    bitmaps = history.load(conn, student_id)
+    conn.close()
+    
+    courses_data = []
+    total_present_overall = 0
+    total_sessions_overall = 0
+
+    for course in courses_cursor:
+        total_sessions = course['total_sessions']
+        present_count = history.present_count(bitmaps.get(course['course_id'], 0))
+        
+        percentage = (present_count / total_sessions * 100) if total_sessions > 0 else 0
+        total_present_overall += present_count
+        total_sessions_overall += total_sessions
+        
+        courses_data.append({
+            "course_id": course['course_id'], 
+            "course_name": course['course_name'], 
+            "percentage": round(percentage), 
+            "present_count": present_count, 
+            "absent_count": total_sessions - present_count, 
+            "total_sessions": total_sessions
+        })
+        
+    overall_percentage = (total_present_overall / total_sessions_overall * 100) if total_sessions_overall > 0 else 0
+    return jsonify({"overall_percentage": round(overall_percentage), "courses": courses_data})
+
+@bp.route('/api/student/course/<int:course_id>', methods=['GET'])
+@token_required
+def get_course_details(user_data, course_id):
+    """
+    The student's attendance log for one course. Optional ?from=&to= (dates,
+    ISO date-times or epoch seconds) limit it to sessions started in that range.
+    """
+    student_id = user_data['student_id']
+    try:
+        start, end = reports.parse_time_range(request.args)
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
+    conn = get_read_connection()
+    course = conn.execute("SELECT course_name FROM courses WHERE id = ? AND deleted_at IS NULL", (course_id,)).fetchone()
+    if not course:
+        conn.close()
+        return jsonify({"message": "Course not found"}), 404
+    # One indexed range scan over the course's sessions; the student's
+    # presence at each is a bit of their history bitmap for the course.
+    range_sql, range_params = reports.time_range_condition('s.start_time', start, end)
+    sessions = conn.execute(f"""
+        SELECT s.start_time, s.end_time, s.course_seq
+        FROM sessions s
+        WHERE s.course_id = ?{range_sql}
+        ORDER BY s.start_time DESC
+    """, [course_id] + range_params).fetchall()
+    bitmap = history.load_course(conn, student_id, course_id)
+    conn.close()
+    
+    attendance_log = []
+    present_count = 0
+    for session in sessions:
+        present = history.is_present(bitmap, session['course_seq'])
+        if present: present_count += 1
+        attendance_log.append({"date": storage.epoch_to_iso(session['start_time']),
+                               "end_time": storage.epoch_to_iso(session['end_time']),
+                               "status": "Present" if present else "Absent"})
+
+    total_sessions = len(sessions)
+    percentage = (present_count / total_sessions * 100) if total_sessions > 0 else 0
+    
+    return jsonify({
+        "course_name": course['course_name'], "present_count": present_count, "absent_count": total_sessions - present_count,
+        "total_sessions": total_sessions, "percentage": round(percentage), "log": attendance_log
+    })
+
+# =================================================================
+#   History across all enrolled courses
+# =================================================================
+
+HISTORY_PAGE_SIZE = 50
+HISTORY_MAX_PAGE_SIZE = 200
+
+def _history_sessions(conn, student_id, conditions, params, limit=None):
+    """The sessions of the student's live courses matching `conditions`, newest first."""
+    return conn.execute(f"""
+        SELECT s.id, s.course_id, s.course_seq, s.start_time, s.end_time, s.session_type, c.course_name
+        FROM enrollments e
+        JOIN courses c ON c.id = e.course_id AND c.deleted_at IS NULL
+        JOIN sessions s ON s.course_id = e.course_id
+        WHERE e.student_id = ?{conditions}
+        ORDER BY s.start_time DESC, s.id DESC
+        {'LIMIT ?' if limit else ''}
+    """, [student_id] + params + ([limit] if limit else [])).fetchall()
+
+def _history_entry(session, bitmaps):
+    present = history.is_present(bitmaps.get(session['course_id'], 0), session['course_seq'])
+    return {"session_id": session['id'], "course_id": session['course_id'], "course_name": session['course_name'],
+            "start_time": storage.epoch_to_iso(session['start_time']),
+            "end_time": storage.epoch_to_iso(session['end_time']),
+            "session_type": session['session_type'], "status": "Present" if present else "Absent"}
+
+@bp.route('/api/student/history', methods=['GET'])
+@token_required
+def get_attendance_history(user_data):
+    """
+    The student's timeline across all enrolled courses, newest first. Returns
+    ?limit= sessions (default 50) and a next_cursor; pass it as ?cursor= for
+    the next page. Optional ?from=&to= and ?course_id= narrow it down.
+    """
+    student_id = user_data['student_id']
+    try:
+        start, end = reports.parse_time_range(request.args)
+        limit = min(max(int(request.args.get('limit', HISTORY_PAGE_SIZE)), 1), HISTORY_MAX_PAGE_SIZE)
+        course_id = request.args.get('course_id', type=int)
+        cursor = request.args.get('cursor')
+        # The cursor is the (start_time, id) of the last session on the previous page.
+        before = tuple(int(part) for part in cursor.split(':')) if cursor else None
+        if before is not None and len(before) != 2:
+            raise ValueError
+    except ValueError as e:
+        return jsonify({"message": str(e) or "Invalid limit or cursor"}), 400
+
+    conditions, params = reports.time_range_condition('s.start_time', start, end)
+    if course_id is not None:
+        conditions += " AND s.course_id = ?"
+        params.append(course_id)
+    if before is not None:
+        conditions += " AND (s.start_time < ? OR (s.start_time = ? AND s.id < ?))"
+        params += [before[0], before[0], before[1]]
+
+    conn = get_read_connection()
+    sessions = _history_sessions(conn, student_id, conditions, params, limit + 1)
+    bitmaps = history.load(conn, student_id)
+    conn.close()
+
+    page = sessions[:limit]
+    next_cursor = f"{page[-1]['start_time']}:{page[-1]['id']}" if len(sessions) > limit else None
+    return jsonify({"sessions": [_history_entry(session, bitmaps) for session in page], "next_cursor": next_cursor})
+
+@bp.route('/api/student/history/calendar', methods=['GET'])
+@token_required
+def get_attendance_calendar(user_data):
+    """
+    One month of the student's history across all enrolled courses, grouped by
+    day (server-local dates). ?month=YYYY-MM, default the current month.
+    """
+    student_id = user_data['student_id']
+    try:
+        month = datetime.datetime.strptime(request.args.get('month') or datetime.date.today().strftime('%Y-%m'), '%Y-%m')
+    except ValueError:
+        return jsonify({"message": "'month' must be given as YYYY-MM"}), 400
+    next_month = (month + datetime.timedelta(days=32)).replace(day=1)
+    conditions, params = reports.time_range_condition('s.start_time', storage.to_epoch(month), storage.to_epoch(next_month))
+
+    conn = get_read_connection()
+    sessions = _history_sessions(conn, student_id, conditions, params)
+    bitmaps = history.load(conn, student_id)
+    conn.close()
+
+    days = {}
+    for session in reversed(sessions):
+        date = datetime.datetime.fromtimestamp(session['start_time']).date().isoformat()
+        day = days.setdefault(date, {"date": date, "present": 0, "absent": 0, "sessions": []})
+        entry = _history_entry(session, bitmaps)
+        day['present' if entry['status'] == "Present" else 'absent'] += 1
+        day['sessions'].append(entry)
+    return jsonify({"month": month.strftime('%Y-%m'), "days": list(days.values())})
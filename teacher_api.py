@@ -0,0 +1,407 @@
+# =================================================================
+#   A.R.I.S.E. Teacher API
+#   - Login, live session control, reports and background exports.
+# =================================================================
+
+import os
+
+from flask import Blueprint, current_app, jsonify, request, send_file, url_for
+
+import history
+import reports
+import signals
+import storage
+from extensions import get_db_connection, get_read_connection, get_services
+from jobs import QueueFullError, DONE
+
+bp = Blueprint('teacher', __name__)
+
+#This cod eis fo rgetting the batch code and sending it to teacher.js login part to show BATCHCODE FIELD in dropdown in the login page of teacher interface 
+@bp.route('/api/teacher/batchcodes', methods=['GET'])
+def get_batchcodes():
+    """Returns all batch codes for the teacher login dropdown."""
+    conn = get_db_connection()
+    batchcodes = [row['batchcode'] for row in conn.execute("SELECT batchcode FROM courses WHERE deleted_at IS NULL ORDER BY batchcode").fetchall()]
+    conn.close()
+    return jsonify(batchcodes)
+
+
+# Teacher Login API 
+@bp.route('/api/teacher/login', methods=['POST'])
+def teacher_login():
+    """
+    Handles the teacher's initial login.
+    Verifies the batchcode and PIN.
+    Returns the course name and ID for the setup screen.
+    """
+    data = request.get_json()
+    batchcode = data.get('batchcode')
+    pin = data.get('pin')
+    conn = get_db_connection()
+    course = conn.execute(
+        "SELECT id, course_name, teacher_id, default_duration_minutes FROM courses WHERE batchcode = ? AND deleted_at IS NULL", 
+        (batchcode,)
+    ).fetchone()
+    
+    if not course:
+        conn.close()
+        return jsonify({"status": "error", "message": "Invalid Batch Code"}), 404
+        
+    teacher = conn.execute("SELECT pin FROM teachers WHERE id = ?", (course['teacher_id'],)).fetchone()
+    
+    if not teacher or teacher['pin'] != pin:
+        conn.close()
+        return jsonify({"status": "error", "message": "Invalid PIN"}), 401
+    
+    conn.close()
+    return jsonify({
+        "status": "success", 
+        "course_name": course['course_name'], 
+        "course_id": course['id'], 
+        "default_duration": course['default_duration_minutes']
+    })
+
+@bp.route('/api/teacher/start-session', methods=['POST'])
+def teacher_start_session():
+    """
+    Starts a new session after the teacher has confirmed all setup details.
+    Deactivates any old sessions and creates the new one.
+    Returns the initial list of unmarked students for the live dashboard.
+    """
+    data = request.get_json()
+    conn = get_db_connection()
+    
+    # Deactivate any other active sessions to be safe.
+    replaced_ids = [row['id'] for row in conn.execute("SELECT id FROM sessions WHERE is_active = 1").fetchall()]
+    conn.execute("UPDATE sessions SET is_active = 0, end_time = ? WHERE is_active = 1", (storage.now_epoch(),))
+    
+    # Calculate start and end times (epoch seconds)
+    start_time = storage.to_epoch(data['start_datetime'])
+    end_time = start_time + int(data['duration_minutes']) * 60
+
+    # Create the new session record, numbered after the course's previous ones
+    # (the position of its bit in the attendance history, see history.py).
+    session_id = conn.insert(
+        """INSERT INTO sessions (course_id, start_time, end_time, is_active, session_type, course_seq)
+           VALUES (?, ?, ?, 1, ?, (SELECT COALESCE(MAX(course_seq) + 1, 0) FROM sessions WHERE course_id = ?))""",
+        (data['course_id'], start_time, end_time, data['session_type'], data['course_id'])
+    )
+    conn.commit()
+
+    app = current_app._get_current_object()
+    shard = get_services()
+    for replaced_id in replaced_ids:
+        shard.expiry_scheduler.cancel(replaced_id)
+        signals.session_ended.send(app, session_id=replaced_id, reason='replaced', tenant=shard.name)
+    # The scheduler closes the session at end_time unless the teacher ends it first.
+    shard.expiry_scheduler.schedule(session_id, end_time)
+    signals.session_started.send(app, session_id=session_id, end_time=end_time, tenant=shard.name)
+    
+    # Get the list of all students enrolled in this course for the UI
+    students = conn.execute("""
+        SELECT e.class_roll_id, s.student_name, s.university_roll_no
+        FROM enrollments e 
+        JOIN students s ON e.student_id = s.id 
+        WHERE e.course_id = ? AND s.deleted_at IS NULL
+        ORDER BY e.class_roll_id
+    """, (data['course_id'],)).fetchall()
+    conn.close()
+    
+    return jsonify({
+        "status": "success", 
+        "message": "Session Started", 
+        "students": students, 
+        "session_id": session_id
+    })
+
+@bp.route('/api/teacher/manual-override', methods=['POST'])
+def manual_override():
+    """Handles the teacher's request to manually mark a student present."""
+    data = request.get_json()
+    conn = get_db_connection()
+    
+    # Ensure the session is still active
+    session = conn.execute("SELECT id FROM sessions WHERE id = ? AND is_active = 1", (data['session_id'],)).fetchone()
+    if not session:
+        conn.close()
+        return jsonify({"status": "error", "message": "Session is not active or has ended"}), 400
+
+    # Find the student's main ID from their university roll number
+    student = conn.execute("SELECT id FROM students WHERE university_roll_no = ? AND deleted_at IS NULL", (data['univ_roll_no'],)).fetchone()
+    if not student:
+        conn.close()
+        return jsonify({"status": "error", "message": "Student not found"}), 404
+
+    # Insert the attendance record with the override flag and reason
+    conn.execute(
+        "INSERT INTO attendance_records (session_id, student_id, timestamp, override_method, manual_reason) VALUES (?, ?, ?, 'teacher_manual', ?)",
+        (session['id'], student['id'], storage.now_epoch(), data['reason'])
+    )
+    history.record_presence(conn, session['id'], student['id'])
+    conn.commit()
+    conn.close()
+    
+    return jsonify({"status": "success", "message": "Attendance marked manually"})
+
+# Enough for the largest class; keeps the IN (...) list well under SQLite's variable limit.
+BULK_OVERRIDE_LIMIT = 500
+
+@bp.route('/api/teacher/manual-override/bulk', methods=['POST'])
+def bulk_manual_override():
+    """
+    Marks many students present at once, e.g. when the scanner has failed.
+    Takes session_id, reason and either univ_roll_nos or class_roll_ids.
+    All records are written in one transaction; the response has a status
+    per requested roll number: marked, duplicate, not_enrolled or not_found.
+    """
+    data = request.get_json() or {}
+    reason = (data.get('reason') or '').strip()
+    if 'class_roll_ids' in data:
+        key, rolls = 'class_roll_id', data['class_roll_ids']
+    else:
+        key, rolls = 'university_roll_no', data.get('univ_roll_nos')
+    if (not isinstance(rolls, list) or not rolls or not reason
+            or not all(isinstance(roll, (str, int)) for roll in rolls)):
+        return jsonify({"status": "error", "message": "A reason and a list of univ_roll_nos or class_roll_ids are required"}), 400
+    rolls = list(dict.fromkeys(rolls))
+    if len(rolls) > BULK_OVERRIDE_LIMIT:
+        return jsonify({"status": "error", "message": f"At most {BULK_OVERRIDE_LIMIT} students per request"}), 400
+
+    conn = get_db_connection()
+    # Take the write lock first, so a scan arriving meanwhile cannot create a duplicate.
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        session = conn.execute("SELECT id, course_id FROM sessions WHERE id = ? AND is_active = 1", (data.get('session_id'),)).fetchone()
+        if not session:
+            conn.rollback()
+            return jsonify({"status": "error", "message": "Session is not active or has ended"}), 400
+
+        # One query resolves every roll number to the student, their enrollment and any existing record.
+        placeholders = ','.join(['?'] * len(rolls))
+        if key == 'class_roll_id':
+            roll_column = 'e.class_roll_id'
+            source = "enrollments e JOIN students s ON s.id = e.student_id AND e.course_id = ?"
+        else:
+            roll_column = 's.university_roll_no'
+            source = "students s LEFT JOIN enrollments e ON e.student_id = s.id AND e.course_id = ?"
+        found = conn.execute(f"""
+            SELECT s.id, {roll_column} AS roll, e.student_id IS NOT NULL AS enrolled,
+                   EXISTS (SELECT 1 FROM attendance_records ar
+                           WHERE ar.session_id = ? AND ar.student_id = s.id) AS already_marked
+            FROM {source}
+            WHERE {roll_column} IN ({placeholders}) AND s.deleted_at IS NULL
+        """, [session['id'], session['course_id']] + rolls).fetchall()
+        by_roll = {str(row['roll']): row for row in found}
+
+        now = storage.now_epoch()
+        results = []
+        for roll in rolls:
+            student = by_roll.get(str(roll))
+            if student is None:
+                status = 'not_found'
+            elif not student['enrolled']:
+                status = 'not_enrolled'
+            elif student['already_marked']:
+                status = 'duplicate'
+            else:
+                conn.execute(
+                    "INSERT INTO attendance_records (session_id, student_id, timestamp, override_method, manual_reason) VALUES (?, ?, ?, 'teacher_manual', ?)",
+                    (session['id'], student['id'], now, reason)
+                )
+                history.record_presence(conn, session['id'], student['id'])
+                status = 'marked'
+            results.append({"roll": roll, "status": status})
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+    marked = sum(1 for result in results if result['status'] == 'marked')
+    return jsonify({"status": "success", "message": f"{marked} student(s) marked manually", "marked": marked, "results": results})
+
+
+
+# =================================================================
+#   TEACHER API ENDPOINTS (Session Management)
+# =================================================================
+
+@bp.route('/api/teacher/session/<int:session_id>/end', methods=['POST'])
+def end_session(session_id):
+    """Ends the currently active session."""
+    conn = get_db_connection()
+    ended = conn.execute("UPDATE sessions SET is_active = 0, end_time = ? WHERE id = ? AND is_active = 1", 
+                         (storage.now_epoch(), session_id))
+    conn.commit()
+    conn.close()
+    shard = get_services()
+    shard.expiry_scheduler.cancel(session_id)
+    if ended.rowcount:
+        signals.session_ended.send(current_app._get_current_object(), session_id=session_id, reason='ended',
+                                   tenant=shard.name)
+    return jsonify({"status": "success", "message": "Session has been ended."})
+
+@bp.route('/api/teacher/session/<int:session_id>/extend', methods=['POST'])
+def extend_session(session_id):
+    """Adds 10 minutes to the end time of the active session."""
+    conn = get_db_connection()
+    session = conn.execute("SELECT end_time FROM sessions WHERE id = ? AND is_active = 1", (session_id,)).fetchone()
+    if not session:
+        conn.close()
+        return jsonify({"status": "error", "message": "Session is not active or has ended"}), 400
+
+    new_end_time = session['end_time'] + 10 * 60
+    conn.execute("UPDATE sessions SET end_time = ? WHERE id = ?", (new_end_time, session_id))
+    conn.commit()
+    conn.close()
+
+    # Move the session's expiry to the new end time.
+    shard = get_services()
+    shard.expiry_scheduler.schedule(session_id, new_end_time)
+    signals.session_extended.send(current_app._get_current_object(), session_id=session_id, end_time=new_end_time,
+                                  tenant=shard.name)
+    return jsonify({"status": "success", "new_end_time": storage.epoch_to_iso(new_end_time)})
+
+@bp.route('/api/teacher/session/<int:session_id>/status', methods=['GET'])
+def get_live_session_status(session_id):
+    """
+    Provides a real-time status update for the live dashboard.
+    Returns the list of students who have been marked present.
+    The frontend will use this to calculate who is left.
+    """
+    conn = get_db_connection()
+    records_cursor = conn.execute("""
+        SELECT s.university_roll_no 
+        FROM attendance_records ar
+        JOIN students s ON ar.student_id = s.id
+        WHERE ar.session_id = ? AND s.deleted_at IS NULL
+    """, (session_id,)).fetchall()
+    
+    marked_students = [row['university_roll_no'] for row in records_cursor]
+    conn.close()
+    
+    return jsonify({"marked_students": marked_students})
+
+@bp.route('/api/teacher/report/<int:session_id>', methods=['GET'])
+def get_session_report(session_id):
+    """
+    Generates the complete, final attendance report matrix for a given session's course.
+    Optional ?from=&to= (dates, ISO date-times or epoch seconds) limit it to
+    the sessions that started in that range.
+    """
+    try:
+        start, end = reports.parse_time_range(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    conn = get_read_connection()
+    report = reports.load_session_report(conn, session_id, start, end)
+    conn.close()
+    if report is None:
+        return jsonify({"error": "Session not found"}), 404
+
+    # Structure the data for the frontend
+    report_data = {
+        "students": report['students'],
+        "sessions": [{"id": s['id'], "start_time": storage.epoch_to_iso(s['start_time'])} for s in report['sessions']],
+        "present_set": report['present_set'] # Sent as a list of [session_id, student_id] pairs
+    }
+    
+    return jsonify(report_data)
+
+
+# =================================================================
+#   TEACHER API ENDPOINTS (Export)
+# =================================================================
+# Excel files are generated by the background job queue, never on the request
+# thread. The client submits a job, polls (or long-polls) its status, and then
+# downloads the finished file. Unchanged reports are served from the cache.
+
+def _describe_job(job):
+    """Adds the URLs the client needs to follow a job through to its download."""
+    job = dict(job)
+    job['status_url'] = url_for('.get_job_status', job_id=job['job_id'])
+    if job['status'] == DONE:
+        job['download_url'] = url_for('.download_job_artifact', job_id=job['job_id'])
+    return job
+
+def _export_params(session_id):
+    """Job parameters for an export of the session's report, with any ?from=&to= range."""
+    start, end = reports.parse_time_range(request.args)
+    params = {"session_id": session_id}
+    if start is not None:
+        params['from'] = start
+    if end is not None:
+        params['to'] = end
+    return params
+
+def _session_exists(session_id):
+    conn = get_db_connection()
+    session = conn.execute("SELECT id FROM sessions WHERE id = ?", (session_id,)).fetchone()
+    conn.close()
+    return session is not None
+
+@bp.route('/api/teacher/report/export/<int:session_id>/jobs', methods=['POST'])
+def submit_export_job(session_id):
+    """
+    Queues an Excel export of the session's report and returns the job.
+    Accepts the same ?from=&to= range as the report endpoint.
+    """
+    try:
+        params = _export_params(session_id)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if not _session_exists(session_id):
+        return jsonify({"error": "Session not found"}), 404
+    try:
+        job = get_services().job_queue.submit('session_report_xlsx', params)
+    except QueueFullError as e:
+        return jsonify({"status": "error", "message": str(e)}), 503, {'Retry-After': '5'}
+    return jsonify(_describe_job(job)), 202
+
+# A status request may wait this long for its job; clients poll again after.
+JOB_MAX_WAIT_SECONDS = 2
+
+@bp.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job_status(job_id):
+    """
+    Returns a job's status. ?wait=<seconds> holds the request until the job
+    finishes, for at most JOB_MAX_WAIT_SECONDS so no worker thread is tied up.
+    """
+    job_queue = get_services().job_queue
+    wait = min(request.args.get('wait', 0, type=float), JOB_MAX_WAIT_SECONDS)
+    job = job_queue.wait(job_id, wait) if wait > 0 else job_queue.get(job_id)
+    if job is None:
+        return jsonify({"status": "error", "message": "Job not found"}), 404
+    return jsonify(_describe_job(job))
+
+@bp.route('/api/jobs/<job_id>/download', methods=['GET'])
+def download_job_artifact(job_id):
+    """Sends the file produced by a finished job."""
+    artifact = get_services().job_queue.artifact(job_id)
+    if artifact is None:
+        return jsonify({"status": "error", "message": "Job not found or not finished"}), 404
+    path, download_name, mimetype = artifact
+    return send_file(os.path.abspath(path), as_attachment=True,
+                     download_name=download_name, mimetype=mimetype)
+
+@bp.route('/api/teacher/report/export/<int:session_id>')
+def export_session_report(session_id):
+    """
+    Kept for existing links: queues the export. Sends the file if an
+    identical export is already done, otherwise returns the job to poll (202).
+    """
+    try:
+        params = _export_params(session_id)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if not _session_exists(session_id):
+        return jsonify({"error": "Session not found"}), 404
+    job_queue = get_services().job_queue
+    try:
+        job = job_queue.submit('session_report_xlsx', params)
+    except QueueFullError as e:
+        return jsonify({"status": "error", "message": str(e)}), 503, {'Retry-After': '5'}
+    if job['status'] == DONE:
+        return download_job_artifact(job['job_id'])
+    return jsonify(_describe_job(job)), 202
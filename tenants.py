@@ -0,0 +1,232 @@
+# =================================================================
+#   A.R.I.S.E. Tenants
+#   - One deployment can serve several colleges. Each college (tenant)
+#     has its own SQLite file in TENANTS_DIR, so one college's scans
+#     never wait on another college's file lock.
+#   - A request is routed to its tenant by, in order: the 'tenant' claim
+#     of its login token, the X-Device-ID header of a registered scanner,
+#     or the subdomain under TENANT_DOMAIN (college1.arise.example.edu).
+#   - Run as a script to create, migrate and list tenant databases:
+#         python tenants.py --dir tenants create college1
+#         python tenants.py --dir tenants list
+#         python tenants.py --dir tenants migrate
+#         python tenants.py --dir tenants assign-device college1 A4:CF:12:34:56:78
+# =================================================================
+
+import argparse
+import os
+import re
+import sqlite3
+
+import storage
+from database_setup import MIGRATIONS, apply_migrations, setup_database
+
+# Tenant names become file names and subdomains.
+TENANT_NAME = re.compile(r'^[a-z0-9][a-z0-9-]{0,62}$')
+
+# Maps scanner device IDs to tenants; lives next to the tenant databases.
+REGISTRY_FILE = '_registry.db'
+
+
+class TenantError(Exception):
+    """A request could not be routed to a tenant. `status` is the HTTP status to answer with."""
+
+    def __init__(self, message, status):
+        super().__init__(message)
+        self.status = status
+
+
+class TenantRegistry:
+    """The tenant databases in `directory`, one <name>.db file per tenant."""
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def path_for(self, name):
+        if not TENANT_NAME.match(name or ''):
+            raise ValueError(f"Invalid tenant name: {name!r}")
+        return os.path.join(self.directory, f'{name}.db')
+
+    def exists(self, name):
+        return bool(TENANT_NAME.match(name or '')) and os.path.exists(self.path_for(name))
+
+    def names(self):
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(filename[:-3] for filename in os.listdir(self.directory)
+                      if filename.endswith('.db') and TENANT_NAME.match(filename[:-3]))
+
+    def create(self, name):
+        """Creates a tenant database with the full schema and the default admin."""
+        path = self.path_for(name)
+        if os.path.exists(path):
+            raise ValueError(f"Tenant {name!r} already exists")
+        os.makedirs(self.directory, exist_ok=True)
+        setup_database(path)
+        # setup_database() reports errors instead of raising them, so check the result.
+        if not self._is_complete(path):
+            for leftover in (path, path + '-wal', path + '-shm', path + '-journal'):
+                if os.path.exists(leftover):
+                    os.remove(leftover)
+            raise ValueError(f"Could not set up the database for tenant {name!r}; see the output above")
+        return path
+
+    @staticmethod
+    def _is_complete(path):
+        """True if the database at `path` has the latest schema and an admin."""
+        if not os.path.exists(path):
+            return False
+        conn = sqlite3.connect(path)
+        try:
+            version = conn.execute("SELECT MAX(version) FROM schema_migrations").fetchone()[0]
+            admins = conn.execute("SELECT COUNT(*) FROM admins").fetchone()[0]
+        except sqlite3.Error:
+            return False
+        finally:
+            conn.close()
+        return version == MIGRATIONS[-1][0] and admins > 0
+
+    def migrate(self, name):
+        """Applies pending migrations to one tenant database. Returns its schema version."""
+        if not self.exists(name):
+            raise ValueError(f"No such tenant: {name!r}")
+        conn = storage.SQLiteBackend(self.path_for(name), pool_size=1).connect()
+        try:
+            apply_migrations(conn)
+            return conn.execute("SELECT MAX(version) AS version FROM schema_migrations").fetchone()['version']
+        finally:
+            conn.close()
+
+    def describe(self, name):
+        """Schema version, file size and scanner count for `list`."""
+        path = self.path_for(name)
+        conn = sqlite3.connect(path)
+        try:
+            version = conn.execute("SELECT MAX(version) FROM schema_migrations").fetchone()[0]
+        except sqlite3.OperationalError:
+            version = None
+        finally:
+            conn.close()
+        devices = sum(1 for tenant in self.devices().values() if tenant == name)
+        return {"name": name, "schema_version": version, "size_bytes": os.path.getsize(path), "devices": devices}
+
+    # -- Scanner devices -------------------------------------------
+
+    def _connect_registry(self):
+        os.makedirs(self.directory, exist_ok=True)
+        conn = sqlite3.connect(os.path.join(self.directory, REGISTRY_FILE))
+        conn.execute("CREATE TABLE IF NOT EXISTS devices (device_id TEXT PRIMARY KEY, tenant TEXT NOT NULL)")
+        return conn
+
+    def assign_device(self, device_id, name):
+        if not self.exists(name):
+            raise ValueError(f"No such tenant: {name!r}")
+        conn = self._connect_registry()
+        try:
+            conn.execute("INSERT OR REPLACE INTO devices (device_id, tenant) VALUES (?, ?)",
+                         (normalize_device_id(device_id), name))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def devices(self):
+        conn = self._connect_registry()
+        try:
+            return dict(conn.execute("SELECT device_id, tenant FROM devices").fetchall())
+        finally:
+            conn.close()
+
+
+def normalize_device_id(device_id):
+    # Scanners report their MAC address; accept it with or without separators.
+    return re.sub(r'[^0-9a-z]', '', device_id.lower())
+
+
+def resolve_tenant(request, config, registry, tenant_for_device):
+    """
+    Returns the tenant name for a request, or raises TenantError.
+    `tenant_for_device(device_id)` looks up a registered scanner's tenant.
+    """
+    claimed = _token_tenant(request, config['SECRET_KEY'])
+    subdomain = _subdomain(request.host, config['TENANT_DOMAIN'])
+    if claimed and subdomain and claimed != subdomain:
+        raise TenantError("This token belongs to a different institution", 403)
+
+    name = claimed
+    if name is None:
+        device_id = request.headers.get('X-Device-ID')
+        if device_id:
+            name = tenant_for_device(normalize_device_id(device_id))
+            if name is None:
+                raise TenantError("Unknown device", 404)
+    if name is None:
+        name = subdomain
+    if name is None:
+        raise TenantError("No institution given; use its subdomain", 404)
+    if not registry.exists(name):
+        raise TenantError("Unknown institution", 404)
+    return name
+
+
+def _token_tenant(request, secret_key):
+    auth = request.headers.get('Authorization', '')
+    if not auth.startswith('Bearer '):
+        return None
+    import jwt
+    try:
+        claims = jwt.decode(auth[len('Bearer '):], secret_key, algorithms=["HS256"])
+    except jwt.InvalidTokenError:
+        # token_required rejects it; routing just ignores it.
+        return None
+    return claims.get('tenant')
+
+
+def _subdomain(host, domain):
+    if not domain:
+        return None
+    host = host.split(':')[0].lower()
+    suffix = '.' + domain.lower()
+    if not host.endswith(suffix):
+        return None
+    label = host[:-len(suffix)]
+    return label if TENANT_NAME.match(label) else None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manage A.R.I.S.E. tenant databases")
+    parser.add_argument('--dir', default=os.environ.get('ARISE_TENANTS_DIR', 'tenants'),
+                        help="directory holding the tenant databases (default: $ARISE_TENANTS_DIR or ./tenants)")
+    commands = parser.add_subparsers(dest='command', required=True)
+    create = commands.add_parser('create', help="create a tenant database")
+    create.add_argument('name')
+    commands.add_parser('list', help="list tenants with their schema version and size")
+    migrate = commands.add_parser('migrate', help="apply pending migrations (to all tenants by default)")
+    migrate.add_argument('names', nargs='*')
+    assign = commands.add_parser('assign-device', help="route a scanner's requests to a tenant")
+    assign.add_argument('name')
+    assign.add_argument('device_id')
+    args = parser.parse_args(argv)
+
+    registry = TenantRegistry(args.dir)
+    try:
+        if args.command == 'create':
+            print(f"Created {registry.create(args.name)}")
+        elif args.command == 'list':
+            latest = MIGRATIONS[-1][0]
+            for name in registry.names():
+                info = registry.describe(name)
+                behind = '' if info['schema_version'] == latest else f"  (latest is v{latest})"
+                print(f"{name:<24} v{info['schema_version']}{behind}  "
+                      f"{info['size_bytes'] / 1024:.0f} KiB  {info['devices']} device(s)")
+        elif args.command == 'migrate':
+            for name in args.names or registry.names():
+                print(f"{name}: schema v{registry.migrate(name)}")
+        elif args.command == 'assign-device':
+            registry.assign_device(args.device_id, args.name)
+            print(f"Device {args.device_id} -> {args.name}")
+    except ValueError as e:
+        parser.exit(1, f"error: {e}\n")
+
+
+if __name__ == '__main__':
+    main()
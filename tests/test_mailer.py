@@ -0,0 +1,172 @@
+"""
+MailQueue and the defaulter digests against a fake SMTP server.
+
+Run from the repository root:  python -m unittest discover tests
+"""
+
+import contextlib
+import io
+import os
+import smtplib
+import sys
+import tempfile
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import notifications
+import storage
+from database_setup import setup_database
+from mailer import FAILED, QUEUED, REJECTED, SENDING, SENT, MailQueue, SMTPSettings
+
+
+class FakeSMTP:
+    """Stands in for smtplib.SMTP. `refuse` maps an address to the error to raise for it."""
+
+    def __init__(self, server):
+        self.server = server
+
+    def send_message(self, message):
+        error = self.server.refuse.get(message['To'])
+        if error is not None:
+            raise error
+        self.server.sent.append(message)
+
+    def quit(self):
+        self.server.closed += 1
+
+    close = quit
+
+
+class FakeSMTPSettings(SMTPSettings):
+    def __init__(self):
+        super().__init__('smtp.test', sender='arise@example.edu')
+        self.sent = []
+        self.refuse = {}
+        self.opened = 0
+        self.closed = 0
+
+    def open(self):
+        self.opened += 1
+        return FakeSMTP(self)
+
+
+class MailQueueTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        path = os.path.join(self.directory.name, 'attendance.db')
+        with contextlib.redirect_stdout(io.StringIO()):
+            setup_database(path)
+        self.backend = storage.create_backend(path, None, pool_size=4)
+        self.settings = FakeSMTPSettings()
+        self.queue = MailQueue(self.backend.connect, self.settings, rate_per_minute=0,
+                               max_attempts=3, retry_delay=0.01)
+        self.queue.start()
+
+        conn = self.backend.connect()
+        for i, email in enumerate(('good@example.edu', 'flaky@example.edu', 'gone@example.edu')):
+            conn.execute("INSERT INTO students (university_roll_no, enrollment_no, student_name, password, email1) "
+                         "VALUES (?, ?, ?, 'x', ?)", (f'U{i}', f'E{i}', f'Student {i}', email))
+        conn.execute("INSERT INTO courses (course_name, batchcode) VALUES ('Course', 'C1')")
+        conn.execute("INSERT INTO enrollments (student_id, course_id, class_roll_id) "
+                     "SELECT id, 1, id FROM students")
+        conn.execute("INSERT INTO sessions (course_id, start_time, course_seq) VALUES (1, 0, 0)")
+        conn.commit()
+        conn.close()
+
+    def tearDown(self):
+        self.queue.stop()
+        self.backend.close()
+        self.directory.cleanup()
+
+    def statuses(self):
+        conn = self.backend.connect()
+        try:
+            return {row['recipients']: (row['status'], row['attempts']) for row in
+                    conn.execute("SELECT recipients, status, attempts FROM notifications").fetchall()}
+        finally:
+            conn.close()
+
+    def queue_digests(self):
+        conn = self.backend.connect()
+        try:
+            ids = notifications.queue_digests(conn, threshold=75)
+            conn.commit()
+        finally:
+            conn.close()
+        for notification_id in ids:
+            self.queue.put(notification_id)
+        return ids
+
+    def wait_until_sent(self):
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline:
+            if all(status not in (QUEUED, SENDING) for status, _ in self.statuses().values()):
+                return
+            time.sleep(0.01)
+        self.fail(f"Mail still queued: {self.statuses()}")
+
+    def test_sends_digests_over_one_connection(self):
+        self.assertEqual(len(self.queue_digests()), 3)
+        self.wait_until_sent()
+        self.assertEqual({status for status, _ in self.statuses().values()}, {SENT})
+        self.assertEqual(sorted(message['To'] for message in self.settings.sent),
+                         ['flaky@example.edu', 'gone@example.edu', 'good@example.edu'])
+        self.assertEqual(self.settings.opened, 1)
+
+    def test_retries_temporary_errors_but_not_refusals(self):
+        self.settings.refuse['flaky@example.edu'] = smtplib.SMTPResponseException(451, b'try again later')
+        self.settings.refuse['gone@example.edu'] = smtplib.SMTPRecipientsRefused(
+            {'gone@example.edu': (550, b'no such user')})
+        self.queue_digests()
+        self.wait_until_sent()
+        self.assertEqual(self.statuses(), {
+            'good@example.edu': (SENT, 1),
+            'flaky@example.edu': (FAILED, 3),
+            'gone@example.edu': (REJECTED, 1),
+        })
+
+        # The next run retries the temporary failure only.
+        del self.settings.refuse['flaky@example.edu']
+        self.assertEqual(len(self.queue_digests()), 1)
+        self.wait_until_sent()
+        self.assertEqual(self.statuses()['flaky@example.edu'][0], SENT)
+        self.assertEqual(self.statuses()['gone@example.edu'], (REJECTED, 1))
+
+    def test_two_queues_send_each_message_once(self):
+        # A second worker's queue over the same table, handed the same ids.
+        other = MailQueue(self.backend.connect, self.settings, rate_per_minute=0, retry_delay=0.01)
+        other.start()
+        try:
+            for notification_id in self.queue_digests():
+                other.put(notification_id)
+            self.wait_until_sent()
+        finally:
+            other.stop()
+        self.assertEqual(len(self.settings.sent), 3)
+
+    def test_releases_claims_of_a_dead_worker(self):
+        self.queue.stop()
+        ids = self.queue_digests()
+        conn = self.backend.connect()
+        conn.execute("UPDATE notifications SET status = ?, claimed_at = ? WHERE id = ?",
+                     (SENDING, storage.now_epoch() - 3600, ids[0]))
+        conn.execute("UPDATE notifications SET status = ?, claimed_at = ? WHERE id = ?",
+                     (SENDING, storage.now_epoch(), ids[1]))
+        conn.commit()
+        conn.close()
+
+        self.queue = MailQueue(self.backend.connect, self.settings, rate_per_minute=0, claim_lease=60)
+        self.queue.start()
+        deadline = time.monotonic() + 5
+        while len(self.settings.sent) < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        statuses = [status for status, _ in self.statuses().values()]
+        # The recent claim may still be in progress elsewhere and is left alone.
+        self.assertEqual(sorted(statuses), sorted([SENT, SENT, SENDING]))
+
+
+if __name__ == '__main__':
+    unittest.main()
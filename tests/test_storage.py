@@ -0,0 +1,110 @@
+"""
+The PostgreSQL dialect translation, and the PostgreSQL backend itself.
+
+The live tests need a scratch database and are skipped unless
+ARISE_TEST_DATABASE_URL points at one, e.g.
+
+    ARISE_TEST_DATABASE_URL=postgresql://arise@localhost/arise_test python -m unittest discover tests
+"""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import storage
+from storage import translate_to_postgres
+
+DATABASE_URL = os.environ.get('ARISE_TEST_DATABASE_URL')
+
+
+class TranslateToPostgresTest(unittest.TestCase):
+
+    def test_placeholders(self):
+        self.assertEqual(translate_to_postgres("SELECT * FROM students WHERE id = ? AND student_name = ?"),
+                         "SELECT * FROM students WHERE id = %s AND student_name = %s")
+
+    def test_percent_signs_are_escaped(self):
+        self.assertEqual(translate_to_postgres("SELECT id FROM students WHERE student_name LIKE ?"),
+                         "SELECT id FROM students WHERE student_name LIKE %s")
+        self.assertEqual(translate_to_postgres("SELECT id FROM students WHERE student_name LIKE '%a%'"),
+                         "SELECT id FROM students WHERE student_name LIKE '%%a%%'")
+
+    def test_quoted_text_is_left_alone(self):
+        self.assertEqual(translate_to_postgres("SELECT 'why?', 'IS ?', 'it''s ?' FROM t WHERE \"odd?\" = ?"),
+                         "SELECT 'why?', 'IS ?', 'it''s ?' FROM t WHERE \"odd?\" = %s")
+
+    def test_is_placeholder(self):
+        self.assertEqual(translate_to_postgres("SELECT id FROM jobs WHERE cache_key IS ?"),
+                         "SELECT id FROM jobs WHERE cache_key IS NOT DISTINCT FROM %s")
+        self.assertEqual(translate_to_postgres("SELECT id FROM jobs WHERE cache_key IS NULL"),
+                         "SELECT id FROM jobs WHERE cache_key IS NULL")
+
+    def test_functions_and_types(self):
+        self.assertEqual(translate_to_postgres("SELECT GROUP_CONCAT(c.batchcode), IFNULL(x, 0) FROM c"),
+                         "SELECT STRING_AGG(CAST(c.batchcode AS TEXT), ','), COALESCE(x, 0) FROM c")
+        self.assertEqual(translate_to_postgres("CREATE TABLE t (id INTEGER PRIMARY KEY AUTOINCREMENT, at DATETIME)"),
+                         "CREATE TABLE t (id SERIAL PRIMARY KEY, at TIMESTAMPTZ)")
+
+    def test_skipped_statements(self):
+        for sql in ("PRAGMA foreign_keys = ON", "  pragma table_info(t)", "BEGIN IMMEDIATE", "BEGIN TRANSACTION"):
+            self.assertIsNone(translate_to_postgres(sql), sql)
+        self.assertIsNotNone(translate_to_postgres("SELECT 'BEGIN'"))
+
+    def test_skipped_statement_returns_an_empty_cursor(self):
+        conn = storage.PostgresConnection(pool=None, raw=None, driver=None)
+        cursor = conn.execute("PRAGMA foreign_keys = ON")
+        self.assertIsNone(cursor.fetchone())
+        self.assertEqual(cursor.fetchall(), [])
+        self.assertEqual(list(cursor), [])
+
+
+@unittest.skipUnless(DATABASE_URL, "set ARISE_TEST_DATABASE_URL to a scratch PostgreSQL database")
+class PostgresBackendTest(unittest.TestCase):
+
+    def setUp(self):
+        self.backend = storage.create_backend(database_url=DATABASE_URL, pool_size=2)
+        self.conn = self.backend.connect()
+        self.conn.execute("DROP TABLE IF EXISTS arise_storage_test")
+        self.conn.execute("CREATE TABLE arise_storage_test (id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                          "name TEXT UNIQUE, note TEXT)")
+        self.conn.commit()
+
+    def tearDown(self):
+        self.conn.rollback()
+        self.conn.execute("DROP TABLE IF EXISTS arise_storage_test")
+        self.conn.commit()
+        self.conn.close()
+        self.backend.close()
+
+    def test_placeholders_and_literals(self):
+        first = self.conn.insert("INSERT INTO arise_storage_test (name, note) VALUES (?, '100% sure?')", ('a',))
+        self.conn.insert("INSERT INTO arise_storage_test (name, note) VALUES (?, ?)", ('b', None))
+        row = self.conn.execute("SELECT id, note FROM arise_storage_test WHERE name = ?", ('a',)).fetchone()
+        self.assertEqual((row['id'], row['note']), (first, '100% sure?'))
+        self.assertEqual(self.conn.execute("SELECT COUNT(*) FROM arise_storage_test WHERE note LIKE '%?'")
+                         .fetchone()[0], 1)
+
+    def test_is_placeholder(self):
+        self.conn.insert("INSERT INTO arise_storage_test (name, note) VALUES (?, ?)", ('a', None))
+        self.conn.insert("INSERT INTO arise_storage_test (name, note) VALUES (?, ?)", ('b', 'x'))
+        names = lambda note: [row['name'] for row in self.conn.execute(
+            "SELECT name FROM arise_storage_test WHERE note IS ?", (note,)).fetchall()]
+        self.assertEqual(names(None), ['a'])
+        self.assertEqual(names('x'), ['b'])
+
+    def test_skipped_statements(self):
+        self.assertEqual(self.conn.execute("PRAGMA foreign_keys = ON").fetchall(), [])
+        self.conn.execute("BEGIN IMMEDIATE")
+        self.conn.insert("INSERT INTO arise_storage_test (name) VALUES (?)", ('a',))
+        self.conn.commit()
+
+    def test_integrity_error(self):
+        self.conn.insert("INSERT INTO arise_storage_test (name) VALUES (?)", ('a',))
+        with self.assertRaises(storage.IntegrityError):
+            self.conn.insert("INSERT INTO arise_storage_test (name) VALUES (?)", ('a',))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,198 @@
+# =================================================================
+#   A.R.I.S.E. Soft Delete
+#   - Deleting a semester, course or student only stamps its deleted_at
+#     column, so the admin request never holds the write lock for a big
+#     ON DELETE CASCADE while scans are waiting.
+#   - Within the undo window the row can be restored as it was.
+#   - After that, a background purger removes the row and everything that
+#     hangs off it (enrollments, sessions, attendance records) in small
+#     batches, preferably while the server is idle.
+# =================================================================
+
+import threading
+import time
+
+import storage
+
+# The tables that support soft delete, by the name the admin API uses for them.
+KINDS = ('semesters', 'courses', 'students')
+
+
+def soft_delete(conn, kind, row_id):
+    """
+    Marks a row as deleted. Deleting a semester also marks its courses, with
+    the same timestamp so they are restored together. Returns the deletion
+    time in epoch seconds, or None if there was no such (live) row.
+    """
+    deleted_at = storage.now_epoch()
+    marked = conn.execute(f"UPDATE {kind} SET deleted_at = ? WHERE id = ? AND deleted_at IS NULL",
+                          (deleted_at, row_id))
+    if not marked.rowcount:
+        return None
+    if kind == 'semesters':
+        conn.execute("UPDATE courses SET deleted_at = ? WHERE semester_id = ? AND deleted_at IS NULL",
+                     (deleted_at, row_id))
+    return deleted_at
+
+
+def restore(conn, kind, row_id, undo_window):
+    """
+    Undoes soft_delete() if it happened less than `undo_window` seconds ago.
+    Returns True if the row was restored.
+    """
+    cutoff = storage.now_epoch() - undo_window
+    row = conn.execute(f"SELECT deleted_at FROM {kind} WHERE id = ? AND deleted_at > ?",
+                       (row_id, cutoff)).fetchone()
+    if not row:
+        return False
+    if kind == 'courses':
+        # A course cannot come back without its semester; restore the semester instead.
+        semester = conn.execute("""
+            SELECT 1 FROM courses c JOIN semesters sem ON c.semester_id = sem.id
+            WHERE c.id = ? AND sem.deleted_at IS NOT NULL
+        """, (row_id,)).fetchone()
+        if semester:
+            return False
+    conn.execute(f"UPDATE {kind} SET deleted_at = NULL WHERE id = ?", (row_id,))
+    if kind == 'semesters':
+        conn.execute("UPDATE courses SET deleted_at = NULL WHERE semester_id = ? AND deleted_at = ?",
+                     (row_id, row['deleted_at']))
+    return True
+
+
+def list_deleted(conn, undo_window):
+    """The rows that can still be restored, newest first, with their restore deadline."""
+    cutoff = storage.now_epoch() - undo_window
+    names = {'semesters': 'semester_name', 'courses': 'course_name', 'students': 'student_name'}
+    items = []
+    for kind in KINDS:
+        for row in conn.execute(f"SELECT id, {names[kind]} AS name, deleted_at FROM {kind} WHERE deleted_at > ?",
+                                (cutoff,)).fetchall():
+            items.append({
+                "kind": kind,
+                "id": row['id'],
+                "name": row['name'],
+                "deleted_at": storage.epoch_to_iso(row['deleted_at']),
+                "restorable_until": storage.epoch_to_iso(row['deleted_at'] + undo_window),
+            })
+    items.sort(key=lambda item: item['deleted_at'], reverse=True)
+    return items
+
+
+class TombstonePurger:
+    """
+    Permanently removes soft-deleted rows once their undo window has passed.
+
+    `connect` is a callable returning a new database connection.
+    `is_idle()` (optional) tells the purger whether the server is quiet; each
+    batch waits up to `idle_timeout` seconds for that, then runs anyway so
+    a constantly busy server still gets cleaned up.
+    """
+
+    def __init__(self, connect, undo_window, batch_size=500, interval=60,
+                 is_idle=None, idle_timeout=5):
+        self._connect = connect
+        self._undo_window = undo_window
+        self._batch_size = batch_size
+        self._interval = interval
+        self._is_idle = is_idle
+        self._idle_timeout = idle_timeout
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='arise-tombstone-purger', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        if self._thread:
+            self._thread.join()
+
+    def _run(self):
+        while not self._stopping.wait(self._interval):
+            try:
+                self.purge_expired()
+            except Exception as e:
+                # Most likely the database was busy; the next round picks up where this one stopped.
+                print(f"Purging deleted rows failed, will retry: {e}")
+
+    def purge_expired(self):
+        """Purges every row whose undo window has passed. Returns how many were purged."""
+        cutoff = storage.now_epoch() - self._undo_window
+        purged = 0
+        for kind in KINDS:
+            conn = self._connect()
+            try:
+                ids = [row['id'] for row in conn.execute(
+                    f"SELECT id FROM {kind} WHERE deleted_at <= ?", (cutoff,)).fetchall()]
+            finally:
+                conn.close()
+            for row_id in ids:
+                if self._stopping.is_set():
+                    return purged
+                getattr(self, f'_purge_{kind}')(row_id)
+                purged += 1
+        return purged
+
+    # -- One row and its dependants --------------------------------
+    # Dependants go first, in batches, so the final DELETE has nothing left to cascade.
+
+    def _purge_students(self, student_id):
+        self._delete_batches('attendance_records', "student_id = ?", (student_id,))
+        self._delete_once("DELETE FROM enrollments WHERE student_id = ?", (student_id,))
+        self._delete_once("DELETE FROM notifications WHERE student_id = ?", (student_id,))
+        self._delete_once("DELETE FROM attendance_history WHERE student_id = ?", (student_id,))
+        self._delete_once("DELETE FROM students WHERE id = ? AND deleted_at IS NOT NULL", (student_id,))
+
+    def _purge_courses(self, course_id):
+        self._delete_batches('attendance_records',
+                             "session_id IN (SELECT id FROM sessions WHERE course_id = ?)", (course_id,))
+        self._delete_batches('sessions', "course_id = ?", (course_id,))
+        self._delete_once("DELETE FROM enrollments WHERE course_id = ?", (course_id,))
+        self._delete_once("DELETE FROM attendance_history WHERE course_id = ?", (course_id,))
+        self._delete_once("DELETE FROM courses WHERE id = ? AND deleted_at IS NOT NULL", (course_id,))
+
+    def _purge_semesters(self, semester_id):
+        conn = self._connect()
+        try:
+            course_ids = [row['id'] for row in conn.execute(
+                "SELECT id FROM courses WHERE semester_id = ?", (semester_id,)).fetchall()]
+        finally:
+            conn.close()
+        for course_id in course_ids:
+            self._purge_courses(course_id)
+        self._delete_once("DELETE FROM semesters WHERE id = ? AND deleted_at IS NOT NULL", (semester_id,))
+
+    # -- Batching --------------------------------------------------
+
+    def _delete_batches(self, table, where, params):
+        """Deletes the matching rows of `table` at most batch_size at a time, one transaction each."""
+        while not self._stopping.is_set():
+            deleted = self._delete_once(f"""
+                DELETE FROM {table} WHERE id IN (
+                    SELECT id FROM {table} WHERE {where} LIMIT ?)
+            """, tuple(params) + (self._batch_size,))
+            if deleted < self._batch_size:
+                return
+
+    def _delete_once(self, sql, params):
+        self._wait_for_idle()
+        if self._stopping.is_set():
+            # Never finish a row whose dependants were left half purged; the next run will.
+            return 0
+        conn = self._connect()
+        try:
+            cursor = conn.execute(sql, params)
+            conn.commit()
+            return cursor.rowcount
+        finally:
+            conn.close()
+
+    def _wait_for_idle(self):
+        if self._is_idle is None:
+            return
+        deadline = time.monotonic() + self._idle_timeout
+        while not self._is_idle() and time.monotonic() < deadline:
+            if self._stopping.wait(0.05):
+                return